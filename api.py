@@ -1,46 +1,288 @@
-from fastapi import FastAPI
+from fastapi import FastAPI, Query, Request
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import Response, StreamingResponse
+from datetime import date
+from email.utils import formatdate, parsedate_to_datetime
+from typing import Optional
+import asyncio
+import hashlib
 import os
 import json
+import time
+from campaign_history import MAX_PAGE_SIZE, CampaignHistory
+from send_journal import journal_path_for, read_progress
+from live_metrics import (
+    PROGRESS_KEEPALIVE_SECONDS,
+    PROGRESS_TICK_SECONDS,
+    SSE_KEEPALIVE,
+    SSE_RETRY,
+    STALE_AFTER_SECONDS,
+    progress_event,
+    prometheus_text,
+    read_metrics,
+    sse_frame,
+)
 
 app = FastAPI(
     title="Email Campaign API",
     description="API to query campaign information and submissions.",
-    version="1.1.0"
+    version="1.4.0"
 )
 
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
 COUNTER_FILE = os.path.join(BASE_DIR, 'contador', 'contador.txt')
 CAMPAIGNS_HISTORY_FILE = os.path.join(BASE_DIR, 'campaigns.json')
+CAMPAIGNS_DB = os.path.join(BASE_DIR, 'contador', 'campanas.db')
+METRICS_FILE = os.path.join(BASE_DIR, 'contador', 'metricas.json')
+
+# Minimum seconds between stat() checks of a cached file; polls in between are served from memory
+STAT_INTERVAL_SECONDS = 0.5
+
+PROMETHEUS_MEDIA_TYPE = "text/plain; version=0.0.4; charset=utf-8"
 
 def read_total_sent_counter() -> int:
-    """Reads the current number from the global submission counter."""
-    try:
-        with open(COUNTER_FILE, 'r') as f:
-            content = f.read().strip()
-            return int(content) if content else 0
-    except (FileNotFoundError, ValueError):
-        return 0
-
-def read_campaigns_history() -> list:
-    """Reads the campaign history from the JSON file."""
+    """Reads the global submission counter, including rows still in the send journal."""
+    return read_progress(COUNTER_FILE)
+
+_campaign_history = None
+
+def campaign_history() -> CampaignHistory:
+    """The campaign history store, created (importing campaigns.json once) on first use."""
+    global _campaign_history
+    if _campaign_history is None:
+        _campaign_history = CampaignHistory(CAMPAIGNS_DB, CAMPAIGNS_HISTORY_FILE)
+    return _campaign_history
+
+def file_signature(path):
+    """(mtime, size) of a file, or None if it does not exist."""
     try:
-        with open(CAMPAIGNS_HISTORY_FILE, 'r') as f:
-            return json.load(f)
-    except (FileNotFoundError, json.JSONDecodeError):
-        return []
+        stat = os.stat(path)
+    except FileNotFoundError:
+        return None
+    return stat.st_mtime_ns, stat.st_size
+
+class CachedFile:
+    """
+    Response body built from one or more files, rebuilt only when their
+    mtime/size change (checked at most every STAT_INTERVAL_SECONDS).
+
+    `load` reads and parses the files (run in the threadpool so it never blocks
+    the event loop) and `render` turns the result into the response bytes. The
+    ETag is derived from the file signatures, so it changes exactly when the
+    body may change. `volatile`, if given, adds a time-dependent part to the
+    signature (e.g. a status that expires).
+    """
+
+    def __init__(self, paths, load, render, volatile=None):
+        self.paths = paths
+        self.load = load
+        self.render = render
+        self.volatile = volatile
+        self.signature = object()
+        self.body = b""
+        self.etag = None
+        self.last_modified = None
+        self._checked = 0.0
+        self._lock = asyncio.Lock()
+
+    def _current_signature(self):
+        signature = tuple(file_signature(path) for path in self.paths)
+        if self.volatile:
+            signature += (self.volatile(signature),)
+        return signature
+
+    async def refresh(self):
+        now = time.monotonic()
+        if now - self._checked < STAT_INTERVAL_SECONDS:
+            return self
+        async with self._lock:
+            if time.monotonic() - self._checked < STAT_INTERVAL_SECONDS:
+                return self
+            signature = self._current_signature()
+            if signature != self.signature:
+                self.body = await run_in_threadpool(lambda: self.render(self.load()))
+                self.signature = signature
+                self.etag = '"' + hashlib.sha1(repr(signature).encode()).hexdigest() + '"'
+                mtimes = [entry[0] for entry in signature[:len(self.paths)] if entry]
+                self.last_modified = formatdate(max(mtimes) / 1e9, usegmt=True) if mtimes else None
+            self._checked = time.monotonic()
+        return self
+
+    def not_modified(self, request):
+        if_none_match = request.headers.get("if-none-match")
+        if if_none_match is not None:
+            return self.etag in [tag.strip().removeprefix("W/") for tag in if_none_match.split(",")] or if_none_match.strip() == "*"
+        if_modified_since = request.headers.get("if-modified-since")
+        if if_modified_since and self.last_modified:
+            try:
+                return parsedate_to_datetime(self.last_modified) <= parsedate_to_datetime(if_modified_since)
+            except (TypeError, ValueError):
+                return False
+        return False
+
+    async def respond(self, request, media_type="application/json"):
+        """Cached body with ETag/Last-Modified, or 304 if the client already has it."""
+        await self.refresh()
+        headers = {"ETag": self.etag, "Cache-Control": "no-cache"}
+        if self.last_modified:
+            headers["Last-Modified"] = self.last_modified
+        if self.not_modified(request):
+            return Response(status_code=304, headers=headers)
+        return Response(content=self.body, media_type=media_type, headers=headers)
+
+def json_bytes(value):
+    return json.dumps(value, ensure_ascii=False).encode("utf-8")
+
+def metrics_stale(signature):
+    """True once the sender has stopped refreshing the metrics file (see read_metrics)."""
+    stat = signature[0]
+    return stat is not None and time.time() - stat[0] / 1e9 > STALE_AFTER_SECONDS
+
+total_sent_cache = CachedFile(
+    [COUNTER_FILE, journal_path_for(COUNTER_FILE)],
+    read_total_sent_counter,
+    lambda total: json_bytes({"total_emails_sent": total}),
+)
+live_metrics_cache = CachedFile(
+    [METRICS_FILE],
+    lambda: read_metrics(METRICS_FILE),
+    lambda snapshot: json_bytes(snapshot if snapshot is not None else {"estado": "sin_datos"}),
+    volatile=metrics_stale,
+)
+prometheus_cache = CachedFile(
+    [METRICS_FILE],
+    lambda: read_metrics(METRICS_FILE),
+    lambda snapshot: prometheus_text(snapshot).encode("utf-8"),
+    volatile=metrics_stale,
+)
+
+class ProgressBroadcaster:
+    """
+    Fans the sender's progress out to every connected SSE client.
+
+    A single background task (running only while someone is subscribed) checks
+    the metrics file once per PROGRESS_TICK_SECONDS and, when it changed, encodes
+    one event that all clients share. Clients always get the latest event, so a
+    slow client skips intermediate ones instead of queueing them, and however
+    fast the sender goes or however many viewers there are, each client receives
+    at most one event per tick.
+    """
+
+    def __init__(self, cache, tick=PROGRESS_TICK_SECONDS):
+        self.cache = cache
+        self.tick = tick
+        self.event_id = 0
+        self.frame = b""
+        self.subscribers = 0
+        self._body = None
+        self._task = None
+        self._changed = asyncio.Condition()
+
+    async def _run(self):
+        try:
+            while self.subscribers:
+                await self.cache.refresh()
+                if self.cache.body != self._body:
+                    self._body = self.cache.body
+                    async with self._changed:
+                        self.event_id += 1
+                        self.frame = sse_frame(self.event_id, json.loads(self._body))
+                        self._changed.notify_all()
+                await asyncio.sleep(self.tick)
+        finally:
+            self._task = None
+
+    async def stream(self):
+        self.subscribers += 1
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+        try:
+            yield SSE_RETRY
+            seen = 0
+            while True:
+                async with self._changed:
+                    if self.event_id == seen:
+                        try:
+                            await asyncio.wait_for(self._changed.wait(), PROGRESS_KEEPALIVE_SECONDS)
+                        except asyncio.TimeoutError:
+                            pass
+                    frame, current = self.frame, self.event_id
+                if current != seen:
+                    seen = current
+                    yield frame
+                else:
+                    yield SSE_KEEPALIVE
+        finally:
+            self.subscribers -= 1
+
+progress_cache = CachedFile(
+    [METRICS_FILE],
+    lambda: read_metrics(METRICS_FILE),
+    lambda snapshot: json_bytes(progress_event(snapshot)),
+    volatile=metrics_stale,
+)
+progress_broadcaster = ProgressBroadcaster(progress_cache)
 
 @app.get("/api/campaigns", tags=["Campaigns"])
-def get_campaigns_history():
+async def get_campaigns_history(
+    request: Request,
+    page: int = Query(1, ge=1),
+    per_page: int = Query(50, ge=1, le=MAX_PAGE_SIZE),
+    name: Optional[str] = Query(None, description="Case-insensitive substring of the campaign name."),
+    date_from: Optional[date] = Query(None, description="First start date included (YYYY-MM-DD)."),
+    date_to: Optional[date] = Query(None, description="Last start date included (YYYY-MM-DD)."),
+):
     """
-    Gets the list of historical campaigns from the campaigns.json file.
-    This data is maintained manually.
+    Gets one page of the campaign history, newest first. Every run of sender.py
+    is recorded automatically (template, list, start/end, counts, throughput).
+    The total number of matching campaigns is returned in X-Total-Count.
     """
-    return read_campaigns_history()
+    history = await run_in_threadpool(campaign_history)
+    signature = (file_signature(history.path), page, per_page, name, date_from, date_to)
+    etag = '"' + hashlib.sha1(repr(signature).encode()).hexdigest() + '"'
+    if etag in [tag.strip().removeprefix("W/") for tag in request.headers.get("if-none-match", "").split(",")]:
+        return Response(status_code=304, headers={"ETag": etag, "Cache-Control": "no-cache"})
+    records, total = await run_in_threadpool(
+        history.query, page=page, per_page=per_page, name=name, date_from=date_from, date_to=date_to)
+    return Response(
+        content=json_bytes(records),
+        media_type="application/json",
+        headers={"ETag": etag, "Cache-Control": "no-cache", "X-Total-Count": str(total)},
+    )
 
 @app.get("/api/sent/total", tags=["Counter"])
-def get_total_sent():
+async def get_total_sent(request: Request):
     """
     Gets the total number of emails sent by the application (global counter).
     """
-    total_sent = read_total_sent_counter()
-    return {"total_emails_sent": total_sent}
\ No newline at end of file
+    return await total_sent_cache.respond(request)
+
+@app.get("/api/sent/live", tags=["Counter"])
+async def get_live_metrics(request: Request):
+    """
+    Gets the live metrics published by the running (or last) sender: sent and
+    failed counts, current rate, SMTP latency histogram, reconnects, queue
+    depth and ETA. `estado` is "enviando", "finalizado" or "interrumpido".
+    """
+    return await live_metrics_cache.respond(request)
+
+@app.get("/metrics", tags=["Counter"])
+async def get_prometheus_metrics(request: Request):
+    """
+    Exposes the same live metrics in Prometheus text format.
+    """
+    return await prometheus_cache.respond(request, media_type=PROMETHEUS_MEDIA_TYPE)
+
+@app.get("/api/sent/stream", tags=["Counter"])
+async def stream_progress():
+    """
+    Server-Sent Events stream of the running sender's progress. Each `progreso`
+    event carries sent/failed counts, current rate, processed rows and ETA; events
+    are coalesced to at most one per second and a keepalive comment is sent
+    every 15 seconds while nothing changes.
+    """
+    return StreamingResponse(
+        progress_broadcaster.stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
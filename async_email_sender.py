@@ -0,0 +1,223 @@
+import asyncio
+import logging
+import re
+import smtplib
+import ssl
+
+from email_sender import build_message, mail_options, remember_extensions, smtp_error_code
+
+# Líneas que empiezan por "." se duplican (dot-stuffing, RFC 5321 4.5.2)
+LEADING_DOT = re.compile(rb"^\.", re.MULTILINE)
+LINE_ENDINGS = re.compile(r"\r\n|\r|\n")
+
+
+class AsyncEmailSender:
+    """
+    Variante asyncio de EmailSender: varias sesiones SMTP pueden convivir en un
+    mismo event loop. Si el servidor anuncia PIPELINING, MAIL FROM, RCPT TO y
+    DATA se envían juntos y se leen las tres respuestas de una vez, ahorrando
+    dos viajes de ida y vuelta por correo.
+    """
+
+    def __init__(self, smtp_host, smtp_port, smtp_user, smtp_password, email_from, timeout=10):
+        self.smtp_host = smtp_host
+        self.smtp_port = int(smtp_port)
+        self.smtp_user = smtp_user
+        self.smtp_password = smtp_password
+        self.email_from = email_from
+        self.timeout = timeout
+        self.reader = None
+        self.writer = None
+        self.extensions = {}
+        self.last_error_code = None
+        self.last_error = None
+        # Reconexiones automáticas tras una desconexión del servidor
+        self.reconnects = 0
+
+    @property
+    def pipelining(self):
+        return "pipelining" in self.extensions
+
+    @property
+    def is_connected(self):
+        """False si no hay sesión abierta (p. ej. falló la reconexión tras una desconexión)."""
+        return self.writer is not None
+
+    async def _read_reply(self):
+        """Lee una respuesta SMTP (posiblemente multilínea) y devuelve (código, texto)."""
+        lines = []
+        while True:
+            line = await asyncio.wait_for(self.reader.readline(), self.timeout)
+            if not line:
+                raise smtplib.SMTPServerDisconnected("Conexión cerrada por el servidor")
+            line = line.decode("utf-8", "replace").rstrip("\r\n")
+            lines.append(line[4:])
+            if len(line) < 4 or line[3] != "-":
+                try:
+                    code = int(line[:3])
+                except ValueError:
+                    raise smtplib.SMTPResponseException(-1, line)
+                return code, "\n".join(lines)
+
+    async def _command(self, command):
+        self.writer.write(command.encode("utf-8") + b"\r\n")
+        await self.writer.drain()
+        return await self._read_reply()
+
+    async def _expect(self, command, expected):
+        code, text = await self._command(command)
+        if code not in expected:
+            raise smtplib.SMTPResponseException(code, text)
+        return text
+
+    async def _ehlo(self):
+        text = await self._expect("EHLO localhost", (250,))
+        self.extensions = {}
+        for line in text.split("\n")[1:]:
+            keyword, _, params = line.partition(" ")
+            self.extensions[keyword.lower()] = params
+
+    async def _login(self):
+        methods = self.extensions.get("auth", "").upper().split()
+        if "PLAIN" in methods or not methods:
+            token = f"\0{self.smtp_user}\0{self.smtp_password}"
+            await self._expect(f"AUTH PLAIN {smtplib.encode_base64(token.encode('utf-8'), eol='')}", (235,))
+        else:
+            await self._expect("AUTH LOGIN", (334,))
+            await self._expect(smtplib.encode_base64(self.smtp_user.encode("utf-8"), eol=""), (334,))
+            await self._expect(smtplib.encode_base64(self.smtp_password.encode("utf-8"), eol=""), (235,))
+
+    async def connect(self):
+        """Establece la conexión con el servidor SMTP."""
+        try:
+            logging.info(f"Conectando al servidor SMTP {self.smtp_host} (asyncio)...")
+            self.reader, self.writer = await asyncio.wait_for(
+                asyncio.open_connection(self.smtp_host, self.smtp_port), self.timeout
+            )
+            code, text = await self._read_reply()
+            if code != 220:
+                raise smtplib.SMTPConnectError(code, text)
+            await self._ehlo()
+            await self._expect("STARTTLS", (220,))
+            await self.writer.start_tls(ssl._create_stdlib_context(), server_hostname=self.smtp_host)
+            await self._ehlo()
+            await self._login()
+            remember_extensions(self.smtp_host, self.smtp_port, self.extensions)
+            logging.info(f"✅ Conexión SMTP establecida (PIPELINING: {'sí' if self.pipelining else 'no'}).")
+            return True
+        except Exception as e:
+            logging.error(f"❌ Error al conectar con el servidor SMTP: {e}")
+            self.last_error = e
+            await self._close()
+            return False
+
+    async def _close(self):
+        if self.writer:
+            self.writer.close()
+            try:
+                await self.writer.wait_closed()
+            except Exception:
+                pass
+        self.reader = None
+        self.writer = None
+
+    async def disconnect(self):
+        """Cierra la conexión con el servidor SMTP."""
+        if self.writer:
+            try:
+                await self._command("QUIT")
+                logging.info("Conexión SMTP cerrada.")
+            except Exception as e:
+                logging.error(f"Error al cerrar la conexión SMTP: {e}")
+            finally:
+                await self._close()
+
+    async def _transaction(self, to_email, message):
+        options = "".join(f" {option}" for option in mail_options(message, self.extensions, self.smtp_host))
+        commands = [f"MAIL FROM:<{self.email_from}>{options}", f"RCPT TO:<{to_email}>", "DATA"]
+        if self.pipelining:
+            self.writer.write("".join(f"{command}\r\n" for command in commands).encode("utf-8"))
+            await self.writer.drain()
+            replies = [await self._read_reply() for _ in commands]
+        else:
+            replies = []
+            for command in commands:
+                replies.append(await self._command(command))
+                if replies[-1][0] >= 400:
+                    break
+
+        (mail_code, mail_text), *rest = replies
+        failure = None
+        if mail_code != 250:
+            failure = smtplib.SMTPSenderRefused(mail_code, mail_text, self.email_from)
+        elif rest and rest[0][0] not in (250, 251):
+            failure = smtplib.SMTPRecipientsRefused({to_email: rest[0]})
+
+        data_code = replies[2][0] if len(replies) == 3 else None
+        if failure:
+            if data_code == 354:
+                # El servidor aceptó DATA pese al error: se cierra el mensaje vacío.
+                self.writer.write(b".\r\n")
+                await self.writer.drain()
+                await self._read_reply()
+            if smtp_error_code(failure) != 421:
+                await self._command("RSET")
+            raise failure
+        if data_code != 354:
+            raise smtplib.SMTPDataError(*replies[2])
+
+        if isinstance(message, str):
+            message = LINE_ENDINGS.sub("\r\n", message).encode("utf-8")
+        payload = LEADING_DOT.sub(b"..", message)
+        if not payload.endswith(b"\r\n"):
+            payload += b"\r\n"
+        self.writer.write(payload + b".\r\n")
+        await self.writer.drain()
+        code, text = await self._read_reply()
+        if code != 250:
+            raise smtplib.SMTPDataError(code, text)
+
+    async def send_email(self, to_email, subject, body):
+        """
+        Envía un correo utilizando la conexión existente.
+        Si falla, el código SMTP de la respuesta queda en `last_error_code`.
+        """
+        message = build_message(self.email_from, to_email, subject, body, eight_bit="8bitmime" in self.extensions)
+        return await self.send_message(to_email, message)
+
+    async def send_message(self, to_email, message):
+        """
+        Envía un mensaje ya serializado (str o bytes, p. ej. de MessageBuilder).
+        Si falla, el código SMTP de la respuesta queda en `last_error_code`.
+        """
+        self.last_error_code = None
+        self.last_error = None
+        if not self.writer:
+            logging.error("No hay conexión SMTP activa. No se puede enviar el correo.")
+            self.last_error = smtplib.SMTPServerDisconnected("Sin conexión SMTP activa")
+            return False
+
+        try:
+            await self._transaction(to_email, message)
+            return True
+        except (smtplib.SMTPServerDisconnected, ConnectionError, asyncio.TimeoutError):
+            logging.error("El servidor SMTP se desconectó. Intentando reconectar...")
+            await self._close()
+            # Intentar reconectar una vez
+            if await self.connect():
+                self.reconnects += 1
+                try:
+                    await self._transaction(to_email, message)
+                    return True
+                except Exception as e:
+                    logging.error(f"Error al enviar correo a {to_email} tras reconexión: {e}")
+                    self.last_error_code = smtp_error_code(e)
+                    self.last_error = e
+                    return False
+            self.last_error = smtplib.SMTPServerDisconnected("No se pudo reconectar")
+            return False
+        except Exception as e:
+            logging.error(f"Error al enviar correo a {to_email}: {e}")
+            self.last_error_code = smtp_error_code(e)
+            self.last_error = e
+            return False
@@ -0,0 +1,142 @@
+"""
+Servidor SMTP local para pruebas de rendimiento, sin entregar nada.
+
+Acepta EHLO, STARTTLS (certificado autofirmado generado con openssl), AUTH
+PLAIN/LOGIN, PIPELINING, MAIL/RCPT/DATA, RSET y QUIT, y puede inyectar latencia
+por respuesta, respuestas 421 de throttling y desconexiones aleatorias.
+
+    python benchmarks/fake_smtp.py --puerto 2525 --latencia 0.005 --throttle 0.01 --desconexion 0.001
+"""
+import argparse
+import asyncio
+import os
+import random
+import ssl
+import subprocess
+import tempfile
+
+
+def make_tls_context(directory):
+    """Contexto TLS de servidor con un certificado autofirmado recién generado."""
+    cert = os.path.join(directory, "cert.pem")
+    key = os.path.join(directory, "key.pem")
+    subprocess.run(
+        ["openssl", "req", "-x509", "-newkey", "rsa:2048", "-nodes", "-days", "1",
+         "-subj", "/CN=localhost", "-keyout", key, "-out", cert],
+        check=True, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+    context = ssl.create_default_context(ssl.Purpose.CLIENT_AUTH)
+    context.load_cert_chain(cert, key)
+    return context
+
+
+class FakeSMTPServer:
+    def __init__(self, latency=0.0, throttle=0.0, disconnect=0.0, tls_context=None, eight_bit_mime=True):
+        self.latency = latency
+        self.throttle = throttle
+        self.disconnect = disconnect
+        self.tls_context = tls_context
+        self.eight_bit_mime = eight_bit_mime
+        self.accepted = 0
+        self.throttled = 0
+        self.dropped = 0
+
+    async def handle(self, reader, writer):
+        async def reply(*lines):
+            if self.latency:
+                await asyncio.sleep(self.latency)
+            writer.write("".join(f"{line}\r\n" for line in lines).encode("ascii"))
+            await writer.drain()
+
+        tls = False
+        try:
+            await reply("220 fake ESMTP listo")
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                command = line.decode("utf-8", "replace").strip()
+                verb = command[:4].upper()
+                if verb in ("EHLO", "HELO"):
+                    extensions = ["PIPELINING", "SMTPUTF8", "SIZE 100000000", "AUTH PLAIN LOGIN"]
+                    if self.eight_bit_mime:
+                        extensions.insert(1, "8BITMIME")
+                    if self.tls_context and not tls:
+                        extensions.append("STARTTLS")
+                    await reply("250-fake", *[f"250-{ext}" for ext in extensions[:-1]], f"250 {extensions[-1]}")
+                elif command.upper() == "STARTTLS" and self.tls_context:
+                    await reply("220 listo para TLS")
+                    await writer.start_tls(self.tls_context)
+                    tls = True
+                elif verb == "AUTH":
+                    parts = command.split()
+                    if parts[1].upper() == "LOGIN":
+                        await reply("334 VXNlcm5hbWU6")
+                        await reader.readline()
+                        await reply("334 UGFzc3dvcmQ6")
+                        await reader.readline()
+                    elif len(parts) == 2:
+                        await reply("334 ")
+                        await reader.readline()
+                    await reply("235 autenticado")
+                elif verb == "MAIL":
+                    if self.disconnect and random.random() < self.disconnect:
+                        self.dropped += 1
+                        break
+                    if self.throttle and random.random() < self.throttle:
+                        self.throttled += 1
+                        await reply("421 4.7.0 demasiados mensajes, prueba mas tarde")
+                    else:
+                        await reply("250 ok")
+                elif verb == "RCPT":
+                    await reply("250 ok")
+                elif verb == "DATA":
+                    await reply("354 adelante")
+                    while True:
+                        data = await reader.readline()
+                        if data in (b".\r\n", b""):
+                            break
+                    self.accepted += 1
+                    await reply(f"250 encolado {self.accepted}")
+                elif verb in ("RSET", "NOOP"):
+                    await reply("250 ok")
+                elif verb == "QUIT":
+                    await reply("221 adios")
+                    break
+                else:
+                    await reply("500 comando no reconocido")
+        except (ConnectionError, ssl.SSLError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    async def serve(self, host, port):
+        server = await asyncio.start_server(self.handle, host, port)
+        async with server:
+            await server.serve_forever()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Servidor SMTP falso para benchmarks.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--puerto", type=int, default=2525)
+    parser.add_argument("--latencia", type=float, default=0.0, help="Segundos de espera antes de cada respuesta.")
+    parser.add_argument("--throttle", type=float, default=0.0, help="Probabilidad de responder 421 a MAIL FROM.")
+    parser.add_argument("--desconexion", type=float, default=0.0, help="Probabilidad de cortar la conexión en MAIL FROM.")
+    parser.add_argument("--sin-tls", action="store_true", help="No anunciar STARTTLS.")
+    parser.add_argument("--sin-8bitmime", action="store_true", help="No anunciar 8BITMIME.")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        tls_context = None if args.sin_tls else make_tls_context(directory)
+        server = FakeSMTPServer(args.latencia, args.throttle, args.desconexion, tls_context,
+                                eight_bit_mime=not args.sin_8bitmime)
+        print(f"Servidor SMTP falso en {args.host}:{args.puerto}", flush=True)
+        try:
+            asyncio.run(server.serve(args.host, args.puerto))
+        except KeyboardInterrupt:
+            pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,268 @@
+"""
+Benchmark de envío contra el servidor SMTP falso (benchmarks/fake_smtp.py).
+
+Genera listas de destinatarios del tamaño indicado, ejecuta sender.run_sender()
+en un proceso aparte sobre cada una y mide mensajes por segundo, latencia por
+mensaje (p50/p95/p99 de cada transacción SMTP), bytes por mensaje, CPU y memoria
+máxima del proceso del sender. Los resultados se guardan en JSON en benchmarks/resultados/ para poder
+comparar versiones:
+
+    python benchmarks/run_benchmark.py --filas 1000,10000,100000 --conexiones 4 --latencia 0.005
+    python benchmarks/run_benchmark.py --filas 10000 --motor asyncio --comparar benchmarks/resultados/anterior.json
+"""
+import argparse
+import csv
+import json
+import os
+import platform
+import resource
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+REPO_DIR = os.path.dirname(BENCH_DIR)
+RESULTS_DIR = os.path.join(BENCH_DIR, "resultados")
+CHILD_RESULT = "resultado.json"
+
+DEFAULT_TEMPLATE = """<html><body>
+<h1>Hola {{names}}</h1>
+<p>Este es un mensaje de prueba para {{ciudad|Lima}}. Gracias por leernos.</p>
+</body></html>
+"""
+
+# Métricas que se comparan con --comparar (y si "más" es mejor)
+COMPARED = {"mensajes_por_segundo": True, "latencia_p50_ms": False, "latencia_p95_ms": False,
+            "latencia_p99_ms": False, "bytes_por_mensaje": False, "cpu_segundos": False, "rss_max_mb": False}
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def wait_for_port(port, timeout=15):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            with socket.create_connection(("127.0.0.1", port), timeout=1):
+                return True
+        except OSError:
+            time.sleep(0.1)
+    return False
+
+
+def percentile(ordered, fraction):
+    if not ordered:
+        return 0.0
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+def git_version():
+    try:
+        return subprocess.run(["git", "describe", "--always", "--dirty"], cwd=REPO_DIR,
+                              capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "desconocida"
+
+
+def write_list(path, rows, domains):
+    with open(path, "w", encoding="utf-8", newline="") as file:
+        writer = csv.writer(file)
+        writer.writerow(["email", "names", "ciudad"])
+        for number in range(rows):
+            writer.writerow([f"usuario{number}@dominio{number % domains}.com", f"Nombre {number}", "Lima"])
+
+
+def prepare_workdir(rows, args, template):
+    workdir = tempfile.mkdtemp(prefix="bench_envio_")
+    write_list(os.path.join(workdir, "lista.csv"), rows, args.dominios)
+    with open(os.path.join(workdir, "plantilla.html"), "w", encoding="utf-8") as file:
+        file.write(template)
+    config = {
+        "excel_file": "lista.csv",
+        "body_file": "plantilla.html",
+        "subject": "Benchmark {{names}}",
+        "delay_segundos": 0,
+        "conexiones_smtp": args.conexiones,
+        "motor_envio": args.motor,
+        "procesos_render": args.procesos_render,
+        "reintentos": {"espera_base_segundos": 0.5, "espera_max_segundos": 2},
+        # Cada directorio es nuevo y aún no tiene las extensiones del servidor registradas
+        "codificacion_8bit": not args.sin_8bitmime,
+    }
+    with open(os.path.join(workdir, "config.json"), "w", encoding="utf-8") as file:
+        json.dump(config, file, indent=4)
+    return workdir
+
+
+def run_child(workdir, port, show_log):
+    """Ejecuta el sender en un proceso aparte dentro de `workdir` y devuelve sus métricas."""
+    env = dict(os.environ, SMTP_HOST="127.0.0.1", SMTP_PORT=str(port), SMTP_USER="benchmark",
+               SMTP_PASSWORD="benchmark", SMTP_FROM="benchmark@ejemplo.com")
+    command = [sys.executable, os.path.abspath(__file__), "--hijo"] + (["--log"] if show_log else [])
+    subprocess.run(command, cwd=workdir, env=env, check=True)
+    with open(os.path.join(workdir, CHILD_RESULT), "r", encoding="utf-8") as file:
+        return json.load(file)
+
+
+def child_main(show_log):
+    """Proceso hijo: mide cada transacción SMTP del sender y guarda el resumen."""
+    sys.path.insert(0, REPO_DIR)
+    import logging
+    from async_email_sender import AsyncEmailSender
+    from email_sender import EmailSender
+
+    if not show_log:
+        # Los fallos inyectados se cuentan en el resultado; sin --log no se muestran uno a uno
+        logging.disable(logging.ERROR)
+    latencies = []
+    outcomes = {"enviados": 0, "fallidos": 0, "bytes": 0}
+
+    def timed(method):
+        def wrapper(self, to_email, message):
+            start = time.perf_counter()
+            sent = method(self, to_email, message)
+            latencies.append(time.perf_counter() - start)
+            outcomes["enviados" if sent else "fallidos"] += 1
+            outcomes["bytes"] += len(message)
+            return sent
+        return wrapper
+
+    def timed_async(method):
+        async def wrapper(self, to_email, message):
+            start = time.perf_counter()
+            sent = await method(self, to_email, message)
+            latencies.append(time.perf_counter() - start)
+            outcomes["enviados" if sent else "fallidos"] += 1
+            outcomes["bytes"] += len(message)
+            return sent
+        return wrapper
+
+    EmailSender.send_message = timed(EmailSender.send_message)
+    AsyncEmailSender.send_message = timed_async(AsyncEmailSender.send_message)
+
+    import sender
+    start = time.perf_counter()
+    sender.run_sender()
+    elapsed = time.perf_counter() - start
+
+    usage = resource.getrusage(resource.RUSAGE_SELF)
+    latencies.sort()
+    result = {
+        "enviados": outcomes["enviados"],
+        "fallidos": outcomes["fallidos"],
+        "segundos": round(elapsed, 3),
+        "mensajes_por_segundo": round(outcomes["enviados"] / elapsed, 1) if elapsed else 0.0,
+        "latencia_p50_ms": round(1000 * percentile(latencies, 0.50), 3),
+        "latencia_p95_ms": round(1000 * percentile(latencies, 0.95), 3),
+        "latencia_p99_ms": round(1000 * percentile(latencies, 0.99), 3),
+        "bytes_por_mensaje": round(outcomes["bytes"] / len(latencies)) if latencies else 0,
+        "cpu_segundos": round(usage.ru_utime + usage.ru_stime, 3),
+        # ru_maxrss está en KB en Linux y en bytes en macOS
+        "rss_max_mb": round(usage.ru_maxrss / (1024 * 1024 if sys.platform == "darwin" else 1024), 1),
+    }
+    with open(CHILD_RESULT, "w", encoding="utf-8") as file:
+        json.dump(result, file)
+
+
+def compare(results, previous_path):
+    with open(previous_path, "r", encoding="utf-8") as file:
+        previous = {entry["filas"]: entry for entry in json.load(file)["resultados"]}
+    print(f"\nComparación con {previous_path}:")
+    for entry in results:
+        old = previous.get(entry["filas"])
+        if not old:
+            continue
+        changes = []
+        for key, higher_is_better in COMPARED.items():
+            if old.get(key):
+                change = 100 * (entry[key] - old[key]) / old[key]
+                worse = change < 0 if higher_is_better else change > 0
+                mark = " (peor)" if worse and abs(change) >= 5 else ""
+                changes.append(f"{key} {change:+.1f}%{mark}")
+        print(f"  {entry['filas']} filas: " + ", ".join(changes))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark del envío contra un servidor SMTP falso.")
+    parser.add_argument("--filas", default="1000,10000", help="Tamaños de lista separados por coma (p. ej. 1000,100000,1000000).")
+    parser.add_argument("--conexiones", type=int, default=4, help="conexiones_smtp del sender.")
+    parser.add_argument("--motor", choices=["smtplib", "asyncio"], default="smtplib")
+    parser.add_argument("--procesos-render", type=int, default=0)
+    parser.add_argument("--dominios", type=int, default=50, help="Dominios distintos en la lista generada.")
+    parser.add_argument("--plantilla", help="Plantilla HTML a usar (por defecto una pequeña de prueba).")
+    parser.add_argument("--latencia", type=float, default=0.0, help="Latencia por respuesta del servidor falso (s).")
+    parser.add_argument("--throttle", type=float, default=0.0, help="Probabilidad de 421 en MAIL FROM.")
+    parser.add_argument("--desconexion", type=float, default=0.0, help="Probabilidad de corte de conexión en MAIL FROM.")
+    parser.add_argument("--sin-8bitmime", action="store_true", help="El servidor falso no anuncia 8BITMIME.")
+    parser.add_argument("--salida", help="Archivo JSON de resultados (por defecto benchmarks/resultados/<fecha>_<versión>.json).")
+    parser.add_argument("--comparar", help="Resultados anteriores con los que comparar.")
+    parser.add_argument("--log", action="store_true", help="Mostrar el log completo del sender.")
+    parser.add_argument("--hijo", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.hijo:
+        child_main(args.log)
+        return
+
+    template = DEFAULT_TEMPLATE
+    if args.plantilla:
+        with open(args.plantilla, "r", encoding="utf-8") as file:
+            template = file.read()
+
+    port = free_port()
+    server = subprocess.Popen([
+        sys.executable, os.path.join(BENCH_DIR, "fake_smtp.py"), "--puerto", str(port),
+        "--latencia", str(args.latencia), "--throttle", str(args.throttle), "--desconexion", str(args.desconexion),
+    ] + (["--sin-8bitmime"] if args.sin_8bitmime else []), stdout=subprocess.DEVNULL)
+    results = []
+    try:
+        if not wait_for_port(port):
+            sys.exit("No arrancó el servidor SMTP falso.")
+        for rows in (int(value) for value in args.filas.split(",")):
+            workdir = prepare_workdir(rows, args, template)
+            try:
+                print(f"Enviando {rows} filas...", flush=True)
+                result = {"filas": rows, **run_child(workdir, port, args.log)}
+            finally:
+                shutil.rmtree(workdir, ignore_errors=True)
+            results.append(result)
+            print(f"  {result['mensajes_por_segundo']} msg/s, p50 {result['latencia_p50_ms']} ms, "
+                  f"p95 {result['latencia_p95_ms']} ms, p99 {result['latencia_p99_ms']} ms, "
+                  f"{result['bytes_por_mensaje']} bytes/msg, "
+                  f"CPU {result['cpu_segundos']} s, RSS máx. {result['rss_max_mb']} MB, "
+                  f"enviados {result['enviados']}, fallidos {result['fallidos']}", flush=True)
+    finally:
+        server.terminate()
+        server.wait()
+
+    version = git_version()
+    report = {
+        "fecha": datetime.now().isoformat(timespec="seconds"),
+        "version": version,
+        "python": platform.python_version(),
+        "plataforma": platform.platform(),
+        "escenario": {key: value for key, value in vars(args).items()
+                      if key not in ("salida", "comparar", "log", "hijo", "filas")},
+        "resultados": results,
+    }
+    output = args.salida
+    if not output:
+        os.makedirs(RESULTS_DIR, exist_ok=True)
+        output = os.path.join(RESULTS_DIR, f"{datetime.now():%Y%m%d_%H%M%S}_{version}.json")
+    with open(output, "w", encoding="utf-8") as file:
+        json.dump(report, file, indent=4, ensure_ascii=False)
+    print(f"Resultados guardados en {output}")
+
+    if args.comparar:
+        compare(results, args.comparar)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,123 @@
+"""
+Benchmark de arranque de los comandos de consola: cuánto tarda cada uno desde que
+se lanza el intérprete hasta que termina, para comandos que no envían nada
+(--help, --reset-counter, --estado). Cada comando se ejecuta varias veces en un
+directorio temporal con una campaña mínima y se informa la mediana y el mínimo:
+
+    python benchmarks/startup_benchmark.py
+    python benchmarks/startup_benchmark.py --repeticiones 20 --importaciones
+    python benchmarks/startup_benchmark.py --comparar benchmarks/resultados/arranque_anterior.json
+"""
+import argparse
+import json
+import os
+import platform
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+from run_benchmark import REPO_DIR, RESULTS_DIR, git_version
+
+COMMANDS = {
+    "python (referencia)": ["-c", "pass"],
+    "console --help": ["console_configurador.py", "--help"],
+    "console --reset-counter": ["console_configurador.py", "--reset-counter"],
+    "console --estado": ["console_configurador.py", "--estado"],
+    "sender --help": ["sender.py", "--help"],
+    "campaign_scheduler --help": ["campaign_scheduler.py", "--help"],
+}
+
+
+def prepare_workdir():
+    workdir = tempfile.mkdtemp(prefix="bench_arranque_")
+    with open(os.path.join(workdir, "lista.csv"), "w", encoding="utf-8") as file:
+        file.write("email,names\nuno@ejemplo.com,Uno\ndos@ejemplo.com,Dos\n")
+    with open(os.path.join(workdir, "plantilla.html"), "w", encoding="utf-8") as file:
+        file.write("<p>Hola {{names}}</p>")
+    with open(os.path.join(workdir, "config.json"), "w", encoding="utf-8") as file:
+        json.dump({"excel_file": "lista.csv", "body_file": "plantilla.html", "subject": "Prueba"}, file)
+    return workdir
+
+
+def command_line(arguments):
+    if arguments[0].endswith(".py"):
+        return [sys.executable, os.path.join(REPO_DIR, arguments[0])] + arguments[1:]
+    return [sys.executable] + arguments
+
+
+def time_command(arguments, workdir, repetitions):
+    times = []
+    for _ in range(repetitions):
+        start = time.perf_counter()
+        subprocess.run(command_line(arguments), cwd=workdir, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, check=True)
+        times.append(time.perf_counter() - start)
+    return {"mediana_ms": round(1000 * statistics.median(times), 1), "minimo_ms": round(1000 * min(times), 1)}
+
+
+def slowest_imports(arguments, workdir, count=8):
+    """Módulos que más tardan en importarse (acumulado), según python -X importtime."""
+    result = subprocess.run([sys.executable, "-X", "importtime"] + command_line(arguments)[1:], cwd=workdir,
+                            stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True)
+    imports = []
+    for line in result.stderr.splitlines():
+        parts = line.split("|")
+        if len(parts) == 3 and parts[1].strip().isdigit():
+            imports.append((int(parts[1]), parts[2].strip()))
+    return [f"{name} {micros / 1000:.1f} ms" for micros, name in sorted(imports, reverse=True)[:count]]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Tiempo de arranque de los comandos de consola.")
+    parser.add_argument("--repeticiones", type=int, default=10)
+    parser.add_argument("--importaciones", action="store_true", help="Mostrar los módulos que más tardan en importarse.")
+    parser.add_argument("--salida", help="Archivo JSON de resultados (por defecto benchmarks/resultados/<fecha>_arranque_<versión>.json).")
+    parser.add_argument("--comparar", help="Resultados anteriores con los que comparar.")
+    args = parser.parse_args()
+
+    workdir = prepare_workdir()
+    results = {}
+    try:
+        for name, arguments in COMMANDS.items():
+            results[name] = time_command(arguments, workdir, args.repeticiones)
+            print(f"{name}: mediana {results[name]['mediana_ms']} ms, mínimo {results[name]['minimo_ms']} ms", flush=True)
+            if args.importaciones and arguments[0].endswith(".py"):
+                for entry in slowest_imports(arguments, workdir):
+                    print(f"    {entry}")
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    version = git_version()
+    report = {
+        "fecha": datetime.now().isoformat(timespec="seconds"),
+        "version": version,
+        "python": platform.python_version(),
+        "plataforma": platform.platform(),
+        "repeticiones": args.repeticiones,
+        "resultados": results,
+    }
+    output = args.salida
+    if not output:
+        os.makedirs(RESULTS_DIR, exist_ok=True)
+        output = os.path.join(RESULTS_DIR, f"{datetime.now():%Y%m%d_%H%M%S}_arranque_{version}.json")
+    with open(output, "w", encoding="utf-8") as file:
+        json.dump(report, file, indent=4, ensure_ascii=False)
+    print(f"Resultados guardados en {output}")
+
+    if args.comparar:
+        with open(args.comparar, "r", encoding="utf-8") as file:
+            previous = json.load(file)["resultados"]
+        print(f"\nComparación con {args.comparar}:")
+        for name, entry in results.items():
+            old = previous.get(name)
+            if old and old.get("mediana_ms"):
+                change = 100 * (entry["mediana_ms"] - old["mediana_ms"]) / old["mediana_ms"]
+                mark = " (peor)" if change >= 5 else ""
+                print(f"  {name}: {old['mediana_ms']} -> {entry['mediana_ms']} ms ({change:+.1f}%){mark}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,167 @@
+import json
+import logging
+import os
+import sqlite3
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+
+HISTORY_FILE = "campanas.db"
+HISTORY_DB = os.path.join("contador", HISTORY_FILE)
+
+# Historial que se mantenía a mano antes de la base de datos; se importa una sola vez
+LEGACY_FILE = "campaigns.json"
+
+STATUS_SENDING = "enviando"
+STATUS_FINISHED = "finalizado"
+STATUS_STOPPED = "detenido"
+STATUS_IMPORTED = "importado"
+
+# Máximo de campañas por página en las consultas
+MAX_PAGE_SIZE = 500
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS campaigns (
+    id INTEGER PRIMARY KEY,
+    campaign_name TEXT NOT NULL,
+    template_file TEXT,
+    list_file TEXT,
+    started_at TEXT NOT NULL,
+    finished_at TEXT,
+    sent_count INTEGER NOT NULL DEFAULT 0,
+    failed_count INTEGER NOT NULL DEFAULT 0,
+    suppressed_count INTEGER NOT NULL DEFAULT 0,
+    skipped_count INTEGER NOT NULL DEFAULT 0,
+    messages_per_second REAL,
+    status TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS campaigns_started ON campaigns (started_at, id);
+CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT);
+"""
+
+COLUMNS = ("id", "campaign_name", "template_file", "list_file", "started_at", "finished_at", "sent_count",
+           "failed_count", "suppressed_count", "skipped_count", "messages_per_second", "status")
+
+
+def history_path_for(counter_file):
+    """Base del historial: junto al contador, como el journal y la cola de reintentos."""
+    return os.path.join(os.path.dirname(counter_file), HISTORY_FILE)
+
+
+def now_iso():
+    return datetime.now().isoformat(timespec="seconds")
+
+
+def as_record(row):
+    """Fila de la base como diccionario, con `submission_date` como en el antiguo campaigns.json."""
+    record = dict(zip(COLUMNS, row))
+    record["submission_date"] = record["started_at"][:10]
+    return record
+
+
+class CampaignHistory:
+    """
+    Historial de campañas en SQLite: cada ejecución de sender.py deja una fila
+    con plantilla, lista, inicio y fin, contadores y correos por segundo.
+
+    Cada operación abre su propia conexión, así que se puede usar desde varios
+    hilos (y el API y el sender pueden abrir la misma base a la vez). Al crear
+    la base se importa una sola vez el campaigns.json que se llevaba a mano.
+    """
+
+    def __init__(self, path=HISTORY_DB, legacy_path=LEGACY_FILE):
+        self.path = path
+        self.legacy_path = legacy_path
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        with self._connect() as db:
+            db.executescript(SCHEMA)
+            self._import_legacy(db)
+
+    @contextmanager
+    def _connect(self):
+        db = sqlite3.connect(self.path, timeout=10)
+        try:
+            with db:
+                yield db
+        finally:
+            db.close()
+
+    def _import_legacy(self, db):
+        # Con el bloqueo tomado antes de mirar, dos procesos que crean la base a la vez no importan dos veces
+        db.execute("BEGIN IMMEDIATE")
+        if db.execute("SELECT 1 FROM meta WHERE key = 'importado_json'").fetchone():
+            return
+        imported = 0
+        # Sin archivo (o ilegible) no se marca como importado: se vuelve a intentar al abrir la base
+        try:
+            with open(self.legacy_path, "r", encoding="utf-8") as file:
+                entries = json.load(file)
+        except FileNotFoundError:
+            return
+        except (OSError, json.JSONDecodeError) as e:
+            logging.warning(f"Historial: no se pudo leer {self.legacy_path}: {e}")
+            return
+        if not isinstance(entries, list):
+            logging.warning(f"Historial: {self.legacy_path} no contiene una lista de campañas.")
+            return
+        for entry in entries:
+            if not isinstance(entry, dict) or not entry.get("campaign_name"):
+                continue
+            db.execute(
+                "INSERT INTO campaigns (campaign_name, started_at, sent_count, status) VALUES (?, ?, ?, ?)",
+                (entry["campaign_name"], str(entry.get("submission_date") or ""), int(entry.get("sent_count") or 0),
+                 STATUS_IMPORTED),
+            )
+            imported += 1
+        db.execute("INSERT INTO meta (key, value) VALUES ('importado_json', ?)", (now_iso(),))
+        if imported:
+            logging.info(f"Historial: importadas {imported} campañas de {self.legacy_path}.")
+
+    def start(self, campaign_name, template_file, list_file):
+        """Registra el inicio de una campaña y devuelve su id."""
+        with self._connect() as db:
+            cursor = db.execute(
+                "INSERT INTO campaigns (campaign_name, template_file, list_file, started_at, status) "
+                "VALUES (?, ?, ?, ?, ?)",
+                (campaign_name, template_file, list_file, now_iso(), STATUS_SENDING),
+            )
+            return cursor.lastrowid
+
+    def finish(self, campaign_id, counts, seconds, stopped=False):
+        """Cierra la campaña con los contadores del envío y su tasa media."""
+        rate = round(counts["enviados"] / seconds, 3) if seconds > 0 else None
+        with self._connect() as db:
+            db.execute(
+                "UPDATE campaigns SET finished_at = ?, sent_count = ?, failed_count = ?, suppressed_count = ?, "
+                "skipped_count = ?, messages_per_second = ?, status = ? WHERE id = ?",
+                (now_iso(), counts["enviados"], counts["fallidos"], counts["suprimidos"], counts["omitidos"], rate,
+                 STATUS_STOPPED if stopped else STATUS_FINISHED, campaign_id),
+            )
+
+    def query(self, page=1, per_page=50, name=None, date_from=None, date_to=None):
+        """
+        Página `page` de campañas, de la más reciente a la más antigua, y el total
+        que cumple los filtros. `name` busca sin distinguir mayúsculas dentro del
+        nombre; `date_from` y `date_to` (fechas, ambas incluidas) filtran por el
+        inicio usando el índice.
+        """
+        page = max(1, page)
+        per_page = min(max(1, per_page), MAX_PAGE_SIZE)
+        conditions, params = [], []
+        if name:
+            escaped = name.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+            conditions.append("campaign_name LIKE ? ESCAPE '\\'")
+            params.append(f"%{escaped}%")
+        if date_from:
+            conditions.append("started_at >= ?")
+            params.append(date_from.isoformat())
+        if date_to:
+            conditions.append("started_at < ?")
+            params.append((date_to + timedelta(days=1)).isoformat())
+        where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+        with self._connect() as db:
+            total = db.execute(f"SELECT COUNT(*) FROM campaigns {where}", params).fetchone()[0]
+            rows = db.execute(
+                f"SELECT {', '.join(COLUMNS)} FROM campaigns {where} ORDER BY started_at DESC, id DESC LIMIT ? OFFSET ?",
+                params + [per_page, (page - 1) * per_page],
+            ).fetchall()
+        return [as_record(row) for row in rows], total
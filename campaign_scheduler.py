@@ -0,0 +1,227 @@
+import argparse
+import asyncio
+import logging
+import os
+import time
+from collections.abc import Mapping
+
+from config_manager import ConfigManager
+from live_metrics import METRICS_FILE, LiveMetrics
+from pipeline import PipelineStats
+from sender import (
+    finish_history,
+    open_backend,
+    open_campaign,
+    run_async_pool,
+    run_thread_pool,
+    start_history,
+)
+
+QUEUE_FILE = "cola_campanas.json"
+
+# Contador, journal, reintentos y métricas de cada campaña: contador/<nombre>/
+COUNTER_DIR = "contador"
+
+
+class CampaignLane:
+    """Una campaña dentro del reparto: sus elementos, su peso y si es urgente."""
+
+    def __init__(self, name, campaign, rows, weight=1, urgent=False):
+        self.name = name
+        self.campaign = campaign
+        self.items = campaign.feed(rows)
+        self.weight = max(1, int(weight))
+        self.urgent = bool(urgent)
+        self.current_weight = 0
+        # Hasta cuándo espera la campaña (reintentos o dominios sin cupo)
+        self.ready_at = 0.0
+        # Segundos desde el inicio hasta que la campaña terminó (para su tasa media)
+        self.seconds = None
+        self.history = None
+        self.history_id = None
+
+
+class CombinedCounts(Mapping):
+    """Suma de los contadores (enviados, fallidos, ...) de todas las campañas."""
+
+    def __init__(self, lanes):
+        self.lanes = lanes
+
+    def __getitem__(self, key):
+        return sum(lane.campaign.counts[key] for lane in self.lanes)
+
+    def __iter__(self):
+        return iter(self.lanes[0].campaign.counts)
+
+    def __len__(self):
+        return len(self.lanes[0].campaign.counts)
+
+
+class CampaignMix:
+    """
+    Intercala los elementos de varias campañas para un solo pool de envío.
+
+    El reparto es un round-robin ponderado suave (como el de las cuentas SMTP):
+    cada campaña recibe una parte de los envíos proporcional a su `peso`. Si hay
+    campañas urgentes con filas listas se reparten solo entre ellas, y las demás
+    usan lo que las urgentes dejen libre (mientras esperan reintentos o cupo de
+    dominio, por ejemplo). Una campaña que espera no frena a las otras.
+
+    Para los workers hace el papel de CampaignRun: cada elemento de la cola lleva
+    su campaña y `stop` detiene todas.
+
+    Cada campaña publica sus métricas en contador/<nombre>/metricas.json y el
+    conjunto en `metrics_path` (el que leen api.py y el panel).
+    """
+
+    def __init__(self, lanes, metrics_path=METRICS_FILE):
+        self.lanes = lanes
+        self.stats = PipelineStats()
+        self.metrics = LiveMetrics(", ".join(lane.name for lane in lanes), CombinedCounts(lanes), metrics_path)
+        self.metrics.track_progress(self.progress)
+        self.metrics.track_queue("reintentos", lambda: sum(lane.campaign.retries.pending_count() for lane in lanes))
+        self.stopped = False
+        for lane in lanes:
+            lane.campaign.stats = self.stats
+            if lane.campaign.metrics:
+                lane.campaign.metrics.parent = self.metrics
+
+    def progress(self):
+        """Filas procesadas y totales de todas las campañas."""
+        processed = sum(lane.campaign.tracker.processed() for lane in self.lanes)
+        return processed, sum(lane.campaign.total_emails_in_file for lane in self.lanes)
+
+    def entry(self, element):
+        return element
+
+    def stop(self, reason):
+        if not self.stopped:
+            self.stopped = True
+            logging.error(f"{reason} Se detienen todas las campañas; se retomarán en la próxima ejecución.")
+            for lane in self.lanes:
+                lane.campaign.stopped = True
+
+    def _choose(self, candidates):
+        total_weight = sum(lane.weight for lane in candidates)
+        for lane in candidates:
+            lane.current_weight += lane.weight
+        chosen = max(candidates, key=lambda lane: lane.current_weight)
+        chosen.current_weight -= total_weight
+        return chosen
+
+    def feed(self):
+        """Genera (campaña, elemento) o los segundos a esperar si ninguna tiene nada listo."""
+        started = time.monotonic()
+        active = list(self.lanes)
+        while active:
+            now = time.monotonic()
+            ready = [lane for lane in active if lane.ready_at <= now]
+            if not ready:
+                yield min(lane.ready_at for lane in active) - now
+                continue
+            lane = self._choose([candidate for candidate in ready if candidate.urgent] or ready)
+            try:
+                element = next(lane.items)
+            except StopIteration:
+                active.remove(lane)
+                lane.seconds = time.monotonic() - started
+                logging.info(f"Campaña '{lane.name}': no quedan filas ni reintentos por enviar.")
+                continue
+            if isinstance(element, float):
+                lane.ready_at = now + element
+                continue
+            yield lane.campaign, element
+
+
+def load_queue(path):
+    config = ConfigManager(config_file=path)
+    entries = config.load_config().get("campanas", [])
+    names = [entry["nombre"] for entry in entries]
+    duplicated = {name for name in names if names.count(name) > 1}
+    if duplicated:
+        raise ValueError(f"nombres de campaña repetidos: {', '.join(sorted(duplicated))}")
+    return entries
+
+
+def open_lanes(entries, balancer, limiter, history_manager):
+    """
+    Abre cada campaña de la cola con su contador; las que fallan o ya terminaron
+    se saltan. Todas se registran en el historial de `history_manager` (el
+    ConfigManager principal).
+    """
+    lanes = []
+    for entry in entries:
+        name = entry["nombre"]
+        counter_dir = os.path.join(COUNTER_DIR, name)
+        config_manager = ConfigManager(config_file=entry["config"], counter_file=os.path.join(counter_dir, "contador.txt"))
+        try:
+            config = config_manager.load_config()
+        except FileNotFoundError as e:
+            logging.error(f"Campaña '{name}': {e}. Se salta.")
+            continue
+        opened = open_campaign(config_manager, config, balancer, limiter, deliver=entry.get("spool", False),
+                               metrics_path=os.path.join(counter_dir, "metricas.json"))
+        if opened is None:
+            continue
+        campaign, rows = opened
+        lane = CampaignLane(name, campaign, rows, weight=entry.get("peso", 1), urgent=entry.get("urgente", False))
+        lane.history, lane.history_id = start_history(history_manager, config, name=name)
+        lanes.append(lane)
+        logging.info(f"Campaña '{name}': peso {lane.weight}{', urgente' if lane.urgent else ''}.")
+    return lanes
+
+
+def run_campaign_queue(queue_path=QUEUE_FILE):
+    """
+    Envía a la vez todas las campañas de la cola (`campanas`: nombre, config,
+    peso, urgente, spool). Cada una usa su propio config y su contador en
+    contador/<nombre>/; el pool, las cuentas SMTP y el límite de tasa salen del
+    config.json principal y los comparten todas.
+    """
+    try:
+        config_manager = ConfigManager()
+        config = config_manager.load_config()
+        entries = load_queue(queue_path)
+    except FileNotFoundError as e:
+        logging.error(f"Error de configuración: {e}.")
+        return
+    except (KeyError, TypeError, ValueError) as e:
+        logging.error(f"Error en la cola de campañas {queue_path}: {e}")
+        return
+
+    backend = open_backend(config_manager, config)
+    if backend is None: return
+    balancer, limiter, pool_size = backend
+
+    lanes = open_lanes(entries, balancer, limiter, config_manager)
+    if not lanes:
+        logging.info("No hay campañas con correos por enviar.")
+        return
+
+    mix = CampaignMix(lanes)
+    mix.metrics.start()
+    started = time.monotonic()
+    try:
+        if config.get('motor_envio', 'smtplib') == 'asyncio':
+            asyncio.run(run_async_pool(balancer, pool_size, mix.feed(), mix))
+        else:
+            run_thread_pool(balancer, pool_size, mix.feed(), mix)
+    finally:
+        seconds = time.monotonic() - started
+        for lane in lanes:
+            lane.campaign.close()
+        mix.metrics.close()
+        balancer.save()
+        for lane in lanes:
+            if lane.history:
+                finish_history(lane.history, lane.history_id, lane.campaign, lane.seconds or seconds)
+            logging.info(f"Campaña '{lane.name}':")
+            lane.campaign.log_summary()
+        if len(balancer.accounts) > 1 or config.get('cuentas_smtp'):
+            balancer.log_summary()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Envía a la vez las campañas de la cola compartiendo conexiones y límite de tasa.")
+    parser.add_argument("cola", nargs="?", default=QUEUE_FILE, help="Archivo con la cola de campañas (por defecto cola_campanas.json).")
+    run_campaign_queue(parser.parse_args().cola)
@@ -1,6 +1,7 @@
 import json
 import os
 from dotenv import load_dotenv
+from send_journal import SendJournal, journal_path_for, read_progress, retry_path_for, write_checkpoint
 
 class ConfigManager:
     def __init__(self, config_file="config.json", counter_file="contador/contador.txt"):
@@ -19,27 +20,69 @@ class ConfigManager:
         with open(self.config_file, "w", encoding="utf-8") as f:
             json.dump(config, f, indent=4, ensure_ascii=False)
 
-    def get_smtp_settings(self):
+    def get_smtp_settings(self, prefix="SMTP"):
         return {
-            "smtp_host": os.getenv("SMTP_HOST"),
-            "smtp_port": os.getenv("SMTP_PORT"),
-            "smtp_user": os.getenv("SMTP_USER"),
-            "smtp_password": os.getenv("SMTP_PASSWORD"),
-            "email_from": os.getenv("SMTP_FROM")
+            "smtp_host": os.getenv(f"{prefix}_HOST"),
+            "smtp_port": os.getenv(f"{prefix}_PORT"),
+            "smtp_user": os.getenv(f"{prefix}_USER"),
+            "smtp_password": os.getenv(f"{prefix}_PASSWORD"),
+            "email_from": os.getenv(f"{prefix}_FROM")
         }
 
+    def get_smtp_accounts(self, config):
+        """
+        Cuentas SMTP de salida: las de `cuentas_smtp` en config.json (cuotas y peso),
+        con las credenciales de las variables <prefijo_env>_HOST, _PORT, etc. del .env.
+        Sin `cuentas_smtp` se usa una sola cuenta con las variables SMTP_*.
+        """
+        entries = config.get("cuentas_smtp") or [{"nombre": "principal"}]
+        accounts = []
+        for entry in entries:
+            account = dict(entry)
+            account["smtp"] = self.get_smtp_settings(entry.get("prefijo_env", "SMTP"))
+            accounts.append(account)
+        return accounts
+
     def read_counter(self):
-        if os.path.exists(self.counter_file):
-            with open(self.counter_file, "r") as file:
-                return int(file.read().strip())
-        return 0
+        """Última fila contigua confirmada, según el contador y el journal de envíos."""
+        return read_progress(self.counter_file)
 
     def save_counter(self, value):
-        os.makedirs(os.path.dirname(self.counter_file), exist_ok=True)
-        with open(self.counter_file, "w") as file:
-            file.write(str(value))
+        """
+        Fija el contador a mano. Las filas del journal por debajo de `value` dejan
+        de contar (recover las ignora y SendJournal las compacta al abrirlo); las
+        confirmadas por encima se conservan para no reenviarlas. El journal no se
+        toca, así que un envío en curso no pierde el suyo.
+        """
+        write_checkpoint(self.counter_file, value)
+
+    def open_journal(self, batch_size=100, flush_interval=1.0):
+        """Abre el journal de envíos (recupera y consolida el progreso previo)."""
+        return SendJournal(self.counter_file, batch_size=batch_size, flush_interval=flush_interval)
+
+    def open_retry_queue(self, **kwargs):
+        """Abre la cola persistente de reintentos asociada al contador."""
+        # retry_queue arrastra asyncio y smtplib; los comandos que no envían no lo cargan
+        from retry_queue import RetryQueue
+
+        return RetryQueue(retry_path_for(self.counter_file), **kwargs)
+
+    def open_history(self):
+        """Abre el historial de campañas junto al contador (y el campaigns.json junto al config)."""
+        from campaign_history import LEGACY_FILE, CampaignHistory, history_path_for
+
+        legacy_path = os.path.join(os.path.dirname(self.config_file), LEGACY_FILE)
+        return CampaignHistory(history_path_for(self.counter_file), legacy_path)
 
     def reset_counter(self):
         self.save_counter(0)
+        # Se vacía en el sitio en lugar de borrarlo: un envío abierto sigue escribiendo en el mismo archivo
+        journal_file = journal_path_for(self.counter_file)
+        if os.path.exists(journal_file):
+            with open(journal_file, "r+") as file:
+                file.truncate(0)
+        retry_file = retry_path_for(self.counter_file)
+        if os.path.exists(retry_file):
+            os.remove(retry_file)
 
 
@@ -1,25 +1,27 @@
 import argparse
 from config_manager import ConfigManager
-import subprocess
-from email_sender import EmailSender
+from template_engine import CompiledTemplate
+from html_minifier import minify_cached
 import os
 from dotenv import load_dotenv
 load_dotenv()
 
 CONFIG_FILE = "config.json"
 COUNTER_FILE = "contador/contador.txt"
-SENDER_SCRIPT = "sender.py"
 
-def load_body_template(path):
-    """Carga la plantilla de correo desde un archivo."""
+def load_body_template(path, minify=False):
+    """Carga y compila la plantilla de correo desde un archivo (minificada como en sender.py si `minify`)."""
     if not os.path.exists(path):
         print(f'Error: El archivo de plantilla {path} no existe.')
         return None
     with open(path, 'r', encoding='utf-8') as file:
-        return file.read()
+        text = file.read()
+    return CompiledTemplate(minify_cached(path, text) if minify else text)
 
 def send_single_email(email_address, config_manager):
     """Envía un único correo electrónico."""
+    from email_sender import EmailSender
+
     try:
         config = config_manager.load_config()
         smtp_settings = config_manager.get_smtp_settings()
@@ -40,13 +42,15 @@ def send_single_email(email_address, config_manager):
     )
 
     body_file = config['body_file']
-    subject = config['subject']
-    body_template = load_body_template(body_file)
+    subject_template = CompiledTemplate(config['subject'])
+    body_template = load_body_template(body_file, minify=config.get('minificar_html', False))
     if body_template is None:
         return
 
     if email_sender.connect():
-        personalized_body = body_template.replace('{{names}}', 'Amigo(a)')
+        # Sin fila de la lista: cada placeholder usa su valor por defecto.
+        subject = subject_template.render({})
+        personalized_body = body_template.render({})
         print(f"Enviando correo a: {email_address}")
         if email_sender.send_email(email_address, subject, personalized_body):
             print("Correo enviado exitosamente.")
@@ -54,6 +58,26 @@ def send_single_email(email_address, config_manager):
             print("Fallo al enviar el correo.")
         email_sender.disconnect()
 
+def show_status(config_manager):
+    """Muestra el tamaño de la lista configurada y el avance del contador."""
+    from recipient_reader import RecipientReader
+
+    try:
+        config = config_manager.load_config()
+        reader = RecipientReader(config['excel_file'])
+        total = reader.count()
+    except (FileNotFoundError, KeyError, ValueError) as e:
+        print(f"No se pudo leer la lista de destinatarios: {e}")
+        return
+
+    contador = config_manager.read_counter()
+    print(f"Lista: {config['excel_file']}")
+    print(f"Columnas: {', '.join(reader.columns)}")
+    print(f"Procesados: {min(contador, total)} de {total}")
+    siguiente = next(reader.rows(contador), None) if contador < total else None
+    if siguiente is not None:
+        print(f"Siguiente destinatario: {siguiente.email}")
+
 def main():
     config_manager = ConfigManager(CONFIG_FILE, COUNTER_FILE)
 
@@ -76,6 +100,9 @@ Ejemplos de uso:
 
   # Reiniciar el contador de envíos
   python %(prog)s --reset-counter
+
+  # Ver el avance sobre la lista configurada
+  python %(prog)s --estado
 '''
     )
     parser.add_argument("--set-default", action="store_true", help="Usar configuración por defecto (definida en config.json)")
@@ -84,9 +111,11 @@ Ejemplos de uso:
     parser.add_argument("--body", type=str, help="Ruta al archivo HTML del cuerpo del correo.")
     parser.add_argument("--subject", type=str, help="Asunto del correo.")
     parser.add_argument("--delay", type=int, help="Retraso en segundos entre cada envío de correo.")
+    parser.add_argument("--conexiones", type=int, help="Número de conexiones SMTP simultáneas (pool de envío).")
     parser.add_argument("--reset-counter", action="store_true", help="Reiniciar el contador de correos a 0.")
     parser.add_argument("--send", action="store_true", help="Ejecutar el envío de correos con la configuración guardada.")
     parser.add_argument("--send-single", type=str, help="Enviar un único correo a la dirección especificada.")
+    parser.add_argument("--estado", action="store_true", help="Mostrar el avance del envío sobre la lista configurada.")
 
     args = parser.parse_args()
 
@@ -94,6 +123,10 @@ Ejemplos de uso:
         send_single_email(args.send_single, config_manager)
         return
 
+    if args.estado:
+        show_status(config_manager)
+        return
+
     try:
         config = config_manager.load_config()
     except FileNotFoundError:
@@ -115,6 +148,8 @@ Ejemplos de uso:
         config["subject"] = args.subject
     if args.delay:
         config["delay_segundos"] = args.delay
+    if args.conexiones:
+        config["conexiones_smtp"] = args.conexiones
 
     config_manager.save_config(config)
     print("Configuración guardada en 'config.json'.")
@@ -125,14 +160,14 @@ Ejemplos de uso:
 
     if args.send:
         print("Iniciando el proceso de envío de correos...")
-        command = ["python3", SENDER_SCRIPT]
+        # En el mismo proceso: sin arrancar otro intérprete ni volver a importar todo.
+        # sender se importa aquí porque carga el motor de envío completo.
+        from sender import run_sender
         try:
-            subprocess.run(command, check=True)
+            run_sender()
             print("Proceso de envío finalizado.")
-        except subprocess.CalledProcessError as e:
-            print(f"El script de envío terminó con un error: {e}")
-        except FileNotFoundError:
-            print(f"Error: No se encontró el script '{SENDER_SCRIPT}'.")
+        except Exception as e:
+            print(f"El envío terminó con un error: {e}")
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,165 @@
+import logging
+import threading
+from collections import Counter, defaultdict, deque
+
+from rate_limiter import PERIOD_SECONDS, RateLimiter
+
+# Filas leídas por adelantado para poder intercalar dominios
+DEFAULT_LOOKAHEAD = 1000
+
+# Espera cuando todos los dominios con filas pendientes están en su límite
+IDLE_WAIT_SECONDS = 0.05
+
+DEFAULT_KEY = "por_defecto"
+
+
+def email_domain(email):
+    if not isinstance(email, str):
+        return ""
+    return email.rsplit("@", 1)[-1].lower()
+
+
+class DomainLimit:
+    """Límites de un dominio (o grupo de dominios): concurrencia y tasa."""
+
+    def __init__(self, concurrency=0, rate=None):
+        self.concurrency = concurrency
+        self.limiter = RateLimiter(rate) if rate else None
+        self.in_flight = 0
+
+    @classmethod
+    def from_config(cls, settings):
+        rate = None
+        for period, seconds in PERIOD_SECONDS.items():
+            value = settings.get(f"por_{period}")
+            if value:
+                rate = float(value) / seconds
+        return cls(int(settings.get("concurrencia", 0)), rate)
+
+
+class DomainScheduler:
+    """
+    Reordena la lista por dominio de destino para no mandar rachas largas al mismo
+    proveedor: agrupa las filas en colas por dominio (leyendo hasta `lookahead`
+    filas por adelantado) y las entrega en round-robin. Cada dominio puede tener
+    un máximo de envíos simultáneos y una tasa propia; mientras un dominio está en
+    su límite se sigue con los demás y se cuenta un aplazamiento (uno por fila,
+    aunque la fila espere varias vueltas).
+
+    `dominios` en config.json admite claves con varios dominios separados por coma
+    para que compartan límite (p. ej. "hotmail.com,outlook.com,live.com").
+    """
+
+    def __init__(self, config=None, lookahead=DEFAULT_LOOKAHEAD):
+        config = config or {}
+        self.lookahead = lookahead
+        self.default_settings = config.get(DEFAULT_KEY, {})
+        self.limits = {}
+        for key, settings in config.items():
+            if key == DEFAULT_KEY:
+                continue
+            limit = DomainLimit.from_config(settings)
+            for domain in key.split(","):
+                self.limits[domain.strip().lower()] = limit
+        self.sent = Counter()
+        self.failed = Counter()
+        self.deferred = Counter()
+        # Filas entregadas que se devolvieron sin intentar (p. ej. al detener el envío)
+        self.unattempted = Counter()
+        self._lock = threading.Lock()
+
+    def _limit(self, domain):
+        limit = self.limits.get(domain)
+        if limit is None:
+            limit = self.limits[domain] = DomainLimit.from_config(self.default_settings)
+        return limit
+
+    def _admit(self, domain):
+        """Devuelve 0 si se puede enviar ya a `domain` o los segundos a esperar."""
+        limit = self._limit(domain)
+        with self._lock:
+            if limit.concurrency and limit.in_flight >= limit.concurrency:
+                return IDLE_WAIT_SECONDS
+            wait = limit.limiter.try_acquire() if limit.limiter else 0.0
+            if not wait:
+                limit.in_flight += 1
+            return wait
+
+    def release(self, email, sent, attempted=True):
+        """Registra el fin de un envío entregado por interleave() (`attempted` False si no se llegó a intentar)."""
+        domain = email_domain(email)
+        limit = self._limit(domain)
+        with self._lock:
+            limit.in_flight -= 1
+            if not attempted:
+                self.unattempted[domain] += 1
+            else:
+                (self.sent if sent else self.failed)[domain] += 1
+
+    def interleave(self, rows):
+        """
+        Genera los destinatarios en round-robin por dominio. Cuando todos los
+        dominios con filas pendientes están en su límite, genera los segundos a esperar.
+        """
+        source = iter(rows)
+        exhausted = False
+        buffers = defaultdict(deque)
+        ring = deque()
+        buffered = 0
+        # Dominios cuya primera fila ya se contó como aplazada
+        waiting = set()
+
+        while True:
+            while not exhausted and buffered < self.lookahead:
+                recipient = next(source, None)
+                if recipient is None:
+                    exhausted = True
+                    break
+                domain = email_domain(recipient.email)
+                if not buffers[domain]:
+                    ring.append(domain)
+                buffers[domain].append(recipient)
+                buffered += 1
+
+            if not ring:
+                return
+
+            shortest_wait = None
+            for _ in range(len(ring)):
+                domain = ring[0]
+                ring.rotate(-1)
+                wait = self._admit(domain)
+                if wait:
+                    if domain not in waiting:
+                        waiting.add(domain)
+                        self.deferred[domain] += 1
+                    shortest_wait = wait if shortest_wait is None else min(shortest_wait, wait)
+                    continue
+                recipient = buffers[domain].popleft()
+                buffered -= 1
+                waiting.discard(domain)
+                if not buffers[domain]:
+                    ring.pop()
+                    del buffers[domain]
+                yield recipient
+                break
+            else:
+                yield min(shortest_wait, 1.0)
+
+    def log_summary(self, top=10):
+        domains = sorted(set(self.sent) | set(self.failed) | set(self.deferred) | set(self.unattempted),
+                         key=lambda domain: -(self.sent[domain] + self.failed[domain]))
+        if not domains:
+            return
+        logging.info("Resumen por dominio (enviados / fallidos / aplazamientos):")
+        for domain in domains[:top]:
+            logging.info(f"  {domain}: {self.sent[domain]} / {self.failed[domain]} / {self.deferred[domain]}")
+        if len(domains) > top:
+            rest = domains[top:]
+            logging.info(
+                f"  otros {len(rest)} dominios: {sum(self.sent[d] for d in rest)} / "
+                f"{sum(self.failed[d] for d in rest)} / {sum(self.deferred[d] for d in rest)}"
+            )
+        unattempted = sum(self.unattempted.values())
+        if unattempted:
+            logging.info(f"  sin intentar (devueltas al detener el envío): {unattempted}")
@@ -1,7 +1,209 @@
 import smtplib
-from email.mime.text import MIMEText
-from email.mime.multipart import MIMEMultipart
+import base64
+import binascii
+import json
+import re
+import secrets
+import threading
+from functools import lru_cache
+from email.header import Header
 import logging
+from file_utils import atomic_write
+
+# Extensiones EHLO de cada servidor SMTP, guardadas por las sesiones de envío
+SERVERS_FILE = "contador/servidores_smtp.json"
+
+def new_boundary():
+    """Boundary MIME aleatorio ("=_" no aparece en quoted-printable ni en base64)."""
+    return f"=_{secrets.token_hex(16)}"
+
+def build_message(email_from, to_email, subject, body, eight_bit=False):
+    """
+    Construye el mensaje MIME (HTML) listo para enviar, como bytes, con la misma
+    estructura y la misma elección de codificación que MessageBuilder.
+    """
+    boundary = new_boundary()
+    return b"".join((
+        f'Content-Type: multipart/mixed; boundary="{boundary}"\r\nMIME-Version: 1.0\r\n'.encode("ascii"),
+        encode_header("From", email_from),
+        encode_header("To", to_email),
+        encode_header("Subject", subject),
+        f"\r\n--{boundary}\r\n".encode("ascii"),
+        encode_html_part(body, eight_bit),
+        f"\r\n--{boundary}--\r\n".encode("ascii"),
+    ))
+
+def encode_header(name, value):
+    """Codifica una cabecera como bytes con CRLF (encoded-word si no es ASCII)."""
+    if value.isascii():
+        return f"{name}: {value}\r\n".encode("ascii")
+    encoded = Header(value, "utf-8", header_name=name).encode(linesep="\r\n")
+    return f"{name}: {encoded}\r\n".encode("ascii")
+
+ENCODING_7BIT = "7bit"
+ENCODING_8BIT = "8bit"
+ENCODING_QUOTED_PRINTABLE = "quoted-printable"
+ENCODING_BASE64 = "base64"
+
+# Una línea de más de 998 octetos (sin el CRLF) no puede ir sin codificar (RFC 5322 2.1.1)
+LONG_LINE = re.compile(rb"[^\n]{999}")
+
+# Cuerpos ya codificados que se guardan (p. ej. el mismo cuerpo con el nombre por defecto)
+ENCODED_BODIES = 128
+
+def fits_unencoded(data):
+    """True si los bytes pueden ir tal cual (7bit u 8bit): sin CR sueltos, NUL ni líneas largas."""
+    return b"\r" not in data and b"\0" not in data and not LONG_LINE.search(data)
+
+def _encode_payload(data, encoding):
+    if encoding == ENCODING_BASE64:
+        payload = base64.encodebytes(data)
+    elif encoding == ENCODING_QUOTED_PRINTABLE:
+        payload = binascii.b2a_qp(data, istext=True)
+    else:
+        payload = data
+    payload = payload.replace(b"\n", b"\r\n")
+    if not payload.endswith(b"\r\n"):
+        payload += b"\r\n"
+    return payload
+
+def smallest_encoding(data):
+    """Entre quoted-printable y base64, la que da menos bytes para `data`."""
+    qp_size = len(_encode_payload(data, ENCODING_QUOTED_PRINTABLE))
+    return ENCODING_QUOTED_PRINTABLE if qp_size <= len(_encode_payload(data, ENCODING_BASE64)) else ENCODING_BASE64
+
+def body_encoding(data, eight_bit=False, fallback=None):
+    """
+    Codificación más compacta válida para el cuerpo `data` (UTF-8 con LF): 7bit
+    si es ASCII, 8bit si además el servidor anuncia 8BITMIME y, si no, la menor
+    entre quoted-printable y base64 (o `fallback` si ya se eligió para la
+    plantilla, para no codificar dos veces cada cuerpo).
+    """
+    if fits_unencoded(data):
+        if data.isascii():
+            return ENCODING_7BIT
+        if eight_bit:
+            return ENCODING_8BIT
+    return fallback or smallest_encoding(data)
+
+@lru_cache(maxsize=ENCODED_BODIES)
+def encode_html_part(body, eight_bit=False, fallback=None):
+    """
+    Codifica la parte text/html como bytes con CRLF, con la codificación que
+    elige `body_encoding`. Un cuerpo solo en ASCII sale igual que con
+    MIMEText(body, "html").
+    """
+    data = body.replace("\r\n", "\n").encode("utf-8")
+    encoding = body_encoding(data, eight_bit, fallback)
+    charset = "us-ascii" if encoding == ENCODING_7BIT else "utf-8"
+    headers = f'Content-Type: text/html; charset="{charset}"\r\nMIME-Version: 1.0\r\nContent-Transfer-Encoding: {encoding}\r\n\r\n'
+    return headers.encode("ascii") + _encode_payload(data, encoding)
+
+# Servidores sin 8BITMIME a los que ya se avisó que se les envía 8bit
+_warned_8bit = set()
+
+def mail_options(message, extensions, host):
+    """Parámetros de MAIL FROM para `message`: BODY=8BITMIME si lleva bytes de 8 bits y el servidor lo admite."""
+    if not isinstance(message, bytes) or message.isascii():
+        return ()
+    if "8bitmime" in extensions:
+        return ("BODY=8BITMIME",)
+    if host not in _warned_8bit:
+        _warned_8bit.add(host)
+        logging.warning(f"{host} no anuncia 8BITMIME y el mensaje va en 8bit; "
+                        "configura \"codificacion_8bit\": false para este servidor.")
+    return ()
+
+_servers_lock = threading.Lock()
+_servers = None
+
+def _load_servers(path):
+    global _servers
+    if _servers is None:
+        try:
+            with open(path, "r", encoding="utf-8") as file:
+                _servers = json.load(file)
+        except (FileNotFoundError, json.JSONDecodeError):
+            _servers = {}
+    return _servers
+
+def known_extensions(host, port, path=SERVERS_FILE):
+    """Extensiones que anunció `host:port` en la última sesión registrada, o None si no hay ninguna."""
+    with _servers_lock:
+        return _load_servers(path).get(f"{host}:{port}")
+
+def remember_extensions(host, port, extensions, path=SERVERS_FILE):
+    """Guarda las extensiones EHLO de una sesión real (solo se escribe si cambiaron)."""
+    keywords = sorted(extensions)
+    with _servers_lock:
+        servers = _load_servers(path)
+        key = f"{host}:{port}"
+        if servers.get(key) == keywords:
+            return
+        servers[key] = keywords
+        try:
+            with atomic_write(path) as file:
+                json.dump(servers, file, indent=4)
+        except OSError as e:
+            logging.warning(f"No se pudieron guardar las extensiones de {key} en {path}: {e}")
+
+class MessageBuilder:
+    """
+    Serializa la estructura MIME una sola vez por campaña.
+
+    Las cabeceras comunes, el boundary y, si no llevan placeholders, el asunto y la
+    parte HTML ya codificados se guardan como bytes; por destinatario solo se
+    añaden la cabecera To y las partes personalizadas.
+
+    `render` devuelve solo la parte propia del destinatario (desde la cabecera To),
+    que no depende del remitente: puede generarse en otro proceso y unirse después
+    a `head(email_from)` de la cuenta que lo envía.
+    """
+
+    def __init__(self, email_from, subject_template, body_template, boundary=None, eight_bit=False):
+        self.subject_template = subject_template
+        self.body_template = body_template
+        self.boundary = boundary or new_boundary()
+        # Con 8BITMIME el HTML va en 8bit; si no, quoted-printable o base64, elegida
+        # una sola vez con la plantilla rellenada con los valores por defecto
+        self.eight_bit = eight_bit
+        sample = body_template.render({}).replace("\r\n", "\n").encode("utf-8")
+        self.fallback = smallest_encoding(sample)
+        self.encoding = body_encoding(sample, eight_bit, self.fallback)
+        self._common = (
+            f'Content-Type: multipart/mixed; boundary="{self.boundary}"\r\n'
+            "MIME-Version: 1.0\r\n"
+        ).encode("ascii")
+        self._head = self.head(email_from)
+        self._open = f"\r\n--{self.boundary}\r\n".encode("ascii")
+        self._close = f"\r\n--{self.boundary}--\r\n".encode("ascii")
+        self._subject = None
+        self._body = None
+        if subject_template.is_static:
+            self._subject = encode_header("Subject", subject_template.render({}))
+        if body_template.is_static:
+            self._body = encode_html_part(body_template.render({}), eight_bit, self.fallback)
+
+    def head(self, email_from):
+        """Cabeceras comunes con el remitente indicado."""
+        return self._common + encode_header("From", email_from)
+
+    def render(self, to_email, fields):
+        """Parte del mensaje propia de un destinatario, como bytes."""
+        subject = self._subject or encode_header("Subject", self.subject_template.render(fields))
+        body = self._body or encode_html_part(self.body_template.render(fields), self.eight_bit, self.fallback)
+        return b"".join((encode_header("To", to_email), subject, self._open, body, self._close))
+
+    def build(self, to_email, fields):
+        """Devuelve el mensaje completo para un destinatario, como bytes."""
+        return self._head + self.render(to_email, fields)
+
+def smtp_error_code(error):
+    """Extrae el código SMTP de una excepción, si lo tiene."""
+    if isinstance(error, smtplib.SMTPRecipientsRefused):
+        codes = [code for code, _msg in error.recipients.values()]
+        return codes[0] if codes else None
+    return getattr(error, "smtp_code", None)
 
 class EmailSender:
     def __init__(self, smtp_host, smtp_port, smtp_user, smtp_password, email_from):
@@ -11,6 +213,20 @@ class EmailSender:
         self.smtp_password = smtp_password
         self.email_from = email_from
         self.server = None
+        self.last_error_code = None
+        self.last_error = None
+        # Reconexiones automáticas tras una desconexión del servidor
+        self.reconnects = 0
+
+    @property
+    def extensions(self):
+        """Extensiones que anunció el servidor en EHLO (en minúsculas)."""
+        return self.server.esmtp_features if self.server else {}
+
+    @property
+    def is_connected(self):
+        """False si no hay sesión abierta (p. ej. falló la reconexión tras una desconexión)."""
+        return self.server is not None
 
     def connect(self):
         """Establece la conexión con el servidor SMTP."""
@@ -19,10 +235,12 @@ class EmailSender:
             self.server = smtplib.SMTP(self.smtp_host, self.smtp_port, timeout=10)
             self.server.starttls()
             self.server.login(self.smtp_user, self.smtp_password)
+            remember_extensions(self.smtp_host, self.smtp_port, self.server.esmtp_features)
             logging.info("✅ Conexión SMTP establecida.")
             return True
         except Exception as e:
             logging.error(f"❌ Error al conectar con el servidor SMTP: {e}")
+            self.last_error = e
             self.server = None
             return False
 
@@ -38,19 +256,27 @@ class EmailSender:
                 self.server = None
 
     def send_email(self, to_email, subject, body):
-        """Envía un correo utilizando la conexión existente."""
+        """
+        Envía un correo utilizando la conexión existente.
+        Si falla, el código SMTP de la respuesta queda en `last_error_code`.
+        """
+        message = build_message(self.email_from, to_email, subject, body, eight_bit="8bitmime" in self.extensions)
+        return self.send_message(to_email, message)
+
+    def send_message(self, to_email, message):
+        """
+        Envía un mensaje ya serializado (str o bytes, p. ej. de MessageBuilder).
+        Si falla, el código SMTP de la respuesta queda en `last_error_code`.
+        """
+        self.last_error_code = None
+        self.last_error = None
         if not self.server:
             logging.error("No hay conexión SMTP activa. No se puede enviar el correo.")
+            self.last_error = smtplib.SMTPServerDisconnected("Sin conexión SMTP activa")
             return False
         
         try:
-            msg = MIMEMultipart()
-            msg["From"] = self.email_from
-            msg["To"] = to_email
-            msg["Subject"] = subject
-            msg.attach(MIMEText(body, "html"))
-
-            self.server.sendmail(self.email_from, to_email, msg.as_string())
+            self.server.sendmail(self.email_from, to_email, message, mail_options(message, self.extensions, self.smtp_host))
             
             # No logueamos aquí para no saturar, el script principal lo hará.
             return True
@@ -58,16 +284,20 @@ class EmailSender:
             logging.error("El servidor SMTP se desconectó. Intentando reconectar...")
             # Intentar reconectar una vez
             if self.connect():
+                self.reconnects += 1
                 try:
-                    self.server.sendmail(self.email_from, to_email, msg.as_string())
+                    self.server.sendmail(self.email_from, to_email, message, mail_options(message, self.extensions, self.smtp_host))
                     return True
                 except Exception as e:
                     logging.error(f"Error al enviar correo a {to_email} tras reconexión: {e}")
+                    self.last_error_code = smtp_error_code(e)
+                    self.last_error = e
                     return False
             else:
+                self.last_error = smtplib.SMTPServerDisconnected("No se pudo reconectar")
                 return False
         except Exception as e:
             logging.error(f"Error al enviar correo a {to_email}: {e}")
+            self.last_error_code = smtp_error_code(e)
+            self.last_error = e
             return False
-
-
@@ -0,0 +1,44 @@
+import hashlib
+import os
+from contextlib import contextmanager
+
+
+def file_fingerprint(path):
+    """Identifica una versión de un archivo sin leerlo entero (tamaño + fecha)."""
+    stat = os.stat(path)
+    return {"tamano": stat.st_size, "modificado": stat.st_mtime_ns}
+
+
+def file_hash(path):
+    """sha256 del contenido de un archivo, leído por bloques."""
+    digest = hashlib.sha256()
+    with open(path, "rb") as file:
+        for chunk in iter(lambda: file.read(1 << 20), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+@contextmanager
+def atomic_write(path, mode="w", sync=False, newline=None):
+    """
+    Escribe `path` de forma atómica: el bloque escribe en `<path>.tmp`, que al
+    terminar se renombra sobre `path`, así que quien lo lee ve el archivo
+    anterior o el nuevo completo. Con `sync` se hace fsync antes del rename. Si
+    el bloque falla, el temporal se borra y `path` no cambia. `newline` es el
+    de open() (p. ej. "" para escribir los saltos de línea tal cual).
+    """
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    tmp_path = f"{path}.tmp"
+    try:
+        with open(tmp_path, mode, encoding=None if "b" in mode else "utf-8", newline=newline) as file:
+            yield file
+            if sync:
+                file.flush()
+                os.fsync(file.fileno())
+        os.replace(tmp_path, path)
+    except BaseException:
+        try:
+            os.remove(tmp_path)
+        except FileNotFoundError:
+            pass
+        raise
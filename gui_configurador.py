@@ -5,7 +5,11 @@ import ttkbootstrap as ttk
 from ttkbootstrap.constants import *
 from config_manager import ConfigManager
 from email_sender import EmailSender
-import pandas as pd
+from recipient_reader import RecipientReader
+from send_journal import STATUS_SENT, STATUS_SKIPPED, STATUS_SUPPRESSED
+from sender import is_valid_email
+from suppression import SuppressionList
+from template_engine import CompiledTemplate
 from dotenv import load_dotenv
 load_dotenv()
 
@@ -80,40 +84,68 @@ class EmailConfiguratorGUI:
         self.actualizar_config() # Guardar siempre la config actual antes de enviar
 
         try:
-            df = pd.read_excel(self.excel_entry.get())
+            reader = RecipientReader(self.excel_entry.get())
+            total = reader.count()
             body_template = self._load_body_template(self.body_entry.get())
             if body_template is None: return
         except FileNotFoundError as e:
-            messagebox.showerror("Error de Archivo", f"No se encontró el archivo: {e.filename}")
+            messagebox.showerror("Error de Archivo", f"No se encontró el archivo: {e}")
             return
         except Exception as e:
             messagebox.showerror("Error de Lectura", f"No se pudo leer el archivo Excel o la plantilla: {e}")
             return
 
-        contador = self.config_manager.read_counter()
-        if contador >= len(df):
-            self.test_status_var.set(f"No hay más correos en la lista. Total: {len(df)}. Reinicia el contador para volver a empezar.")
-            return
-
-        fila = df.iloc[contador]
-        to_email = fila['email']
-        names = fila.get('names', 'Amigo(a)')
-        personalized_body = body_template.replace('{{names}}', str(names))
-
         smtp_settings = self.config_manager.get_smtp_settings()
         required_keys = ["smtp_host", "smtp_port", "smtp_user", "smtp_password","email_from"]
         if not all(smtp_settings.get(key) for key in required_keys):
             messagebox.showerror("Error de Configuración", "La configuración de SMTP no está completa. Revisa tu archivo .env.")
             return
 
+        suppression = SuppressionList(use_bloom=self.config.get('supresion_bloom', True))
+        try:
+            suppression.load()
+        except Exception as e:
+            messagebox.showerror("Error de Supresión", f"No se pudo cargar la lista de supresión: {e}")
+            return
+        journal = self.config_manager.open_journal()
+        try:
+            self._enviar_fila(reader, total, body_template, smtp_settings, suppression, journal)
+        finally:
+            journal.close()
+            suppression.close()
+
+    def _enviar_fila(self, reader, total, body_template, smtp_settings, suppression, journal):
+        # Como en sender.py: las filas inválidas o suprimidas se registran y se pasa a la siguiente
+        fila = None
+        omitidas = 0
+        for recipient in reader.rows(journal.watermark):
+            if recipient.index in journal.done:
+                continue
+            if not is_valid_email(recipient.email):
+                journal.record(recipient.index, STATUS_SKIPPED)
+            elif recipient.email in suppression:
+                journal.record(recipient.index, STATUS_SUPPRESSED)
+            else:
+                fila = recipient
+                break
+            omitidas += 1
+        if fila is None:
+            self.test_status_var.set(f"No hay más correos en la lista. Total: {total}. Reinicia el contador para volver a empezar.")
+            return
+
+        to_email = fila.email
+        subject = CompiledTemplate(self.subject_entry.get()).render(fila.fields)
+        personalized_body = body_template.render(fila.fields)
+        aviso = f" ({omitidas} omitidas por inválidas o suprimidas)" if omitidas else ""
+
         email_sender = EmailSender(**smtp_settings)
-        self.test_status_var.set(f"Enviando a {to_email}...")
+        self.test_status_var.set(f"Enviando a {to_email}...{aviso}")
         self.master.update_idletasks()
 
         if email_sender.connect():
-            if email_sender.send_email(to_email, self.subject_entry.get(), personalized_body):
-                self.config_manager.save_counter(contador + 1)
-                self.test_status_var.set(f"✅ Éxito. Correo [{contador+1}/{len(df)}] enviado a: {to_email}")
+            if email_sender.send_email(to_email, subject, personalized_body):
+                journal.record(fila.index, STATUS_SENT)
+                self.test_status_var.set(f"✅ Éxito. Correo [{fila.index + 1}/{total}] enviado a: {to_email}{aviso}")
             else:
                 self.test_status_var.set(f"❌ Falló el envío a: {to_email}. Revisa la consola para más detalles.")
             email_sender.disconnect()
@@ -123,12 +155,12 @@ class EmailConfiguratorGUI:
     def _load_body_template(self, path):
         if os.path.exists(path):
             with open(path, 'r', encoding='utf-8') as file:
-                return file.read()
+                return CompiledTemplate(file.read())
         messagebox.showerror("Error de Plantilla", f"El archivo de plantilla HTML no se encontró en la ruta:\n{path}")
         return None
 
     def seleccionar_archivo(self, tipo):
-        ext = [("Archivos Excel", "*.xlsx")] if tipo == "excel" else [("Archivos HTML", "*.html")]
+        ext = [("Listas de destinatarios", "*.xlsx *.csv")] if tipo == "excel" else [("Archivos HTML", "*.html")]
         return filedialog.askopenfilename(title="Seleccionar archivo", filetypes=ext)
 
     def seleccionar_excel(self):
@@ -0,0 +1,145 @@
+import hashlib
+import logging
+import os
+import re
+
+from file_utils import atomic_write
+from template_engine import PLACEHOLDER_PATTERN
+
+CACHE_DIR = ".cache"
+CACHE_SUFFIX = ".min.html"
+
+# Forma parte de la clave de la caché: cambiar las reglas invalida lo minificado antes
+MINIFIER_VERSION = "2"
+
+# Plantillas minificadas que se guardan en memoria (clave: hash del contenido)
+MEMORY_ENTRIES = 32
+
+# Elementos cuyo contenido se deja tal cual
+RAW_PATTERN = re.compile(r"<(pre|textarea|script)\b.*?</\1\s*>", re.IGNORECASE | re.DOTALL)
+STYLE_PATTERN = re.compile(r"(<style\b[^>]*>)(.*?)(</style\s*>)", re.IGNORECASE | re.DOTALL)
+# Comentarios HTML; los que forman parte de un condicional de Outlook se conservan (ver _strip_comment)
+COMMENT_PATTERN = re.compile(r"<!-->|<!--.*?-->", re.DOTALL)
+CSS_COMMENT_PATTERN = re.compile(r"/\*.*?\*/", re.DOTALL)
+# Solo los espacios de HTML: el espacio duro (\xa0) y demás espacios Unicode son contenido
+WHITESPACE_PATTERN = re.compile(r"[ \t\r\n\f]+")
+CSS_PUNCTUATION_PATTERN = re.compile(r"[ \t\r\n\f]*([{};,])[ \t\r\n\f]*")
+
+_memory = {}
+
+
+def _collapse(match):
+    # Un salto de línea ocupa lo mismo que un espacio y mantiene las líneas cortas (límite SMTP de 998)
+    return "\n" if "\n" in match.group(0) else " "
+
+
+def _minify_css(css):
+    css = CSS_COMMENT_PATTERN.sub("", css)
+    css = CSS_PUNCTUATION_PATTERN.sub(r"\1", css)
+    css = WHITESPACE_PATTERN.sub(" ", css).replace(";}", "}").replace(": ", ":")
+    # Una regla por línea
+    return css.replace("}", "}\n").strip()
+
+
+def _strip_comment(match):
+    # <!--[if mso]>...<![endif]-->, <!--[if !mso]><!-- --> o <!--[if !mso]><!--> (el
+    # comentario vacío que los sigue cae en la misma coincidencia), <!-->, <!--<![endif]-->
+    comment = match.group(0)
+    if comment == "<!-->" or comment[4:].startswith(("[if", "<!")):
+        return comment
+    return ""
+
+
+def _minify_markup(markup):
+    markup = COMMENT_PATTERN.sub(_strip_comment, markup)
+    return WHITESPACE_PATTERN.sub(_collapse, markup)
+
+
+def minify_html(text):
+    """
+    Quita de una plantilla HTML los comentarios (salvo los condicionales de
+    Outlook), los comentarios y espacios sobrantes del CSS de <style> y la
+    sangría: cada tramo de espacios queda en un espacio o un salto de línea, que
+    el navegador o el cliente de correo muestran igual. Los placeholders y el
+    contenido de <pre>, <textarea> y <script> no se tocan.
+    """
+    placeholders = []
+
+    def protect(match):
+        placeholders.append(match.group(0))
+        return f"\0{len(placeholders) - 1}\0"
+
+    text = PLACEHOLDER_PATTERN.sub(protect, text)
+    parts = []
+    position = 0
+    for match in RAW_PATTERN.finditer(text):
+        parts.append(_minify_markup(text[position:match.start()]))
+        parts.append(match.group(0))
+        position = match.end()
+    parts.append(_minify_markup(text[position:]))
+    text = "".join(parts).strip()
+    text = STYLE_PATTERN.sub(lambda match: match.group(1) + _minify_css(match.group(2)) + match.group(3), text)
+    return re.sub(r"\0(\d+)\0", lambda match: placeholders[int(match.group(1))], text)
+
+
+def content_hash(text):
+    return hashlib.sha256(f"{MINIFIER_VERSION}\0{text}".encode("utf-8")).hexdigest()
+
+
+def cache_path_for(path, key):
+    """Caché de una plantilla: .cache/<nombre>.<hash>.min.html junto a la plantilla."""
+    name = os.path.basename(path)
+    return os.path.join(os.path.dirname(path), CACHE_DIR, f"{name}.{key[:16]}{CACHE_SUFFIX}")
+
+
+def _store(path, key, minified):
+    cache_path = cache_path_for(path, key)
+    directory = os.path.dirname(cache_path)
+    with atomic_write(cache_path, newline="") as file:
+        file.write(minified)
+    # Las versiones anteriores de la misma plantilla ya no sirven
+    prefix = os.path.basename(path) + "."
+    for entry in os.listdir(directory):
+        if entry.startswith(prefix) and entry.endswith(CACHE_SUFFIX) and entry != os.path.basename(cache_path):
+            rest = entry[len(prefix):-len(CACHE_SUFFIX)]
+            if "." not in rest:
+                os.remove(os.path.join(directory, entry))
+
+
+def minify_cached(path, text):
+    """
+    Versión minificada de `text` (el contenido de la plantilla `path`). Se
+    minifica una sola vez por contenido: el resultado queda en memoria y en
+    .cache/ junto a la plantilla, con el hash del contenido en el nombre, así
+    que editar la plantilla genera otra entrada y nunca se usa una vieja.
+    """
+    key = content_hash(text)
+    minified = _memory.get(key)
+    if minified is not None:
+        return minified
+    cache_path = cache_path_for(path, key)
+    try:
+        with open(cache_path, "r", encoding="utf-8", newline="") as file:
+            minified = file.read()
+    except FileNotFoundError:
+        minified = minify_html(text)
+        try:
+            _store(path, key, minified)
+        except OSError as e:
+            logging.warning(f"No se pudo guardar la plantilla minificada en {cache_path}: {e}")
+    if len(_memory) >= MEMORY_ENTRIES:
+        _memory.pop(next(iter(_memory)))
+    _memory[key] = minified
+    return minified
+
+
+def remove_cache(path):
+    directory = os.path.join(os.path.dirname(path), CACHE_DIR)
+    prefix = os.path.basename(path) + "."
+    try:
+        entries = os.listdir(directory)
+    except FileNotFoundError:
+        return
+    for entry in entries:
+        if entry.startswith(prefix) and entry.endswith(CACHE_SUFFIX) and "." not in entry[len(prefix):-len(CACHE_SUFFIX)]:
+            os.remove(os.path.join(directory, entry))
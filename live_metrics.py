@@ -0,0 +1,250 @@
+import json
+import logging
+import os
+import threading
+import time
+from bisect import bisect_left
+from collections import deque
+
+from file_utils import atomic_write
+
+METRICS_FILE = "contador/metricas.json"
+
+# Segundos entre escrituras del archivo de métricas
+WRITE_INTERVAL = 2.0
+
+# Ventana para la tasa actual de envío
+RATE_WINDOW_SECONDS = 60
+
+# Límites superiores (segundos) del histograma de latencia por transacción SMTP
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+STATE_SENDING = "enviando"
+STATE_FINISHED = "finalizado"
+STATE_INTERRUPTED = "interrumpido"
+
+
+# Sin publicar durante este tiempo, un envío "enviando" se da por interrumpido
+STALE_AFTER_SECONDS = 30
+
+# Campos de la instantánea que se emiten en los eventos de progreso (SSE)
+PROGRESS_FIELDS = ("campana", "estado", "enviados", "fallidos", "omitidos", "suprimidos", "reintentos",
+                   "tasa_por_segundo", "filas_procesadas", "filas_total", "eta_segundos", "colas", "actualizado")
+
+# Segundos entre eventos de progreso: los cambios dentro de un tick se agrupan en un solo evento
+PROGRESS_TICK_SECONDS = 1.0
+
+# Sin cambios durante este tiempo se manda un comentario para mantener viva la conexión
+PROGRESS_KEEPALIVE_SECONDS = 15
+
+
+def read_metrics(path=METRICS_FILE):
+    """
+    Última instantánea publicada por el sender, o None si no hay. Si el sender
+    dejó de publicar sin cerrar (proceso terminado a la fuerza) el estado pasa
+    a "interrumpido".
+    """
+    try:
+        with open(path, "r", encoding="utf-8") as file:
+            snapshot = json.load(file)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return None
+    if snapshot.get("estado") == STATE_SENDING and time.time() - snapshot.get("actualizado", 0) > STALE_AFTER_SECONDS:
+        snapshot["estado"] = STATE_INTERRUPTED
+    return snapshot
+
+
+def progress_event(snapshot):
+    """Datos de un evento de progreso a partir de una instantánea (o "sin_datos")."""
+    if snapshot is None:
+        return {"estado": "sin_datos"}
+    return {key: snapshot.get(key) for key in PROGRESS_FIELDS}
+
+
+def sse_frame(event_id, data, event="progreso"):
+    """Evento Server-Sent Events ya codificado, listo para mandarlo a cualquier cliente."""
+    payload = json.dumps(data, ensure_ascii=False)
+    return f"id: {event_id}\nevent: {event}\ndata: {payload}\n\n".encode("utf-8")
+
+
+SSE_KEEPALIVE = b": keepalive\n\n"
+
+# Milisegundos que espera el navegador antes de reconectar si se corta el stream
+SSE_RETRY = b"retry: 3000\n\n"
+
+
+class LiveMetrics:
+    """
+    Métricas en vivo de un envío: correos enviados y fallidos, tasa actual, histograma
+    de latencia de las transacciones SMTP, reconexiones, profundidad de las colas y
+    ETA. Un hilo escribe una instantánea en `path` cada WRITE_INTERVAL segundos
+    (archivo temporal + rename) para que api.py la lea sin tocar el proceso.
+    """
+
+    def __init__(self, campaign_name, counts, path=METRICS_FILE):
+        self.path = path
+        self.campaign_name = campaign_name
+        # Diccionario de contadores de CampaignRun (enviados, fallidos, ...)
+        self.counts = counts
+        self.started = time.time()
+        self._monotonic_start = time.monotonic()
+        self.latency_buckets = [0] * (len(LATENCY_BUCKETS) + 1)
+        self.latency_sum = 0.0
+        self.latency_count = 0
+        self.reconnects = 0
+        self.queues = {}
+        self.progress = None
+        # Métricas del envío conjunto a las que también se suma esta (varias campañas a la vez)
+        self.parent = None
+        self._sent_times = deque()
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def observe_send(self, seconds, sent):
+        """Registra la duración de una transacción SMTP."""
+        now = time.monotonic()
+        with self._lock:
+            self.latency_buckets[bisect_left(LATENCY_BUCKETS, seconds)] += 1
+            self.latency_sum += seconds
+            self.latency_count += 1
+            if sent:
+                self._sent_times.append(now)
+        if self.parent:
+            self.parent.observe_send(seconds, sent)
+
+    def reconnected(self, count=1):
+        with self._lock:
+            self.reconnects += count
+        if self.parent:
+            self.parent.reconnected(count)
+
+    def track_queue(self, name, size):
+        """`size()` devuelve cuántos elementos esperan en la cola `name`."""
+        self.queues[name] = size
+
+    def track_progress(self, progress):
+        """`progress()` devuelve (filas procesadas, filas totales)."""
+        self.progress = progress
+
+    def _rate(self, now):
+        cutoff = now - RATE_WINDOW_SECONDS
+        while self._sent_times and self._sent_times[0] < cutoff:
+            self._sent_times.popleft()
+        window = min(RATE_WINDOW_SECONDS, now - self._monotonic_start)
+        return len(self._sent_times) / window if window > 0 else 0.0
+
+    def snapshot(self, state=STATE_SENDING):
+        now = time.monotonic()
+        with self._lock:
+            rate = self._rate(now)
+            buckets = list(self.latency_buckets)
+            latency_sum, latency_count, reconnects = self.latency_sum, self.latency_count, self.reconnects
+        queues = {}
+        for name, size in list(self.queues.items()):
+            try:
+                queues[name] = size()
+            except Exception:
+                queues[name] = None
+        processed, total = self.progress() if self.progress else (None, None)
+        remaining = None if total is None else max(0, total - processed) + (queues.get("reintentos") or 0)
+        eta = None
+        if state == STATE_SENDING and remaining is not None and rate > 0:
+            eta = round(remaining / rate)
+        cumulative, histogram = 0, []
+        for bound, count in zip(LATENCY_BUCKETS + ("+Inf",), buckets):
+            cumulative += count
+            histogram.append([bound, cumulative])
+        return {
+            "campana": self.campaign_name,
+            "estado": state,
+            "pid": os.getpid(),
+            "inicio": round(self.started, 3),
+            "actualizado": round(time.time(), 3),
+            **dict(self.counts),
+            "reconexiones": reconnects,
+            "tasa_por_segundo": round(rate, 3),
+            "colas": queues,
+            "filas_procesadas": processed,
+            "filas_total": total,
+            "eta_segundos": eta,
+            "latencia_segundos": {"buckets": histogram, "suma": round(latency_sum, 6), "cuenta": latency_count},
+        }
+
+    def write(self, state=STATE_SENDING):
+        snapshot = self.snapshot(state)
+        with atomic_write(self.path) as file:
+            json.dump(snapshot, file, ensure_ascii=False)
+
+    def _run(self):
+        while not self._stop.wait(WRITE_INTERVAL):
+            try:
+                self.write()
+            except Exception as e:
+                logging.warning(f"No se pudieron publicar las métricas en vivo: {e}")
+
+    def start(self):
+        self.write()
+        self._thread = threading.Thread(target=self._run, name="metricas", daemon=True)
+        self._thread.start()
+
+    def close(self):
+        """Detiene el hilo y deja publicada la instantánea final."""
+        self._stop.set()
+        if self._thread:
+            self._thread.join()
+        self.write(STATE_FINISHED)
+
+
+def label_value(value):
+    """Valor de una etiqueta de Prometheus con \\, " y los saltos de línea escapados."""
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def prometheus_text(snapshot):
+    """Convierte una instantánea de métricas al formato de texto de Prometheus."""
+    lines = []
+
+    def metric(name, kind, help_text, samples):
+        lines.append(f"# HELP {name} {help_text}")
+        lines.append(f"# TYPE {name} {kind}")
+        for labels, value in samples:
+            label_text = ",".join(f'{key}="{label_value(val)}"' for key, val in labels.items())
+            lines.append(f"{name}{{{label_text}}} {value}" if label_text else f"{name} {value}")
+
+    if snapshot is None:
+        metric("envio_activo", "gauge", "1 mientras un envío está en curso.", [({}, 0)])
+        return "\n".join(lines) + "\n"
+
+    campaign = {"campana": snapshot.get("campana", "")}
+    metric("envio_activo", "gauge", "1 mientras un envío está en curso.",
+           [(campaign, int(snapshot.get("estado") == STATE_SENDING))])
+    for key, help_text in (("enviados", "Correos enviados en este envío."),
+                           ("fallidos", "Correos fallidos en este envío."),
+                           ("omitidos", "Filas omitidas por correo inválido."),
+                           ("suprimidos", "Filas omitidas por la lista de supresión."),
+                           ("reintentos", "Correos enviados a la cola de reintentos."),
+                           ("reconexiones", "Reconexiones SMTP.")):
+        metric(f"envio_{key}_total", "counter", help_text, [(campaign, snapshot.get(key, 0))])
+    metric("envio_tasa_por_segundo", "gauge", "Correos enviados por segundo (último minuto).",
+           [(campaign, snapshot.get("tasa_por_segundo", 0))])
+    metric("envio_cola_profundidad", "gauge", "Elementos esperando en cada cola.",
+           [({**campaign, "cola": name}, size) for name, size in snapshot.get("colas", {}).items() if size is not None])
+    if snapshot.get("filas_total") is not None:
+        metric("envio_filas_total", "gauge", "Filas de la lista.", [(campaign, snapshot["filas_total"])])
+        metric("envio_filas_procesadas", "gauge", "Filas ya procesadas.", [(campaign, snapshot["filas_procesadas"])])
+    if snapshot.get("eta_segundos") is not None:
+        metric("envio_eta_segundos", "gauge", "Tiempo estimado para terminar.", [(campaign, snapshot["eta_segundos"])])
+    metric("envio_actualizado_timestamp_segundos", "gauge", "Última publicación de métricas.",
+           [(campaign, snapshot.get("actualizado", 0))])
+
+    latency = snapshot.get("latencia_segundos", {})
+    name = "envio_smtp_latencia_segundos"
+    lines.append(f"# HELP {name} Duración de cada transacción SMTP.")
+    lines.append(f"# TYPE {name} histogram")
+    label_text = f'campana="{label_value(campaign["campana"])}"'
+    for bound, count in latency.get("buckets", []):
+        lines.append(f'{name}_bucket{{{label_text},le="{bound}"}} {count}')
+    lines.append(f"{name}_sum{{{label_text}}} {latency.get('suma', 0)}")
+    lines.append(f"{name}_count{{{label_text}}} {latency.get('cuenta', 0)}")
+    return "\n".join(lines) + "\n"
@@ -3,6 +3,10 @@ import logging
 import os
 import secrets
 import shutil
+import itertools
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
 from datetime import datetime
 from functools import wraps
 from pathlib import Path
@@ -11,6 +15,7 @@ from typing import Dict, List, Tuple
 from dotenv import dotenv_values
 from flask import (
     Flask,
+    Response,
     abort,
     flash,
     redirect,
@@ -23,20 +28,49 @@ from flask import (
 from werkzeug.security import check_password_hash
 from werkzeug.utils import secure_filename
 
+from live_metrics import (
+    PROGRESS_KEEPALIVE_SECONDS,
+    PROGRESS_TICK_SECONDS,
+    SSE_KEEPALIVE,
+    SSE_RETRY,
+    progress_event,
+    read_metrics,
+    sse_frame,
+)
+from html_minifier import minify_cached, remove_cache as remove_minified_cache
+from recipient_cache import RecipientCache, build_cache_logged, remove_cache
+from recipient_reader import CSV_EXTENSIONS, EXCEL_EXTENSIONS, RecipientReader
+from suppression import SuppressionList, add_addresses
+
 BASE_DIR = Path(__file__).resolve().parent
 CONFIG_PATH = BASE_DIR / "config.json"
 ENV_PATH = BASE_DIR / ".env"
 TEMPLATES_DIR = BASE_DIR / "templates"
 DATA_DIR = BASE_DIR / "data"
 TRASH_DIR = BASE_DIR / "trash"
+SUPPRESSION_DIR = DATA_DIR / "supresion"
+METRICS_PATH = BASE_DIR / "contador" / "metricas.json"
 
 MANAGED_DIRECTORIES = {
     "templates": TEMPLATES_DIR,
     "data": DATA_DIR,
 }
+# Segundos tras los que el índice de una carpeta se rehace aunque la carpeta no cambie
+# (archivos editados en el sitio fuera del panel)
+INDEX_MAX_AGE_SECONDS = 30
+FILES_PER_PAGE = 50
+PREVIEW_ROWS_PER_PAGE = 50
+MAX_FILES_PER_PAGE = 500
+SORT_KEYS = {
+    "nombre": lambda item: item["name"].lower(),
+    "tamano": lambda item: item["size"],
+    "fecha": lambda item: item["modified"],
+}
+
 ALLOWED_EXTENSIONS = {
     "templates": {".html", ".htm"},
-    "data": {".xlsx", ".xls"},
+    # Las que sabe leer RecipientReader (.xls no: openpyxl no lo abre)
+    "data": EXCEL_EXTENSIONS | CSV_EXTENSIONS,
 }
 
 SMTP_ENV_KEYS = {
@@ -196,25 +230,114 @@ def inject_csrf_token():
     return {"csrf_token": get_csrf_token()}
 
 
-def list_section_files(section: str) -> List[Dict]:
-    folder = MANAGED_DIRECTORIES[section]
-    files = []
+class DirectoryIndex:
+    """
+    Listado en memoria de los archivos de una carpeta del panel, para no hacer
+    iterdir() y stat() de todo en cada página.
+
+    Se rehace cuando cambia la fecha de modificación de la carpeta (archivo
+    creado, borrado o renombrado), cuando el propio panel modifica un archivo
+    (`invalidate`) y, para ediciones hechas fuera del panel, como mucho cada
+    INDEX_MAX_AGE_SECONDS. Los ordenamientos se calculan una vez por versión.
+    """
+
+    def __init__(self, folder: Path, editable: bool = False):
+        self.folder = folder
+        self.editable = editable
+        self._signature = None
+        self._built = 0.0
+        self._entries: List[Dict] = []
+        self._sorted: Dict[Tuple[str, bool], List[Dict]] = {}
+        self._lock = threading.Lock()
+
+    def invalidate(self) -> None:
+        with self._lock:
+            self._signature = None
+
+    def _scan(self) -> List[Dict]:
+        entries = []
+        with os.scandir(self.folder) as iterator:
+            for entry in iterator:
+                if not entry.is_file():
+                    continue
+                stat = entry.stat()
+                suffix = Path(entry.name).suffix.lower()
+                entries.append(
+                    {
+                        "name": entry.name,
+                        "suffix": suffix,
+                        "size": stat.st_size,
+                        "modified": datetime.fromtimestamp(stat.st_mtime),
+                        "editable": self.editable and suffix in {".html", ".htm"},
+                    }
+                )
+        return entries
+
+    def entries(self) -> List[Dict]:
+        try:
+            signature = self.folder.stat().st_mtime_ns
+        except FileNotFoundError:
+            signature = None
+        with self._lock:
+            expired = time.monotonic() - self._built > INDEX_MAX_AGE_SECONDS
+            if signature != self._signature or expired:
+                self._entries = self._scan() if signature is not None else []
+                self._sorted = {}
+                self._signature = signature
+                self._built = time.monotonic()
+            return self._entries
+
+    def count(self) -> int:
+        return len(self.entries())
+
+    def names(self, extensions=None) -> List[str]:
+        return sorted(item["name"] for item in self.entries() if extensions is None or item["suffix"] in extensions)
+
+    def sorted_entries(self, sort: str = "fecha", descending: bool = True) -> List[Dict]:
+        entries = self.entries()
+        key = (sort, descending)
+        with self._lock:
+            ordered = self._sorted.get(key)
+            if ordered is None or self._entries is not entries:
+                ordered = sorted(entries, key=SORT_KEYS[sort], reverse=descending)
+                if self._entries is entries:
+                    self._sorted[key] = ordered
+            return ordered
+
+    def page(self, query: str = "", sort: str = "fecha", descending: bool = True, page: int = 1,
+             per_page: int = FILES_PER_PAGE) -> Tuple[List[Dict], int]:
+        """Página `page` de los archivos cuyo nombre contiene `query`, y el total que coincide."""
+        ordered = self.sorted_entries(sort, descending)
+        if query:
+            needle = query.lower()
+            ordered = [item for item in ordered if needle in item["name"].lower()]
+        start = (page - 1) * per_page
+        return ordered[start:start + per_page], len(ordered)
+
+
+DIRECTORY_INDEXES = {
+    section: DirectoryIndex(folder, editable=section == "templates") for section, folder in MANAGED_DIRECTORIES.items()
+}
 
-    for path in folder.iterdir():
-        if not path.is_file():
-            continue
-        stat = path.stat()
-        files.append(
-            {
-                "name": path.name,
-                "size": stat.st_size,
-                "modified": datetime.fromtimestamp(stat.st_mtime),
-                "editable": section == "templates" and path.suffix.lower() in {".html", ".htm"},
-            }
-        )
+# Conversión de listas Excel a la caché columnar, de una en una y en segundo plano
+cache_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="cache")
+cache_jobs: Dict[str, Future] = {}
+
+
+def schedule_cache(path: Path) -> None:
+    if path.suffix.lower() in EXCEL_EXTENSIONS:
+        cache_jobs[path.name] = cache_executor.submit(build_cache_logged, str(path))
 
-    files.sort(key=lambda item: item["modified"], reverse=True)
-    return files
+
+def cache_status(path: Path) -> str:
+    job = cache_jobs.get(path.name)
+    if job is not None and not job.done():
+        return "generando"
+    cache = RecipientCache.open(str(path))
+    if cache is None:
+        return "sin caché"
+    cache.close()
+    return "lista"
 
 
 def get_safe_file_path(section: str, filename: str) -> Path:
@@ -289,14 +412,73 @@ def logout():
     return redirect(url_for("login"))
 
 
+class ProgressBroadcaster:
+    """
+    Progreso del envío en curso para todos los navegadores conectados al panel.
+
+    Un solo hilo (vivo solo mientras haya suscriptores) lee las métricas cada
+    PROGRESS_TICK_SECONDS y, si cambiaron, codifica un único evento que comparten
+    todos los clientes. Cada cliente recibe siempre el último evento: uno lento se
+    salta los intermedios en vez de acumularlos.
+    """
+
+    def __init__(self, path: Path, tick: float = PROGRESS_TICK_SECONDS):
+        self.path = path
+        self.tick = tick
+        self.event_id = 0
+        self.frame = b""
+        self.subscribers = 0
+        self._data = None
+        self._thread = None
+        self._changed = threading.Condition()
+
+    def _run(self) -> None:
+        while True:
+            with self._changed:
+                if not self.subscribers:
+                    self._thread = None
+                    return
+            data = progress_event(read_metrics(self.path))
+            if data != self._data:
+                self._data = data
+                with self._changed:
+                    self.event_id += 1
+                    self.frame = sse_frame(self.event_id, data)
+                    self._changed.notify_all()
+            time.sleep(self.tick)
+
+    def stream(self):
+        with self._changed:
+            self.subscribers += 1
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="progreso", daemon=True)
+                self._thread.start()
+        try:
+            yield SSE_RETRY
+            seen = 0
+            while True:
+                with self._changed:
+                    if self.event_id == seen:
+                        self._changed.wait(PROGRESS_KEEPALIVE_SECONDS)
+                    frame, current = self.frame, self.event_id
+                if current != seen:
+                    seen = current
+                    yield frame
+                else:
+                    yield SSE_KEEPALIVE
+        finally:
+            with self._changed:
+                self.subscribers -= 1
+
+
+progress_broadcaster = ProgressBroadcaster(METRICS_PATH)
+
+
 @app.route("/")
 @login_required
 def dashboard():
     config = load_config()
-    files_summary = {
-        section: len([p for p in MANAGED_DIRECTORIES[section].iterdir() if p.is_file()])
-        for section in MANAGED_DIRECTORIES
-    }
+    files_summary = {section: index.count() for section, index in DIRECTORY_INDEXES.items()}
     return render_template(
         "dashboard.html",
         config=config,
@@ -305,17 +487,48 @@ def dashboard():
     )
 
 
+@app.route("/progreso/stream")
+@login_required
+def progress_stream():
+    return Response(
+        progress_broadcaster.stream(),
+        mimetype="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
 @app.route("/files/<section>")
 @login_required
 def files(section: str):
     if section not in MANAGED_DIRECTORIES:
         abort(404)
 
+    query = request.args.get("q", "").strip()
+    sort = request.args.get("orden", "fecha")
+    if sort not in SORT_KEYS:
+        sort = "fecha"
+    descending = request.args.get("dir", "desc" if sort != "nombre" else "asc") == "desc"
+    per_page = min(max(request.args.get("por_pagina", FILES_PER_PAGE, type=int) or FILES_PER_PAGE, 1), MAX_FILES_PER_PAGE)
+    page = max(request.args.get("pagina", 1, type=int) or 1, 1)
+
+    items, total = DIRECTORY_INDEXES[section].page(query, sort, descending, page, per_page)
+    pages = max(1, -(-total // per_page))
+    if page > pages:
+        items, total = DIRECTORY_INDEXES[section].page(query, sort, descending, pages, per_page)
+        page = pages
+
     return render_template(
         "files.html",
         section=section,
         section_title="Templates HTML" if section == "templates" else "Archivos Excel",
-        files=list_section_files(section),
+        files=items,
+        total=total,
+        page=page,
+        pages=pages,
+        per_page=per_page,
+        query=query,
+        sort=sort,
+        descending=descending,
         extensions=", ".join(sorted(ALLOWED_EXTENSIONS[section])),
     )
 
@@ -348,6 +561,9 @@ def upload_file(section: str):
         return redirect(url_for("files", section=section))
 
     uploaded_file.save(target_path)
+    DIRECTORY_INDEXES[section].invalidate()
+    if section == "data":
+        schedule_cache(target_path)
     flash(f"Archivo {filename} subido correctamente.", "success")
     return redirect(url_for("files", section=section))
 
@@ -370,6 +586,10 @@ def delete_file(section: str, filename: str):
     timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
     destination = trash_section / f"{timestamp}_{source_path.name}"
     source_path.replace(destination)
+    if section == "data":
+        remove_cache(str(source_path))
+    elif section == "templates":
+        remove_minified_cache(str(source_path))
 
     flash(f"Archivo movido a papelera: {destination.name}", "success")
     return redirect(url_for("files", section=section))
@@ -420,6 +640,7 @@ def edit_template(filename: str):
         validate_csrf()
         content = request.form.get("content", "")
         template_path.write_text(content, encoding="utf-8")
+        DIRECTORY_INDEXES["templates"].invalidate()
         flash(f"Template {template_path.name} guardado.", "success")
         return redirect(url_for("edit_template", filename=template_path.name))
 
@@ -436,8 +657,61 @@ def view_template(filename: str):
     if not template_path.exists() or not template_path.is_file():
         abort(404)
 
+    # Por defecto se muestra la versión minificada, que es la que se envía
     content = template_path.read_text(encoding="utf-8")
-    return render_template("view_template.html", filename=template_path.name, content=content)
+    original_bytes = len(content.encode("utf-8"))
+    minify = load_config().get("minificar_html", False)
+    show_original = request.args.get("original") == "1"
+    if minify and not show_original:
+        content = minify_cached(str(template_path), content)
+    return render_template(
+        "view_template.html", filename=template_path.name, content=content, minify=minify,
+        show_original=show_original, original_bytes=original_bytes, content_bytes=len(content.encode("utf-8")),
+    )
+
+
+@app.route("/files/data/preview/<filename>")
+@login_required
+def preview_data(filename: str):
+    list_path = get_safe_file_path("data", filename)
+    if not list_path.exists() or not list_path.is_file():
+        abort(404)
+    page = max(request.args.get("pagina", 1, type=int) or 1, 1)
+    start = (page - 1) * PREVIEW_ROWS_PER_PAGE
+    cache_state = cache_status(list_path) if list_path.suffix.lower() in EXCEL_EXTENSIONS else None
+    if cache_state == "generando":
+        # No se abre el libro mientras se convierte: la vista previa sale de la caché en unos segundos
+        return render_template(
+            "preview_data.html", filename=list_path.name, columns=[], rows=[], first_row=start + 1,
+            total=0, page=1, pages=1, cache_state=cache_state, content_hash=None,
+        )
+
+    # Con la caché se lee solo la página pedida; sin ella (CSV o libro sin
+    # convertir) el archivo se recorre en streaming hasta el final de la página
+    reader = None
+    try:
+        reader = RecipientReader(str(list_path))
+        total = reader.count()
+        rows = list(itertools.islice(reader.raw_rows(start), PREVIEW_ROWS_PER_PAGE))
+    except (ValueError, OSError) as e:
+        flash(f"No se pudo leer {list_path.name}: {e}", "danger")
+        return redirect(url_for("files", section="data"))
+    finally:
+        if reader is not None and reader.cache:
+            reader.cache.close()
+
+    return render_template(
+        "preview_data.html",
+        filename=list_path.name,
+        columns=reader.columns,
+        rows=rows,
+        first_row=start + 1,
+        total=total,
+        page=page,
+        pages=max(1, -(-total // PREVIEW_ROWS_PER_PAGE)),
+        cache_state=cache_state,
+        content_hash=reader.cache.header.get("sha256") if reader.cache else None,
+    )
 
 
 @app.route("/config", methods=["GET", "POST"])
@@ -495,10 +769,8 @@ def config():
 
     env_values = read_env()
 
-    data_files = sorted([p.name for p in DATA_DIR.iterdir() if p.is_file() and p.suffix.lower() in ALLOWED_EXTENSIONS["data"]])
-    template_files = sorted(
-        [p.name for p in TEMPLATES_DIR.iterdir() if p.is_file() and p.suffix.lower() in ALLOWED_EXTENSIONS["templates"]]
-    )
+    data_files = DIRECTORY_INDEXES["data"].names(ALLOWED_EXTENSIONS["data"])
+    template_files = DIRECTORY_INDEXES["templates"].names(ALLOWED_EXTENSIONS["templates"])
 
     selected_excel = Path(current_config.get("excel_file", "")).name
     selected_template = Path(current_config.get("body_file", "")).name
@@ -521,6 +793,47 @@ def config():
     )
 
 
+@app.route("/supresion", methods=["GET", "POST"])
+@login_required
+def suppression():
+    suppression_list = SuppressionList(directory=str(SUPPRESSION_DIR))
+
+    if request.method == "POST":
+        validate_csrf()
+        action = request.form.get("action")
+
+        if action == "add":
+            emails = request.form.get("emails", "").replace(",", "\n").splitlines()
+            added = add_addresses(emails, directory=str(SUPPRESSION_DIR))
+            if added:
+                flash(f"{added} dirección(es) añadidas a la lista de supresión.", "success")
+            else:
+                flash("No se encontró ninguna dirección válida.", "warning")
+
+        elif action == "check":
+            email = request.form.get("email", "").strip()
+            try:
+                found = suppression_list.load() and email in suppression_list
+            finally:
+                suppression_list.close()
+            flash(f"{email} {'está' if found else 'no está'} en la lista de supresión.", "info")
+
+        else:
+            flash("Acción no reconocida.", "warning")
+
+        return redirect(url_for("suppression"))
+
+    sources = [
+        {"name": entry.name, "size": entry.stat().st_size}
+        for entry in suppression_list.sources()
+    ]
+    return render_template(
+        "supresion.html",
+        sources=sources,
+        indexed_total=suppression_list.read_meta().get("total"),
+    )
+
+
 if __name__ == "__main__":
     host = os.getenv("PANEL_HOST") or _boot_env.get("PANEL_HOST") or "127.0.0.1"
     port = int(os.getenv("PANEL_PORT") or _boot_env.get("PANEL_PORT") or "5000")
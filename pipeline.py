@@ -0,0 +1,193 @@
+import asyncio
+import logging
+import queue
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+# Destinatarios por lote enviado a los procesos de render
+RENDER_BATCH = 32
+
+# Lotes en vuelo por proceso de render (más allá, el lector espera)
+BATCHES_PER_PROCESS = 2
+
+# Segundos entre informes de utilización en el log
+LOG_INTERVAL = 30
+
+READ_STAGE = "lectura"
+RENDER_STAGE = "render"
+SEND_STAGE = "envio"
+
+
+class PipelineStats:
+    """
+    Utilización de cada etapa del envío (lectura, render, envío): tiempo ocupado
+    sumado entre sus workers dividido entre el tiempo transcurrido por el número
+    de workers. Una etapa cerca del 100 % es el cuello de botella.
+    """
+
+    def __init__(self):
+        self.started = time.monotonic()
+        self.workers = {}
+        self.busy = {}
+        self.items = {}
+        self._last_log = self.started
+        self._lock = threading.Lock()
+
+    def configure(self, stage, workers):
+        with self._lock:
+            self.workers[stage] = max(1, workers)
+            self.busy.setdefault(stage, 0.0)
+            self.items.setdefault(stage, 0)
+
+    def add(self, stage, seconds, count=1):
+        with self._lock:
+            self.busy[stage] = self.busy.get(stage, 0.0) + seconds
+            self.items[stage] = self.items.get(stage, 0) + count
+
+    def timed(self, items, stage=READ_STAGE):
+        """Recorre `items` sumando a `stage` el tiempo que tarda cada elemento en llegar."""
+        iterator = iter(items)
+        while True:
+            start = time.perf_counter()
+            try:
+                item = next(iterator)
+            except StopIteration:
+                return
+            if not isinstance(item, float):
+                self.add(stage, time.perf_counter() - start)
+            yield item
+
+    def maybe_log(self, queues=()):
+        now = time.monotonic()
+        if now - self._last_log >= LOG_INTERVAL:
+            self._last_log = now
+            self.log(queues)
+
+    def log(self, queues=()):
+        elapsed = max(time.monotonic() - self.started, 1e-9)
+        with self._lock:
+            parts = [
+                f"{stage} {100 * self.busy[stage] / (elapsed * self.workers[stage]):.0f}% "
+                f"({self.items[stage]} en {self.workers[stage]} worker(s))"
+                for stage in self.workers
+            ]
+        for name, stage_queue in queues:
+            parts.append(f"cola {name} {stage_queue.qsize()}/{stage_queue.maxsize}")
+        logging.info(f"Utilización por etapa: {', '.join(parts)}.")
+
+
+# Estado de cada proceso de render (se crea una vez por proceso)
+_builder = None
+
+
+def _init_render(builder):
+    global _builder
+    _builder = builder
+
+
+def _render_batch(batch):
+    start = time.perf_counter()
+    payloads = [_builder.render(to_email, fields) for to_email, fields in batch]
+    return payloads, time.perf_counter() - start
+
+
+class RenderStage:
+    """
+    Etapa de render en procesos: agrupa los elementos en lotes de RENDER_BATCH,
+    los renderiza con `builder.render` en un ProcessPoolExecutor y entrega
+    (elemento, bytes) a `deliver` en el mismo orden en que llegaron.
+
+    La cola de lotes en vuelo está acotada: si el render o el envío no dan abasto,
+    `put` se bloquea y el lector deja de leer filas.
+    """
+
+    def __init__(self, builder, processes, deliver, stats):
+        self.executor = ProcessPoolExecutor(processes, initializer=_init_render, initargs=(builder,))
+        self.deliver = deliver
+        self.stats = stats
+        self.pending = queue.Queue(maxsize=processes * BATCHES_PER_PROCESS)
+        self.batch = []
+        stats.configure(RENDER_STAGE, processes)
+        self.collector = threading.Thread(target=self._collect, name="render", daemon=True)
+        self.collector.start()
+
+    def put(self, item):
+        self.batch.append(item)
+        if len(self.batch) >= RENDER_BATCH:
+            self.flush()
+
+    def flush(self):
+        """Manda a renderizar el lote a medias (p. ej. antes de que el lector espere)."""
+        if self.batch:
+            batch, self.batch = self.batch, []
+            args = [(str(recipient.email or ""), recipient.fields) for recipient, _attempt in batch]
+            self.pending.put((batch, self.executor.submit(_render_batch, args)))
+
+    def _collect(self):
+        while True:
+            entry = self.pending.get()
+            if entry is None:
+                break
+            batch, future = entry
+            try:
+                payloads, seconds = future.result()
+                self.stats.add(RENDER_STAGE, seconds, len(batch))
+            except Exception as e:
+                # Sin bytes pre-renderizados el worker de envío renderiza por su cuenta
+                logging.error(f"Error en el proceso de render: {e}")
+                payloads = [None] * len(batch)
+            for item, payload in zip(batch, payloads):
+                self.deliver((item, payload))
+
+    def close(self):
+        self.flush()
+        self.pending.put(None)
+        self.collector.join()
+        self.executor.shutdown()
+
+
+class AsyncRenderStage(RenderStage):
+    """Equivalente asyncio de RenderStage: `deliver` es una corrutina."""
+
+    def __init__(self, builder, processes, deliver, stats):
+        self.executor = ProcessPoolExecutor(processes, initializer=_init_render, initargs=(builder,))
+        self.deliver = deliver
+        self.stats = stats
+        self.pending = asyncio.Queue(maxsize=processes * BATCHES_PER_PROCESS)
+        self.batch = []
+        stats.configure(RENDER_STAGE, processes)
+        self.collector = asyncio.create_task(self._collect())
+
+    async def put(self, item):
+        self.batch.append(item)
+        if len(self.batch) >= RENDER_BATCH:
+            await self.flush()
+
+    async def flush(self):
+        if self.batch:
+            batch, self.batch = self.batch, []
+            args = [(str(recipient.email or ""), recipient.fields) for recipient, _attempt in batch]
+            future = asyncio.get_running_loop().run_in_executor(self.executor, _render_batch, args)
+            await self.pending.put((batch, future))
+
+    async def _collect(self):
+        while True:
+            entry = await self.pending.get()
+            if entry is None:
+                break
+            batch, future = entry
+            try:
+                payloads, seconds = await future
+                self.stats.add(RENDER_STAGE, seconds, len(batch))
+            except Exception as e:
+                logging.error(f"Error en el proceso de render: {e}")
+                payloads = [None] * len(batch)
+            for item, payload in zip(batch, payloads):
+                await self.deliver((item, payload))
+
+    async def close(self):
+        await self.flush()
+        await self.pending.put(None)
+        await self.collector
+        self.executor.shutdown()
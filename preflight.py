@@ -0,0 +1,89 @@
+import logging
+import os
+
+# Mismo criterio que sender.is_valid_email, aplicado sobre direcciones ya en minúsculas
+EMAIL_PATTERN = r"[a-z0-9._%+-]+@[a-z0-9.-]+\.[a-z]{2,}"
+
+REPORTS_DIR = "reportes"
+
+REASON_EMPTY = "vacio"
+REASON_INVALID = "invalido"
+REASON_DUPLICATE = "duplicado"
+
+
+class PreflightResult:
+    """
+    Resultado de la validación previa: qué filas se envían y su dirección normalizada.
+    `keep` es un array booleano indexado por fila (0 = primera fila de datos).
+    """
+
+    def __init__(self, keep, normalized, counts, report_path):
+        self.keep = keep
+        self.normalized = normalized
+        self.counts = counts
+        self.report_path = report_path
+
+    def filter(self, rows, on_rejected):
+        """
+        Deja pasar solo los destinatarios válidos y no duplicados, con el correo
+        normalizado. `on_rejected(index)` se llama por cada fila descartada.
+        """
+        keep = self.keep
+        normalized = self.normalized
+        for recipient in rows:
+            if keep[recipient.index]:
+                yield recipient._replace(email=normalized[recipient.index])
+            else:
+                on_rejected(recipient.index)
+
+
+def run_preflight(reader, report_dir=REPORTS_DIR):
+    """
+    Valida, normaliza (trim + minúsculas) y deduplica toda la columna de correos
+    en una sola pasada vectorizada, antes de abrir ninguna conexión. Las filas
+    rechazadas se escriben en un CSV de `report_dir`.
+    """
+    # pandas tarda en importarse; solo se carga cuando de verdad se valida una lista
+    import numpy as np
+    import pandas as pd
+
+    emails = pd.Series(reader.column(reader.email_column), dtype=object)
+    is_text = emails.map(type).eq(str).to_numpy()
+    normalized = emails.where(is_text, "").astype(str).str.strip().str.lower()
+
+    empty = normalized.eq("").to_numpy()
+    valid = normalized.str.fullmatch(EMAIL_PATTERN).to_numpy(dtype=bool)
+    duplicate = valid & normalized.duplicated(keep="first").to_numpy()
+    keep = valid & ~duplicate
+
+    reasons = np.select(
+        [empty, ~valid, duplicate],
+        [REASON_EMPTY, REASON_INVALID, REASON_DUPLICATE],
+        default="",
+    )
+    counts = {
+        "validos": int(keep.sum()),
+        REASON_EMPTY: int(empty.sum()),
+        REASON_INVALID: int((~valid & ~empty).sum()),
+        REASON_DUPLICATE: int(duplicate.sum()),
+    }
+
+    report_path = None
+    rejected = ~keep
+    if rejected.any():
+        os.makedirs(report_dir, exist_ok=True)
+        name = os.path.splitext(os.path.basename(reader.path))[0]
+        report_path = os.path.join(report_dir, f"{name}_rechazados.csv")
+        positions = np.flatnonzero(rejected)
+        pd.DataFrame({
+            "linea": positions + 2,
+            "email": emails.iloc[positions].to_numpy(),
+            "motivo": reasons[positions],
+        }).to_csv(report_path, index=False)
+
+    logging.info(
+        f"Validación previa: {counts['validos']} válidos, {counts[REASON_INVALID]} inválidos, "
+        f"{counts[REASON_EMPTY]} vacíos, {counts[REASON_DUPLICATE]} duplicados."
+        + (f" Informe de rechazados: {report_path}" if report_path else "")
+    )
+    return PreflightResult(keep, normalized.to_numpy(), counts, report_path)
@@ -0,0 +1,133 @@
+import asyncio
+import logging
+import threading
+import time
+
+# Códigos SMTP con los que el relay pide bajar el ritmo
+THROTTLE_CODES = {421, 451}
+
+PERIOD_SECONDS = {
+    "segundo": 1,
+    "minuto": 60,
+    "hora": 3600,
+}
+
+# Cada cuántos segundos se informa la tasa actual en el log
+LOG_INTERVAL = 30
+
+
+class RateLimiter:
+    """
+    Token bucket compartido por todos los workers de envío (hilos o tareas asyncio).
+
+    La tasa objetivo se fija en mensajes por segundo. Ante respuestas 421/451 la tasa
+    se reduce a la mitad (como mucho una vez por `backoff_interval`) y con cada envío
+    exitoso se recupera gradualmente hasta volver al objetivo.
+    """
+
+    def __init__(self, rate, burst=1, min_rate=None, ramp_successes=50, backoff_interval=2.0):
+        self.target_rate = float(rate)
+        self.rate = self.target_rate
+        self.min_rate = min_rate or self.target_rate / 64
+        self.capacity = max(1.0, float(burst))
+        self.ramp_step = self.target_rate / ramp_successes
+        self.backoff_interval = backoff_interval
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.last_backoff = 0.0
+        self.last_log = self.updated
+        self.acquired_since_log = 0
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_config(cls, config, pool_size=1):
+        """
+        Crea el limitador a partir de `tasa_envio` en config.json, p. ej.
+        {"mensajes": 20, "por": "segundo"}. Si no existe, se deriva de
+        `delay_segundos` (un correo cada `delay` segundos por conexión).
+        Devuelve None si no hay límite.
+        """
+        tasa = config.get('tasa_envio')
+        if tasa:
+            period = PERIOD_SECONDS.get(tasa.get('por', 'segundo'))
+            if period is None:
+                raise ValueError(f"Periodo de tasa_envio no reconocido: {tasa.get('por')}")
+            rate = float(tasa['mensajes']) / period
+            burst = tasa.get('rafaga', pool_size)
+        else:
+            delay = config.get('delay_segundos', 1)
+            if not delay:
+                return None
+            rate = pool_size / float(delay)
+            burst = pool_size
+        logging.info(f"Limitador de tasa: objetivo {rate:.2f} correos/s.")
+        return cls(rate, burst=burst)
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        return now
+
+    def _reserve(self):
+        """Toma un token y devuelve cuántos segundos hay que esperar para usarlo."""
+        with self._lock:
+            now = self._refill()
+            self.tokens -= 1
+            self.acquired_since_log += 1
+            if now - self.last_log >= LOG_INTERVAL:
+                actual = self.acquired_since_log / (now - self.last_log)
+                logging.info(f"Tasa actual: {self.rate:.2f} correos/s (objetivo {self.target_rate:.2f}, real {actual:.2f}).")
+                self.last_log = now
+                self.acquired_since_log = 0
+            if self.tokens >= 0:
+                return 0.0
+            return -self.tokens / self.rate
+
+    def try_acquire(self):
+        """
+        Toma un token solo si hay uno disponible ya. Devuelve 0 si lo tomó o los
+        segundos que faltan para el siguiente, sin bloquear ni reservar.
+        """
+        with self._lock:
+            self._refill()
+            if self.tokens >= 1:
+                self.tokens -= 1
+                return 0.0
+            return (1 - self.tokens) / self.rate
+
+    def acquire(self):
+        """Bloquea el hilo hasta que se pueda enviar el siguiente correo."""
+        wait = self._reserve()
+        if wait:
+            time.sleep(wait)
+
+    async def acquire_async(self):
+        """Equivalente de acquire() para workers asyncio."""
+        wait = self._reserve()
+        if wait:
+            await asyncio.sleep(wait)
+
+    def on_success(self):
+        if self.rate >= self.target_rate:
+            return
+        with self._lock:
+            self.rate = min(self.target_rate, self.rate + self.ramp_step)
+            if self.rate == self.target_rate:
+                logging.info(f"Tasa de envío recuperada: {self.rate:.2f} correos/s.")
+
+    def on_throttle(self, code):
+        with self._lock:
+            now = time.monotonic()
+            if now - self.last_backoff < self.backoff_interval:
+                return
+            self.last_backoff = now
+            self.rate = max(self.min_rate, self.rate / 2)
+            logging.warning(f"El servidor respondió {code}: reduciendo la tasa de envío a {self.rate:.2f} correos/s.")
+
+    def record(self, sent, error_code):
+        """Ajusta la tasa según el resultado de un envío."""
+        if sent:
+            self.on_success()
+        elif error_code in THROTTLE_CODES:
+            self.on_throttle(error_code)
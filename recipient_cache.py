@@ -0,0 +1,211 @@
+import json
+import logging
+import mmap
+import os
+import struct
+from array import array
+
+from file_utils import atomic_write, file_fingerprint, file_hash
+from template_engine import format_value
+
+CACHE_DIR = ".cache"
+CACHE_SUFFIX = ".rcol"
+MAGIC = b"RCOL1\0"
+HEADER_LENGTH = struct.Struct("<I")
+
+# Tipo de cada celda: así `rows` devuelve los mismos valores que la hoja
+# (el correo como texto, números como números). El resto se guarda como texto.
+KIND_NONE = 0
+KIND_TEXT = 1
+KIND_INT = 2
+KIND_FLOAT = 3
+KIND_OTHER = 4
+
+
+def cache_path_for(path):
+    """Caché de una lista: .cache/<nombre de la lista>.rcol junto a la lista."""
+    return os.path.join(os.path.dirname(path), CACHE_DIR, os.path.basename(path) + CACHE_SUFFIX)
+
+
+class _ColumnWriter:
+    def __init__(self):
+        self.kinds = bytearray()
+        self.offsets = array("Q", [0])
+        self.data = bytearray()
+
+    def add(self, value):
+        if value is None or value == "":
+            kind, text = KIND_NONE, ""
+        elif isinstance(value, str):
+            kind, text = KIND_TEXT, value
+        elif isinstance(value, bool):
+            kind, text = KIND_OTHER, str(value)
+        elif isinstance(value, int):
+            kind, text = KIND_INT, str(value)
+        elif isinstance(value, float):
+            kind, text = KIND_FLOAT, repr(value)
+        else:
+            kind, text = KIND_OTHER, format_value(value)
+        self.kinds.append(kind)
+        self.data += text.encode("utf-8")
+        self.offsets.append(len(self.data))
+
+
+def build_cache(path, reader=None):
+    """
+    Convierte la lista `path` a la caché columnar: por cada columna, el tipo de
+    cada celda, las posiciones de fin de cada valor y los valores en UTF-8 uno
+    tras otro. La cabecera guarda filas, columnas, tamaño y fecha de la lista y
+    su sha256. Se escribe en un temporal y se renombra. Devuelve la cabecera.
+    """
+    from recipient_reader import RecipientReader
+
+    signature = file_fingerprint(path)
+    reader = reader or RecipientReader(path, use_cache=False)
+    columns = reader.columns
+    writers = [_ColumnWriter() for _ in columns]
+    rows = 0
+    for values in reader.raw_rows(0):
+        for position, writer in enumerate(writers):
+            writer.add(values[position] if position < len(values) else None)
+        rows += 1
+
+    blocks = []
+    offset = 0
+    for writer in writers:
+        # Cada bloque y sus posiciones empiezan alineados a 8 para leerlas sin copiarlas
+        block = {"tipos": offset, "posiciones": offset + rows + -(offset + rows) % 8}
+        block["datos"] = block["posiciones"] + len(writer.offsets) * writer.offsets.itemsize
+        block["bytes"] = len(writer.data)
+        offset = block["datos"] + block["bytes"]
+        offset += -offset % 8
+        blocks.append(block)
+
+    header = {
+        "origen": os.path.basename(path),
+        **signature,
+        "sha256": file_hash(path),
+        "filas": rows,
+        "columnas": columns,
+        "email": reader.email_column,
+        "bloques": blocks,
+    }
+    encoded = json.dumps(header, ensure_ascii=False).encode("utf-8")
+    prefix_size = len(MAGIC) + HEADER_LENGTH.size + len(encoded)
+    padding = -prefix_size % 8
+
+    with atomic_write(cache_path_for(path), "wb", sync=True) as file:
+        file.write(MAGIC + HEADER_LENGTH.pack(len(encoded) + padding) + encoded + b" " * padding)
+        base = file.tell()
+        for writer, block in zip(writers, blocks):
+            file.seek(base + block["tipos"])
+            file.write(writer.kinds)
+            file.seek(base + block["posiciones"])
+            writer.offsets.tofile(file)
+            file.write(writer.data)
+        file.truncate(base + offset)
+    return header
+
+
+def build_cache_logged(path):
+    """build_cache para hilos en segundo plano: registra el resultado en vez de propagar errores."""
+    try:
+        header = build_cache(path)
+    except Exception as e:
+        logging.error(f"No se pudo generar la caché de {path}: {e}")
+        return None
+    logging.info(f"Caché de {path} generada: {header['filas']} filas, {len(header['columnas'])} columnas.")
+    return header
+
+
+def remove_cache(path):
+    try:
+        os.remove(cache_path_for(path))
+    except FileNotFoundError:
+        pass
+
+
+class RecipientCache:
+    """
+    Lee la caché columnar de una lista con mmap: cualquier fila o columna se
+    decodifica sin leer el resto. `open` devuelve None si no hay caché o si la
+    lista cambió desde que se generó (tamaño o fecha distintos).
+    """
+
+    def __init__(self, cache_path):
+        self._file = open(cache_path, "rb")
+        try:
+            self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:
+            self._file.close()
+            raise
+        if self._map[:len(MAGIC)] != MAGIC:
+            self.close()
+            raise ValueError(f"{cache_path} no es una caché de destinatarios")
+        (length,) = HEADER_LENGTH.unpack_from(self._map, len(MAGIC))
+        start = len(MAGIC) + HEADER_LENGTH.size
+        self.header = json.loads(bytes(self._map[start:start + length]))
+        self.columns = self.header["columnas"]
+        self.rows_count = self.header["filas"]
+        base = start + length
+        view = memoryview(self._map)
+        self._columns = []
+        for block in self.header["bloques"]:
+            kinds = view[base + block["tipos"]:base + block["posiciones"]]
+            offsets = view[base + block["posiciones"]:base + block["datos"]].cast("Q")
+            data = view[base + block["datos"]:base + block["datos"] + block["bytes"]]
+            self._columns.append((kinds, offsets, data))
+        self._view = view
+
+    @classmethod
+    def open(cls, path):
+        cache_path = cache_path_for(path)
+        try:
+            cache = cls(cache_path)
+        except (FileNotFoundError, ValueError, KeyError):
+            return None
+        try:
+            current = file_fingerprint(path)
+        except FileNotFoundError:
+            current = None
+        if current != {key: cache.header.get(key) for key in ("tamano", "modificado")}:
+            cache.close()
+            return None
+        return cache
+
+    def value(self, position, row):
+        kinds, offsets, data = self._columns[position]
+        kind = kinds[row]
+        if kind == KIND_NONE:
+            return None
+        text = bytes(data[offsets[row]:offsets[row + 1]]).decode("utf-8")
+        if kind == KIND_INT:
+            return int(text)
+        if kind == KIND_FLOAT:
+            return float(text)
+        return text
+
+    def raw_rows(self, start=0, stop=None):
+        """Tuplas de valores por fila, como las de openpyxl en modo values_only."""
+        stop = self.rows_count if stop is None else min(stop, self.rows_count)
+        positions = range(len(self._columns))
+        for row in range(start, stop):
+            yield tuple(self.value(position, row) for position in positions)
+
+    def column(self, position):
+        return [self.value(position, row) for row in range(self.rows_count)]
+
+    def close(self):
+        columns, self._columns = getattr(self, "_columns", []), []
+        for kinds, offsets, data in columns:
+            kinds.release()
+            offsets.release()
+            data.release()
+        if getattr(self, "_view", None) is not None:
+            self._view.release()
+        try:
+            self._map.close()
+        except BufferError:
+            # Aún hay valores en uso; el mapa se libera cuando se sueltan
+            pass
+        self._file.close()
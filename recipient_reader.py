@@ -0,0 +1,130 @@
+import csv
+import itertools
+import os
+from collections import namedtuple
+
+from recipient_cache import RecipientCache
+
+# Registro ligero de un destinatario: posición en la lista (0 = primera fila de datos),
+# correo y el resto de columnas de la fila.
+Recipient = namedtuple("Recipient", ["index", "email", "fields"])
+
+EXCEL_EXTENSIONS = {".xlsx", ".xlsm"}
+CSV_EXTENSIONS = {".csv"}
+
+
+class RecipientReader:
+    """
+    Lee la lista de destinatarios fila a fila, sin cargarla entera en memoria.
+
+    Los .xlsx se recorren con openpyxl en modo read-only y los .csv con el módulo csv.
+    `rows(start)` arranca directamente en la fila `start` (el valor del contador),
+    sin construir las filas anteriores.
+
+    Si el .xlsx tiene una caché columnar al día (ver recipient_cache.py, la genera
+    el panel al subirlo) se lee de ella en vez de abrir el libro.
+    """
+
+    def __init__(self, path, email_column="email", use_cache=True):
+        if not os.path.exists(path):
+            raise FileNotFoundError(path)
+        self.path = path
+        self.email_column = email_column
+        self.extension = os.path.splitext(path)[1].lower()
+        if self.extension not in EXCEL_EXTENSIONS | CSV_EXTENSIONS:
+            raise ValueError(f"Formato de lista no soportado: {self.extension}. Usa .xlsx o .csv.")
+        self.cache = RecipientCache.open(path) if use_cache and self.extension in EXCEL_EXTENSIONS else None
+        self.columns = list(self.cache.columns) if self.cache else self._read_header()
+        if self.email_column not in self.columns:
+            raise ValueError(f"El archivo debe contener una columna llamada '{self.email_column}'.")
+
+    def _open_sheet(self):
+        # openpyxl se importa al abrir un libro: las listas CSV o con caché no lo necesitan
+        from openpyxl import load_workbook
+
+        workbook = load_workbook(self.path, read_only=True, data_only=True)
+        return workbook, workbook.active
+
+    def _open_csv(self):
+        handle = open(self.path, "r", encoding="utf-8-sig", newline="")
+        sample = handle.read(4096)
+        handle.seek(0)
+        try:
+            dialect = csv.Sniffer().sniff(sample, delimiters=",;\t")
+        except csv.Error:
+            dialect = csv.excel
+        return handle, csv.reader(handle, dialect)
+
+    def _read_header(self):
+        if self.extension in CSV_EXTENSIONS:
+            handle, reader = self._open_csv()
+            with handle:
+                header = next(reader, [])
+        else:
+            workbook, sheet = self._open_sheet()
+            try:
+                header = next(sheet.iter_rows(max_row=1, values_only=True), ())
+            finally:
+                workbook.close()
+        return [str(name).strip() if name is not None else "" for name in header]
+
+    def count(self):
+        """Número de filas de datos (sin la cabecera)."""
+        if self.cache:
+            return self.cache.rows_count
+        if self.extension in CSV_EXTENSIONS:
+            handle, reader = self._open_csv()
+            with handle:
+                return max(0, sum(1 for _ in reader) - 1)
+
+        workbook, sheet = self._open_sheet()
+        try:
+            # max_row sale de la dimensión guardada en el archivo; si falta, se cuenta.
+            if sheet.max_row:
+                return max(0, sheet.max_row - 1)
+            return max(0, sum(1 for _ in sheet.iter_rows(min_row=2, values_only=True)))
+        finally:
+            workbook.close()
+
+    def raw_rows(self, start=0):
+        """Tuplas con los valores de cada fila desde `start`, en el orden de `columns`."""
+        if self.cache:
+            yield from self.cache.raw_rows(start)
+            return
+
+        if self.extension in CSV_EXTENSIONS:
+            handle, reader = self._open_csv()
+            with handle:
+                yield from itertools.islice(reader, start + 1, None)
+            return
+
+        workbook, sheet = self._open_sheet()
+        try:
+            yield from sheet.iter_rows(min_row=start + 2, values_only=True)
+        finally:
+            workbook.close()
+
+    def column(self, name):
+        """Lista con los valores de una columna, leyendo solo esa posición de cada fila."""
+        position = self.columns.index(name)
+        if self.cache:
+            return self.cache.column(position)
+        return [values[position] if position < len(values) else None for values in self.raw_rows(0)]
+
+    def rows(self, start=0):
+        """Genera un Recipient por fila a partir de la fila `start`."""
+        columns = self.columns
+        email_position = columns.index(self.email_column)
+        for index, values in enumerate(self.raw_rows(start), start=start):
+            fields = {
+                name: value
+                for name, value in zip(columns, values)
+                if name and value is not None and value != ""
+            }
+            email = values[email_position] if email_position < len(values) else None
+            if isinstance(email, str):
+                email = email.strip()
+            yield Recipient(index, email, fields)
+
+    def __iter__(self):
+        return self.rows()
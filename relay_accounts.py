@@ -0,0 +1,408 @@
+import asyncio
+import json
+import logging
+import smtplib
+import threading
+import time
+from datetime import datetime, timedelta
+
+from file_utils import atomic_write
+from rate_limiter import THROTTLE_CODES
+
+USAGE_FILE = "contador/uso_cuentas.json"
+
+# Envíos entre escrituras del archivo de uso (y siempre al cerrar)
+SAVE_EVERY = 50
+
+# Pausa de una cuenta tras un rechazo del remitente
+DEFAULT_COOLDOWN_SECONDS = 300
+
+# Primera espera de un worker que no pudo abrir su conexión (se duplica en cada fallo seguido)
+CONNECT_RETRY_SECONDS = 2
+
+# Fallos seguidos tras los que una cuenta se desactiva hasta el final del envío
+MAX_CONSECUTIVE_FAILURES = 3
+
+# Espera máxima de un worker antes de volver a comprobar las cuentas
+MAX_WAIT_SECONDS = 30.0
+
+# Pausa antes de reabrir una sesión que llegó al límite de correos
+SESSION_RESTART_SECONDS = 5
+
+
+def account_error(error):
+    """
+    Indica si un fallo es de la cuenta y no del destinatario: credenciales
+    rechazadas ("desactivar") o remitente rechazado ("pausar"). Los 421/451
+    los gestiona el limitador de tasa.
+    """
+    if isinstance(error, smtplib.SMTPAuthenticationError):
+        return "desactivar"
+    if isinstance(error, smtplib.SMTPSenderRefused) and error.smtp_code not in THROTTLE_CODES:
+        return "pausar"
+    return None
+
+
+class RelayAccount:
+    """Una cuenta SMTP de salida con sus cuotas y su peso en el reparto."""
+
+    def __init__(self, name, settings, hourly_quota=None, daily_quota=None, weight=1):
+        self.name = name
+        self.settings = settings
+        self.hourly_quota = hourly_quota
+        self.daily_quota = daily_quota
+        self.weight = max(1, int(weight))
+        self.hour = None
+        self.sent_hour = 0
+        self.day = None
+        self.sent_day = 0
+        self.total = 0
+        # Estado de esta ejecución
+        self.current_weight = 0
+        self.paused_until = 0.0
+        self.failures = 0
+        self.disabled = False
+        self.connected = False
+
+    def roll(self, now):
+        """Reinicia los contadores al cambiar de hora o de día."""
+        hour, day = now.strftime("%Y-%m-%dT%H"), now.strftime("%Y-%m-%d")
+        if self.hour != hour:
+            self.hour, self.sent_hour = hour, 0
+        if self.day != day:
+            self.day, self.sent_day = day, 0
+
+    def daily_left(self):
+        return self.daily_quota is None or self.sent_day < self.daily_quota
+
+    def hourly_left(self):
+        return self.hourly_quota is None or self.sent_hour < self.hourly_quota
+
+    def usage(self):
+        return {"hora": self.hour, "enviados_hora": self.sent_hour,
+                "dia": self.day, "enviados_dia": self.sent_day, "total": self.total}
+
+    def load_usage(self, usage):
+        self.hour = usage.get("hora")
+        self.sent_hour = int(usage.get("enviados_hora", 0))
+        self.day = usage.get("dia")
+        self.sent_day = int(usage.get("enviados_dia", 0))
+        self.total = int(usage.get("total", 0))
+
+
+class AccountBalancer:
+    """
+    Reparte los envíos entre varias cuentas SMTP (round-robin ponderado suave)
+    respetando la cuota por hora y por día de cada una.
+
+    Cada envío reserva cupo en la cuenta elegida y se devuelve si falla. Una cuenta
+    cuyo remitente es rechazado se pausa `cooldown` segundos y, tras
+    MAX_CONSECUTIVE_FAILURES fallos seguidos (o credenciales rechazadas), se
+    desactiva. Los fallos al abrir una conexión los gestiona cada worker (ver
+    RelayConnections). El uso se guarda en `usage_path` para que las cuotas se respeten
+    entre ejecuciones.
+    """
+
+    def __init__(self, accounts, usage_path=USAGE_FILE, cooldown=DEFAULT_COOLDOWN_SECONDS):
+        self.accounts = accounts
+        self.usage_path = usage_path
+        self.cooldown = cooldown
+        self._unsaved = 0
+        self._lock = threading.Lock()
+        self._save_lock = threading.Lock()
+        usage = self._load()
+        for account in accounts:
+            account.load_usage(usage.get(account.name, {}))
+
+    @classmethod
+    def from_config(cls, entries, usage_path=USAGE_FILE, cooldown=DEFAULT_COOLDOWN_SECONDS):
+        """`entries`: cuentas de ConfigManager.get_smtp_accounts()."""
+        accounts = [
+            RelayAccount(entry["nombre"], entry["smtp"], entry.get("cuota_hora"),
+                         entry.get("cuota_dia"), entry.get("peso", 1))
+            for entry in entries
+        ]
+        return cls(accounts, usage_path, cooldown)
+
+    def _load(self):
+        try:
+            with open(self.usage_path, "r", encoding="utf-8") as file:
+                return json.load(file)
+        except FileNotFoundError:
+            return {}
+        except (OSError, ValueError) as e:
+            logging.warning(f"No se pudo leer el uso de las cuentas SMTP ({e}); se empieza de cero.")
+            return {}
+
+    def save(self):
+        """Escribe el uso de las cuentas de forma atómica (archivo temporal + rename)."""
+        with self._lock:
+            usage = {account.name: account.usage() for account in self.accounts}
+            self._unsaved = 0
+        with self._save_lock, atomic_write(self.usage_path) as file:
+            json.dump(usage, file, indent=4, ensure_ascii=False)
+
+    def acquire(self):
+        """
+        Elige una cuenta y le reserva un envío. Devuelve (cuenta, 0) o, si ninguna
+        puede enviar ahora, (None, segundos a esperar); (None, None) si ya no queda
+        ninguna con cupo en el día.
+        """
+        now = datetime.now()
+        monotonic = time.monotonic()
+        with self._lock:
+            waits = []
+            candidates = []
+            for account in self.accounts:
+                account.roll(now)
+                if account.disabled or not account.daily_left():
+                    continue
+                if account.paused_until > monotonic:
+                    waits.append(account.paused_until - monotonic)
+                elif not account.hourly_left():
+                    next_hour = now.replace(minute=0, second=0, microsecond=0) + timedelta(hours=1)
+                    waits.append((next_hour - now).total_seconds())
+                else:
+                    candidates.append(account)
+            if not candidates:
+                return None, (min(waits) if waits else None)
+
+            total_weight = sum(account.weight for account in candidates)
+            for account in candidates:
+                account.current_weight += account.weight
+            chosen = max(candidates, key=lambda account: account.current_weight)
+            chosen.current_weight -= total_weight
+            chosen.sent_hour += 1
+            chosen.sent_day += 1
+            return chosen, 0
+
+    def record(self, account, sent, error=None):
+        """Confirma o devuelve el envío reservado y pausa la cuenta si el fallo es suyo."""
+        with self._lock:
+            if sent:
+                account.total += 1
+                account.failures = 0
+                self._unsaved += 1
+                save = self._unsaved >= SAVE_EVERY
+            else:
+                account.sent_hour = max(0, account.sent_hour - 1)
+                account.sent_day = max(0, account.sent_day - 1)
+                save = False
+        if save:
+            self.save()
+        if not sent and error is not None:
+            action = account_error(error)
+            if action:
+                self.fail(account, error, disable=action == "desactivar")
+
+    def fail(self, account, error, disable=False):
+        """Pausa una cuenta tras un fallo suyo, o la desactiva si se repite."""
+        with self._lock:
+            if account.disabled or account.paused_until > time.monotonic():
+                # Otro worker ya registró el fallo de esta cuenta
+                return
+            account.failures += 1
+            if disable or account.failures >= MAX_CONSECUTIVE_FAILURES:
+                account.disabled = True
+            else:
+                account.paused_until = time.monotonic() + self.cooldown
+        if account.disabled:
+            logging.error(f"Cuenta SMTP '{account.name}' desactivada en este envío: {error}")
+        else:
+            logging.warning(f"Cuenta SMTP '{account.name}' en pausa {self.cooldown:g} s: {error}")
+
+    def log_summary(self):
+        for account in self.accounts:
+            limits = []
+            if account.hourly_quota is not None:
+                limits.append(f"{account.sent_hour}/{account.hourly_quota} esta hora")
+            if account.daily_quota is not None:
+                limits.append(f"{account.sent_day}/{account.daily_quota} hoy")
+            detail = f" ({', '.join(limits)})" if limits else ""
+            state = " [desactivada]" if account.disabled else ""
+            logging.info(f"Cuenta SMTP '{account.name}': {account.total} enviados en total{detail}{state}.")
+
+
+class RelayConnections:
+    """
+    Conexiones SMTP de un worker, una por cuenta, abiertas al usarlas por primera
+    vez y reiniciadas al llegar a `session_limit` correos. `send` elige la cuenta
+    con el balanceador y, si el fallo es de la cuenta, prueba con otra.
+
+    Si una conexión no se puede abrir (4xx, conexión rechazada o cortada) solo
+    espera este worker, cada vez más, y los demás siguen con sus sesiones; la
+    cuenta se pausa o desactiva únicamente por credenciales o remitente
+    rechazados, o si nunca llegó a conectar tras varios intentos.
+    """
+
+    def __init__(self, balancer, sender_class, session_limit, on_reconnect=None):
+        self.balancer = balancer
+        self.sender_class = sender_class
+        self.session_limit = session_limit
+        # Se llama con el número de reconexiones (sesiones reiniciadas o recuperadas)
+        self.on_reconnect = on_reconnect
+        self.sessions = {}
+        # Fallos seguidos al conectar con cada cuenta y hasta cuándo espera este worker
+        self.connect_failures = {}
+        self.retry_at = {}
+        self._waiting = False
+
+    def _log_wait(self, wait):
+        if not self._waiting:
+            logging.warning(f"Ninguna cuenta SMTP puede enviar ahora (cuota horaria o pausa). Esperando {wait:.0f} s...")
+        self._waiting = True
+
+    def _reconnected(self, count=1, on_reconnect=None):
+        on_reconnect = on_reconnect or self.on_reconnect
+        if on_reconnect and count:
+            on_reconnect(count)
+
+    def _new_sender(self, account):
+        settings = account.settings
+        return self.sender_class(settings['smtp_host'], settings['smtp_port'], settings['smtp_user'],
+                                 settings['smtp_password'], settings['email_from'])
+
+    def _connect_failed(self, account, email_sender):
+        error = email_sender.last_error or smtplib.SMTPConnectError(-1, "No se pudo conectar")
+        action = account_error(error)
+        failures = self.connect_failures.get(account.name, 0) + 1
+        self.connect_failures[account.name] = failures
+        if action:
+            self.balancer.fail(account, error, disable=action == "desactivar")
+            return
+        if not account.connected and failures >= MAX_CONSECUTIVE_FAILURES:
+            # Ningún worker llegó a conectar: la configuración está mal, no se insiste
+            self.balancer.fail(account, error, disable=True)
+            return
+        delay = min(CONNECT_RETRY_SECONDS * 2 ** (failures - 1), MAX_WAIT_SECONDS)
+        self.retry_at[account.name] = time.monotonic() + delay
+        logging.warning(f"No se pudo abrir una conexión con '{account.name}' ({error}); "
+                        f"esta conexión lo reintenta en {delay:g} s.")
+
+    def _connected(self, account, email_sender):
+        account.connected = True
+        self.connect_failures.pop(account.name, None)
+        self.retry_at.pop(account.name, None)
+        session = self.sessions[account.name] = [email_sender, 0]
+        return session
+
+    def _connect_wait(self, account):
+        """Segundos que le quedan a este worker antes de volver a conectar con `account`."""
+        return max(0.0, self.retry_at.get(account.name, 0.0) - time.monotonic())
+
+    def _session(self, account, on_reconnect=None):
+        session = self.sessions.get(account.name)
+        if session and not session[0].is_connected:
+            # Falló la reconexión dentro de send_message: se reabre como una sesión nueva
+            logging.info(f"La sesión con '{account.name}' quedó cerrada. Reconectando...")
+            self._reconnected(on_reconnect=on_reconnect)
+        elif session and session[1] < self.session_limit:
+            return session
+        elif session:
+            logging.info(f"Límite de sesión alcanzado ({self.session_limit} correos) en '{account.name}'. Reiniciando conexión...")
+            session[0].disconnect()
+            time.sleep(SESSION_RESTART_SECONDS)
+            self._reconnected(on_reconnect=on_reconnect)
+        email_sender = self._new_sender(account)
+        if not email_sender.connect():
+            self.sessions.pop(account.name, None)
+            self._connect_failed(account, email_sender)
+            return None
+        return self._connected(account, email_sender)
+
+    def send(self, to_email, build, on_reconnect=None):
+        """
+        Envía a `to_email` el mensaje que genera `build(cuenta)`. Devuelve
+        (enviado, email_sender) o (False, None) si ya no queda ninguna cuenta
+        con cupo o utilizable. Las reconexiones de este envío se notifican a
+        `on_reconnect` si se indica (p. ej. la campaña del destinatario).
+        """
+        while True:
+            account, wait = self.balancer.acquire()
+            if account is None:
+                if wait is None:
+                    return False, None
+                self._log_wait(wait)
+                time.sleep(min(wait, MAX_WAIT_SECONDS))
+                continue
+            wait = self._connect_wait(account)
+            if wait:
+                self.balancer.record(account, False)
+                time.sleep(wait)
+                continue
+            session = self._session(account, on_reconnect)
+            if session is None:
+                self.balancer.record(account, False)
+                continue
+            self._waiting = False
+            email_sender = session[0]
+            reconnects = email_sender.reconnects
+            sent = email_sender.send_message(to_email, build(account))
+            self._reconnected(email_sender.reconnects - reconnects, on_reconnect)
+            self.balancer.record(account, sent, email_sender.last_error)
+            if sent:
+                session[1] += 1
+            if sent or not account_error(email_sender.last_error):
+                return sent, email_sender
+
+    def close(self):
+        for email_sender, _count in self.sessions.values():
+            email_sender.disconnect()
+        self.sessions.clear()
+
+
+class AsyncRelayConnections(RelayConnections):
+    """Equivalente asyncio de RelayConnections (AsyncEmailSender en un event loop)."""
+
+    async def _session(self, account, on_reconnect=None):
+        session = self.sessions.get(account.name)
+        if session and not session[0].is_connected:
+            logging.info(f"La sesión con '{account.name}' quedó cerrada. Reconectando...")
+            self._reconnected(on_reconnect=on_reconnect)
+        elif session and session[1] < self.session_limit:
+            return session
+        elif session:
+            logging.info(f"Límite de sesión alcanzado ({self.session_limit} correos) en '{account.name}'. Reiniciando conexión...")
+            await session[0].disconnect()
+            await asyncio.sleep(SESSION_RESTART_SECONDS)
+            self._reconnected(on_reconnect=on_reconnect)
+        email_sender = self._new_sender(account)
+        if not await email_sender.connect():
+            self.sessions.pop(account.name, None)
+            self._connect_failed(account, email_sender)
+            return None
+        return self._connected(account, email_sender)
+
+    async def send(self, to_email, build, on_reconnect=None):
+        while True:
+            account, wait = self.balancer.acquire()
+            if account is None:
+                if wait is None:
+                    return False, None
+                self._log_wait(wait)
+                await asyncio.sleep(min(wait, MAX_WAIT_SECONDS))
+                continue
+            wait = self._connect_wait(account)
+            if wait:
+                self.balancer.record(account, False)
+                await asyncio.sleep(wait)
+                continue
+            session = await self._session(account, on_reconnect)
+            if session is None:
+                self.balancer.record(account, False)
+                continue
+            self._waiting = False
+            email_sender = session[0]
+            reconnects = email_sender.reconnects
+            sent = await email_sender.send_message(to_email, build(account))
+            self._reconnected(email_sender.reconnects - reconnects, on_reconnect)
+            self.balancer.record(account, sent, email_sender.last_error)
+            if sent:
+                session[1] += 1
+            if sent or not account_error(email_sender.last_error):
+                return sent, email_sender
+
+    async def close(self):
+        for email_sender, _count in self.sessions.values():
+            await email_sender.disconnect()
+        self.sessions.clear()
@@ -0,0 +1,186 @@
+import heapq
+import json
+import logging
+import random
+import smtplib
+import socket
+import sys
+import threading
+import time
+
+from file_utils import atomic_write
+from recipient_reader import Recipient
+
+TRANSIENT = "transitorio"
+PERMANENT = "permanente"
+
+# Estados finales de un destinatario en la cola de reintentos
+STATUS_PENDING = "pendiente"
+STATUS_SENT = "enviado"
+STATUS_GAVE_UP = "descartado"
+STATUS_REJECTED = "rechazado"
+
+
+def classify_error(error, code=None):
+    """
+    Clasifica un fallo de envío: las respuestas 4xx, timeouts y desconexiones son
+    transitorias (se reintentan); las 5xx y cualquier otro error, permanentes.
+    """
+    if code is not None:
+        return TRANSIENT if 400 <= code < 500 else PERMANENT
+    # asyncio solo se carga con el motor asyncio; si no está importado, sus timeouts no pueden llegar aquí
+    asyncio = sys.modules.get("asyncio")
+    timeouts = (socket.timeout, TimeoutError) + ((asyncio.TimeoutError,) if asyncio else ())
+    if isinstance(error, (smtplib.SMTPServerDisconnected, ConnectionError) + timeouts):
+        return TRANSIENT
+    return PERMANENT
+
+
+class RetryQueue:
+    """
+    Cola persistente de reintentos con backoff exponencial y jitter.
+
+    Cada evento (alta, intento, resultado final) se añade como una línea JSON al
+    archivo de la cola; al abrirla se reconstruye el último estado por destinatario,
+    así los pendientes sobreviven entre ejecuciones. Se guardan el número de intentos
+    y el estado final de cada destinatario.
+    """
+
+    def __init__(self, path, max_attempts=5, base_delay=60.0, max_delay=3600.0):
+        self.path = path
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.entries = self._load()
+        self._in_flight = set()
+        # (próximo intento, fila) de los pendientes; las entradas obsoletas se descartan al sacarlas
+        self._due = [
+            (entry["next_attempt"], index)
+            for index, entry in self.entries.items()
+            if entry["status"] == STATUS_PENDING
+        ]
+        heapq.heapify(self._due)
+        self._lock = threading.Lock()
+        self._compact()
+        self._file = open(self.path, "a", encoding="utf-8")
+
+    def _load(self):
+        entries = {}
+        try:
+            with open(self.path, "r", encoding="utf-8") as file:
+                for line in file:
+                    try:
+                        entry = json.loads(line)
+                    except json.JSONDecodeError:
+                        continue
+                    entries[entry["index"]] = entry
+        except FileNotFoundError:
+            pass
+        return entries
+
+    def _compact(self):
+        with atomic_write(self.path) as file:
+            for entry in self.entries.values():
+                file.write(json.dumps(entry, ensure_ascii=False, default=str) + "\n")
+
+    def _write(self, entry):
+        self._file.write(json.dumps(entry, ensure_ascii=False, default=str) + "\n")
+        self._file.flush()
+
+    def _backoff(self, attempts):
+        delay = min(self.max_delay, self.base_delay * 2 ** (attempts - 1))
+        return delay * random.uniform(0.5, 1.5)
+
+    def schedule(self, recipient, attempts, error):
+        """
+        Registra un fallo transitorio. Devuelve False si el destinatario agotó sus
+        intentos y se descarta.
+        """
+        with self._lock:
+            self._in_flight.discard(recipient.index)
+            entry = {
+                "index": recipient.index,
+                "email": recipient.email,
+                "fields": recipient.fields,
+                "attempts": attempts,
+                "status": STATUS_PENDING,
+                "last_error": str(error),
+            }
+            if attempts >= self.max_attempts:
+                entry["status"] = STATUS_GAVE_UP
+            else:
+                entry["next_attempt"] = time.time() + self._backoff(attempts)
+                heapq.heappush(self._due, (entry["next_attempt"], recipient.index))
+            self.entries[recipient.index] = entry
+            self._write(entry)
+            return entry["status"] == STATUS_PENDING
+
+    def finish(self, recipient, attempts, status, error=None):
+        """Guarda el estado final de un destinatario (enviado tras reintentos, rechazado, ...)."""
+        with self._lock:
+            self._in_flight.discard(recipient.index)
+            entry = self.entries.setdefault(recipient.index, {
+                "index": recipient.index,
+                "email": recipient.email,
+                "fields": recipient.fields,
+            })
+            entry.update(attempts=attempts, status=status, last_error=str(error) if error else None)
+            entry.pop("next_attempt", None)
+            self._write(entry)
+
+    def release(self, recipient):
+        """Devuelve a la cola un reintento que se tomó pero no llegó a intentarse."""
+        with self._lock:
+            self._in_flight.discard(recipient.index)
+            entry = self.entries.get(recipient.index)
+            if entry and entry["status"] == STATUS_PENDING:
+                heapq.heappush(self._due, (entry["next_attempt"], recipient.index))
+
+    def _discard_stale(self):
+        while self._due:
+            next_attempt, index = self._due[0]
+            entry = self.entries.get(index)
+            if (entry and entry["status"] == STATUS_PENDING and index not in self._in_flight
+                    and entry["next_attempt"] == next_attempt):
+                return
+            heapq.heappop(self._due)
+
+    def pop_due(self):
+        """Devuelve (recipient, intento) del primer reintento vencido, o None."""
+        if not self._due or self._due[0][0] > time.time():
+            return None
+        with self._lock:
+            self._discard_stale()
+            if not self._due or self._due[0][0] > time.time():
+                return None
+            _next_attempt, index = heapq.heappop(self._due)
+            self._in_flight.add(index)
+            entry = self.entries[index]
+            return Recipient(index, entry["email"], entry["fields"]), entry["attempts"] + 1
+
+    def next_due_in(self):
+        """Segundos hasta el próximo reintento (0 si hay alguno vencido), o None si no hay en espera."""
+        with self._lock:
+            self._discard_stale()
+            if not self._due:
+                return None
+            return max(0.0, self._due[0][0] - time.time())
+
+    def has_pending(self):
+        """True mientras quede algún reintento en espera o en curso."""
+        with self._lock:
+            self._discard_stale()
+            return bool(self._in_flight or self._due)
+
+    def pending_count(self):
+        """Destinatarios esperando un reintento (incluidos los que están en curso)."""
+        with self._lock:
+            return sum(1 for entry in self.entries.values() if entry["status"] == STATUS_PENDING)
+
+    def close(self):
+        with self._lock:
+            self._file.close()
+            self._compact()
+        pending = sum(1 for entry in self.entries.values() if entry["status"] == STATUS_PENDING)
+        if pending:
+            logging.info(f"Quedan {pending} reintentos pendientes para la próxima ejecución.")
@@ -0,0 +1,140 @@
+import os
+import threading
+
+from file_utils import atomic_write
+
+# Estados que se registran por fila
+STATUS_SENT = "enviado"
+STATUS_FAILED = "fallido"
+STATUS_SKIPPED = "omitido"
+STATUS_RETRY = "reintento"
+STATUS_SUPPRESSED = "suprimido"
+
+
+def journal_path_for(counter_file):
+    """Ruta del journal asociado a un archivo de contador (contador.txt -> contador.journal)."""
+    return os.path.splitext(counter_file)[0] + ".journal"
+
+
+def retry_path_for(counter_file):
+    """Ruta de la cola de reintentos asociada a un contador (contador.txt -> contador.reintentos)."""
+    return os.path.splitext(counter_file)[0] + ".reintentos"
+
+
+def read_checkpoint(counter_file):
+    try:
+        with open(counter_file, "r") as file:
+            content = file.read().strip()
+            return int(content) if content else 0
+    except (FileNotFoundError, ValueError):
+        return 0
+
+
+def write_checkpoint(counter_file, value):
+    """Escribe el contador de forma atómica (archivo temporal + rename)."""
+    with atomic_write(counter_file, sync=True) as file:
+        file.write(str(value))
+
+
+def read_entries(journal_file):
+    """Devuelve {fila: estado} del journal, ignorando una última línea incompleta."""
+    entries = {}
+    try:
+        with open(journal_file, "r", encoding="utf-8") as file:
+            for line in file:
+                if not line.endswith("\n"):
+                    break
+                index, _, status = line.rstrip("\n").partition(" ")
+                try:
+                    entries[int(index)] = status
+                except ValueError:
+                    continue
+    except FileNotFoundError:
+        pass
+    return entries
+
+
+def recover(counter_file, journal_file=None):
+    """
+    Reconstruye el progreso: (última fila contigua confirmada, filas confirmadas
+    después de esa posición). Las segundas existen cuando varios workers terminan
+    fuera de orden y no hay que volver a enviarlas.
+    """
+    journal_file = journal_file or journal_path_for(counter_file)
+    watermark = read_checkpoint(counter_file)
+    done = {index for index in read_entries(journal_file) if index >= watermark}
+    while watermark in done:
+        done.remove(watermark)
+        watermark += 1
+    return watermark, done
+
+
+def read_progress(counter_file, journal_file=None):
+    """Última fila contigua confirmada (lo que antes era el valor de contador.txt)."""
+    return recover(counter_file, journal_file)[0]
+
+
+class SendJournal:
+    """
+    Journal append-only de resultados por fila, con group commit.
+
+    Cada fila confirmada se añade como "<fila> <estado>" a un buffer que se escribe
+    y sincroniza (fsync) cada `batch_size` filas o cada `flush_interval` segundos.
+    Solo se registra una fila después de que el servidor acepte el correo, así que
+    tras una caída nunca se salta una fila; como mucho se reenvía el último lote
+    sin sincronizar. Al cerrar, el progreso se consolida en el contador.
+    """
+
+    def __init__(self, counter_file, journal_file=None, batch_size=100, flush_interval=1.0):
+        self.counter_file = counter_file
+        self.journal_file = journal_file or journal_path_for(counter_file)
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.watermark, self.done = recover(self.counter_file, self.journal_file)
+        self._compact()
+        self._buffer = []
+        self._lock = threading.Lock()
+        self._file = open(self.journal_file, "a", encoding="utf-8")
+        self._stop = threading.Event()
+        self._flusher = threading.Thread(target=self._flush_periodically, name="journal", daemon=True)
+        self._flusher.start()
+
+    def _compact(self):
+        """Consolida lo recuperado en el contador y reescribe el journal solo con lo pendiente."""
+        write_checkpoint(self.counter_file, self.watermark)
+        entries = read_entries(self.journal_file)
+        with atomic_write(self.journal_file, sync=True) as file:
+            for index in sorted(self.done):
+                file.write(f"{index} {entries[index]}\n")
+
+    def _flush_periodically(self):
+        while not self._stop.wait(self.flush_interval):
+            self.flush()
+
+    def record(self, index, status):
+        with self._lock:
+            self._buffer.append(f"{index} {status}\n")
+            if len(self._buffer) >= self.batch_size:
+                self._flush_locked()
+
+    def flush(self):
+        with self._lock:
+            self._flush_locked()
+
+    def _flush_locked(self):
+        if not self._buffer or self._file.closed:
+            return
+        self._file.write("".join(self._buffer))
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        self._buffer.clear()
+
+    def close(self):
+        """Sincroniza lo pendiente y consolida el progreso en el contador."""
+        self._stop.set()
+        self._flusher.join()
+        with self._lock:
+            self._flush_locked()
+            self._file.close()
+        self.watermark, self.done = recover(self.counter_file, self.journal_file)
+        self._compact()
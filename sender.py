@@ -1,129 +1,899 @@
-import pandas as pd
+import argparse
+import asyncio
 import os
+import sys
 import logging
+import queue
+import threading
 import time
 import re
+import sqlite3
 from config_manager import ConfigManager
-from email_sender import EmailSender
+from email_sender import EmailSender, MessageBuilder, known_extensions
+from async_email_sender import AsyncEmailSender
+from relay_accounts import AccountBalancer, AsyncRelayConnections, RelayConnections
+from pipeline import AsyncRenderStage, PipelineStats, RenderStage, READ_STAGE, RENDER_STAGE, SEND_STAGE
+from rate_limiter import RateLimiter
+from send_journal import STATUS_FAILED, STATUS_RETRY, STATUS_SENT, STATUS_SKIPPED, STATUS_SUPPRESSED
+from retry_queue import STATUS_REJECTED as RETRY_REJECTED, STATUS_SENT as RETRY_SENT, TRANSIENT, classify_error
+from recipient_reader import RecipientReader
+from template_engine import CompiledTemplate
+from html_minifier import minify_cached
+from preflight import run_preflight
+from suppression import SuppressionList
+from domain_scheduler import DEFAULT_LOOKAHEAD, DomainScheduler
+from live_metrics import METRICS_FILE, LiveMetrics
+from spool import SPOOL_DIR, Spool, SpoolWriter, campaign_fingerprint, spool_dir_for
 
 # Límite de correos por sesión SMTP (un poco menos del límite real para seguridad)
 SESSION_LIMIT = 4900
 
+# Filas en cola por cada conexión del pool (evita cargar toda la lista en memoria)
+QUEUE_ROWS_PER_CONNECTION = 100
+
+# Espera máxima entre comprobaciones mientras se vacía la cola de reintentos
+DRAIN_POLL_SECONDS = 0.2
+
 # Configuración del logging
-logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(threadName)s - %(levelname)s - %(message)s')
+
+# Expresión regular para validar un correo electrónico
+EMAIL_REGEX = re.compile(r'^[a-zA-Z0-9._%+-]+@[a-zA-Z0-9.-]+\.[a-zA-Z]{2,}$')
 
 def is_valid_email(email):
     """Valida el formato de un correo electrónico."""
     if not isinstance(email, str):
         return False
-    # Expresión regular para validar un correo electrónico
-    regex = r'^[a-zA-Z0-9._%+-]+@[a-zA-Z0-9.-]+\.[a-zA-Z]{2,}$'
-    return re.match(regex, email) is not None
+    return EMAIL_REGEX.match(email) is not None
 
-def load_body_template(path):
-    """Carga la plantilla de correo desde un archivo."""
+def load_body_template(path, minify=False):
+    """
+    Carga y compila la plantilla de correo desde un archivo. Con `minify` se
+    compila su versión minificada (ver html_minifier). Devuelve la plantilla y
+    los bytes que se ahorran por mensaje, o (None, 0) si no existe.
+    """
     if not os.path.exists(path):
         logging.error(f'Error: El archivo de plantilla {path} no existe.')
-        return None
+        return None, 0
     with open(path, 'r', encoding='utf-8') as file:
-        return file.read()
+        text = file.read()
+    if not minify:
+        return CompiledTemplate(text), 0
+    minified = minify_cached(path, text)
+    original_bytes, minified_bytes = len(text.encode('utf-8')), len(minified.encode('utf-8'))
+    if original_bytes:
+        logging.info(f"Plantilla {path} minificada: {original_bytes} -> {minified_bytes} bytes "
+                     f"({100 * (original_bytes - minified_bytes) / original_bytes:.1f}% menos por mensaje).")
+    return CompiledTemplate(minified), original_bytes - minified_bytes
 
-def run_sender():
+class ProgressTracker:
+    """
+    Lleva el progreso compartido entre los workers del pool.
+
+    Cada fila terminada se registra en el journal de envíos (que escribe por lotes).
+    Las filas pueden terminar fuera de orden, así que `next_index` solo avanza hasta
+    la última fila contigua procesada.
+    """
+
+    def __init__(self, journal):
+        self.journal = journal
+        self.next_index = journal.watermark
+        self._done = set(journal.done)
+        self._lock = threading.Lock()
+
+    def is_done(self, index):
+        return index in self._done
+
+    def processed(self):
+        """Filas ya terminadas: las contiguas más las confirmadas fuera de orden."""
+        with self._lock:
+            return self.next_index + len(self._done)
+
+    def mark_done(self, index, status):
+        self.journal.record(index, status)
+        with self._lock:
+            self._done.add(index)
+            while self.next_index in self._done:
+                self._done.remove(self.next_index)
+                self.next_index += 1
+
+class CampaignRun:
+    """
+    Estado compartido por los workers durante un envío: progreso, mensaje,
+    limitador de tasa, cola de reintentos, contadores para el resumen final
+    y utilización de cada etapa.
+
+    Los elementos de la cola de trabajo son (recipient, intento); el intento 1
+    es la fila de la lista y los siguientes salen de la cola de reintentos.
+    """
+
+    def __init__(self, tracker, builder, limiter, retries, total_emails_in_file, validate=True, scheduler=None, spool=None):
+        self.tracker = tracker
+        self.builder = builder
+        # Con un spool preparado los mensajes ya están renderizados en disco
+        self.spool = spool
+        # Cabeceras comunes con el remitente de cada cuenta SMTP
+        self.heads = {}
+        self.limiter = limiter
+        self.retries = retries
+        self.total_emails_in_file = total_emails_in_file
+        # Sin validación previa de la lista, cada fila se valida al enviarla
+        self.validate = validate
+        # Reparto por dominio de destino (opcional)
+        self.scheduler = scheduler
+        self.counts = {"enviados": 0, "fallidos": 0, "omitidos": 0, "suprimidos": 0, "reintentos": 0}
+        # Elementos entregados a los workers cuyo resultado aún no se registró
+        self.outstanding = 0
+        # Se activa cuando ya no se puede seguir enviando (p. ej. cuotas agotadas)
+        self.stopped = False
+        self.stats = PipelineStats()
+        # Métricas en vivo para api.py (opcional)
+        self.metrics = None
+        # Lista de supresión que filtra las filas (se cierra con la campaña)
+        self.suppression = None
+        # Bytes que ahorra cada mensaje con la plantilla minificada
+        self.html_bytes_saved = 0
+        self._lock = threading.Lock()
+
+    def skip(self, index):
+        """Marca como omitida una fila descartada antes de llegar a los workers."""
+        self.tracker.mark_done(index, STATUS_SKIPPED)
+        self._count("omitidos")
+
+    def suppress(self, index):
+        """Marca una fila cuyo destinatario está en la lista de supresión."""
+        self.tracker.mark_done(index, STATUS_SUPPRESSED)
+        self._count("suprimidos")
+
+    def _count(self, key):
+        with self._lock:
+            self.counts[key] += 1
+
+    def stop(self, reason):
+        """Detiene el reparto de filas; las no enviadas quedan para la próxima ejecución."""
+        if not self.stopped:
+            self.stopped = True
+            logging.error(f"{reason} Se detiene el envío; se retomará en la próxima ejecución.")
+
+    def feed(self, rows):
+        """
+        Genera los elementos a enviar: las filas de la lista intercaladas con los
+        reintentos vencidos y, al acabar la lista, los reintentos que queden
+        (incluidos los que generen los envíos aún en curso). Cuando no hay nada
+        listo genera los segundos a esperar.
+        """
+        source = self.scheduler.interleave(rows) if self.scheduler else rows
+        for recipient in source:
+            if self.stopped:
+                return
+            due = self.retries.pop_due()
+            if due:
+                yield self._hand_out(due)
+            if isinstance(recipient, float):
+                yield recipient
+                continue
+            yield self._hand_out((recipient, 1))
+        while not self.stopped and (self.outstanding or self.retries.has_pending()):
+            due = self.retries.pop_due()
+            if due:
+                yield self._hand_out(due)
+            else:
+                wait = self.retries.next_due_in()
+                yield DRAIN_POLL_SECONDS if wait is None else min(wait, DRAIN_POLL_SECONDS)
+
+    def entry(self, element):
+        """(campaña, elemento) de cada elemento generado por `feed`."""
+        return self, element
+
+    def _hand_out(self, item):
+        with self._lock:
+            self.outstanding += 1
+        return item
+
+    def _settle(self, item, sent=False, attempted=True):
+        recipient, attempt = item
+        if self.scheduler and attempt == 1:
+            self.scheduler.release(recipient.email, sent, attempted)
+        with self._lock:
+            self.outstanding -= 1
+
+    def prepare(self, item):
+        """Valida el correo; devuelve False si la fila se omite."""
+        recipient, attempt = item
+        index, to_email, fields = recipient
+
+        if self.validate and attempt == 1 and not is_valid_email(to_email):
+            logging.warning(f"[{index + 1}/{self.total_emails_in_file}] Omitiendo correo inválido o nulo en la línea {index + 2}: {to_email}")
+            self.tracker.mark_done(index, STATUS_SKIPPED) #Avanzo el contador para no reintentar
+            self._count("omitidos")
+            self._settle(item)
+            return False
+
+        if attempt > 1:
+            logging.info(f"[reintento {attempt}] Enviando a: {to_email} (línea {index + 2})")
+        else:
+            logging.info(f"[{index + 1}/{self.total_emails_in_file}] Enviando a: {to_email}")
+        return True
+
+    def render(self, item):
+        """Parte personalizada del mensaje (sin remitente), en bytes."""
+        start = time.perf_counter()
+        recipient = item[0]
+        payload = self.spool.payload(recipient.index) if self.spool is not None else None
+        if payload is None:
+            payload = self.builder.render(recipient.email, recipient.fields)
+        self.stats.add(RENDER_STAGE, time.perf_counter() - start)
+        return payload
+
+    def observe_send(self, seconds, sent):
+        """Registra la duración de un envío en la utilización y en las métricas en vivo."""
+        self.stats.add(SEND_STAGE, seconds)
+        if self.metrics:
+            self.metrics.observe_send(seconds, sent)
+
+    def reconnected(self, count):
+        if self.metrics:
+            self.metrics.reconnected(count)
+
+    def message(self, payload, account):
+        """Mensaje completo con el remitente de la cuenta que lo envía."""
+        head = self.heads.get(account.name)
+        if head is None:
+            head = self.heads[account.name] = self.builder.head(account.settings['email_from'])
+        return head + payload
+
+    def record(self, item, sent, email_sender):
+        """Registra el resultado de un envío: progreso, reintentos y limitador."""
+        recipient, attempt = item
+        index, to_email, _fields = recipient
+        code, error = email_sender.last_error_code, email_sender.last_error
+
+        if self.limiter:
+            self.limiter.record(sent, code)
+
+        if sent:
+            if attempt > 1:
+                self.retries.finish(recipient, attempt, RETRY_SENT)
+            else:
+                self.tracker.mark_done(index, STATUS_SENT)
+            self._count("enviados")
+            self._settle(item, sent=True)
+            return
+
+        if classify_error(error, code) == TRANSIENT:
+            queued = self.retries.schedule(recipient, attempt, error)
+            if queued:
+                logging.warning(f"Fallo transitorio al enviar a {to_email} en la línea {index + 2} (intento {attempt}). Se reintentará más tarde.")
+                if attempt == 1:
+                    self._count("reintentos")
+            else:
+                logging.error(f"Fallo al enviar a {to_email} en la línea {index + 2}: descartado tras {attempt} intentos.")
+                self._count("fallidos")
+        else:
+            logging.error(f"Fallo permanente al enviar a {to_email} en la línea {index + 2}. Continuando con el siguiente.")
+            self.retries.finish(recipient, attempt, RETRY_REJECTED, error)
+            queued = False
+            self._count("fallidos")
+
+        if attempt == 1:
+            #Avanzo el contador: la fila queda en la cola de reintentos o como fallida
+            self.tracker.mark_done(index, STATUS_RETRY if queued else STATUS_FAILED)
+        self._settle(item)
+
+    def release(self, item):
+        """Devuelve un elemento que se tomó de la cola pero no se llegó a intentar."""
+        recipient, attempt = item
+        if attempt > 1:
+            self.retries.release(recipient)
+        self._settle(item, attempted=False)
+
+    def close(self):
+        """Cierra la supresión, el journal, la cola de reintentos, las métricas y el spool."""
+        if self.suppression:
+            self.suppression.close()
+        self.tracker.journal.close()
+        self.retries.close()
+        if self.metrics:
+            self.metrics.close()
+        if self.spool:
+            self.spool.close()
+
+    def log_summary(self):
+        counts = self.counts
+        logging.info(
+            f"✅ Proceso de envío finalizado. Correos enviados en esta sesión: {counts['enviados']}. "
+            f"Fallidos: {counts['fallidos']}. Omitidos: {counts['omitidos']}. Suprimidos: {counts['suprimidos']}. "
+            f"Enviados a la cola de reintentos: {counts['reintentos']}."
+        )
+        if self.html_bytes_saved and counts['enviados']:
+            logging.info(f"HTML minificado: {self.html_bytes_saved * counts['enviados']} bytes menos enviados "
+                         f"({self.html_bytes_saved} por mensaje).")
+        if self.scheduler:
+            self.scheduler.log_summary()
+
+def send_worker(connections, rows, campaign):
+    """
+    Consume elementos (campaña, item, bytes renderizados o None) de la cola
+    compartida con sus propias conexiones SMTP (una por cuenta, ver
+    RelayConnections). `campaign` es quien reparte: la campaña misma o, con
+    varias campañas a la vez, el CampaignMix que las intercala.
+    """
+    try:
+        while True:
+            entry = rows.get()
+            if entry is None:
+                break
+            owner, item, payload = entry
+
+            if not owner.prepare(item):
+                continue
+            if payload is None:
+                payload = owner.render(item)
+
+            if owner.limiter:
+                owner.limiter.acquire()
+
+            start = time.perf_counter()
+            sent, email_sender = connections.send(item[0].email, lambda account: owner.message(payload, account),
+                                                   owner.reconnected)
+            owner.observe_send(time.perf_counter() - start, sent)
+            if email_sender is None:
+                owner.release(item)
+                campaign.stop("No quedan cuentas SMTP con cupo o utilizables.")
+                break
+            owner.record(item, sent, email_sender)
+    finally:
+        connections.close()
+
+async def async_send_worker(connections, rows, campaign):
+    """
+    Equivalente asyncio de send_worker: sesiones SMTP del event loop
+    consumiendo elementos de una asyncio.Queue compartida.
+    """
+    try:
+        while True:
+            entry = await rows.get()
+            if entry is None:
+                break
+            owner, item, payload = entry
+
+            if not owner.prepare(item):
+                continue
+            if payload is None:
+                payload = owner.render(item)
+
+            if owner.limiter:
+                await owner.limiter.acquire_async()
+
+            start = time.perf_counter()
+            sent, email_sender = await connections.send(item[0].email, lambda account: owner.message(payload, account),
+                                                         owner.reconnected)
+            owner.observe_send(time.perf_counter() - start, sent)
+            if email_sender is None:
+                owner.release(item)
+                campaign.stop("No quedan cuentas SMTP con cupo o utilizables.")
+                break
+            owner.record(item, sent, email_sender)
+    finally:
+        await connections.close()
+
+def run_sender(deliver=False):
     """
     Función principal para ejecutar el envío de correos masivos de forma eficiente,
     manejando límites de sesión SMTP y validando correos.
+
+    Con `conexiones_smtp` > 1 en config.json se abre un pool de conexiones.
+    `motor_envio` elige cómo se atienden: "smtplib" (un hilo por conexión)
+    o "asyncio" (todas las sesiones en un event loop, con PIPELINING).
+    Con `cuentas_smtp` los envíos se reparten entre varias cuentas con cuotas.
+    Con `procesos_render` > 0 los mensajes se renderizan en un pool de procesos
+    entre la lectura de la lista y las conexiones.
+    Con `deliver` los mensajes salen del spool preparado con --prepare.
     """
     try:
         config_manager = ConfigManager()
         config = config_manager.load_config()
-        smtp_settings = config_manager.get_smtp_settings()
     except FileNotFoundError as e:
         logging.error(f"Error de configuración: {e}. Ejecuta el configurador para crear el archivo.")
         return
 
-    if not all(smtp_settings.values()):
-        logging.error("Error: La configuración de SMTP no está completa. Revisa tu archivo .env.")
-        return
+    backend = open_backend(config_manager, config)
+    if backend is None: return
+    balancer, limiter, pool_size = backend
+    processes = max(0, int(config.get('procesos_render', 0)))
+    engine = config.get('motor_envio', 'smtplib')
 
-    email_sender = EmailSender(
-        smtp_settings['smtp_host'],
-        smtp_settings['smtp_port'],
-        smtp_settings['smtp_user'],
-        smtp_settings['smtp_password'],
-        smtp_settings['email_from']
-    )
+    opened = open_campaign(config_manager, config, balancer, limiter, deliver=deliver)
+    if opened is None: return
+    campaign, rows = opened
+    if campaign.spool:
+        processes = 0
+    history, history_id = start_history(config_manager, config)
+    started = time.monotonic()
+
+    try:
+        if engine == 'asyncio':
+            asyncio.run(run_async_pool(balancer, pool_size, campaign.feed(rows), campaign, processes))
+        else:
+            run_thread_pool(balancer, pool_size, campaign.feed(rows), campaign, processes)
+    finally:
+        campaign.close()
+        balancer.save()
+        if history:
+            finish_history(history, history_id, campaign, time.monotonic() - started)
+        campaign.log_summary()
+        if len(balancer.accounts) > 1 or config.get('cuentas_smtp'):
+            balancer.log_summary()
+
+def open_backend(config_manager, config):
+    """
+    Lo que comparten todas las campañas de un envío: las cuentas SMTP con su
+    reparto, el limitador de tasa y el tamaño del pool. None si la
+    configuración no es válida (el error ya se registró).
+    """
+    smtp_accounts = config_manager.get_smtp_accounts(config)
+    for account in smtp_accounts:
+        if not all(account['smtp'].values()):
+            logging.error(f"Error: La configuración de SMTP de la cuenta '{account['nombre']}' no está completa. Revisa tu archivo .env.")
+            return None
+
+    try:
+        balancer = AccountBalancer.from_config(smtp_accounts)
+    except (KeyError, TypeError, ValueError) as e:
+        logging.error(f"Error en la configuración de cuentas_smtp: {e}")
+        return None
+
+    pool_size = max(1, int(config.get('conexiones_smtp', 1)))
+    try:
+        limiter = RateLimiter.from_config(config, pool_size)
+    except (KeyError, TypeError, ValueError) as e:
+        logging.error(f"Error en la configuración de tasa_envio: {e}")
+        return None
+    return balancer, limiter, pool_size
+
+def negotiate_8bit(config, accounts_settings):
+    """
+    Decide si el HTML puede ir en 8bit (`codificacion_8bit`: "auto" por defecto,
+    true o false). En "auto" se usa lo que anunció en EHLO cada servidor SMTP en
+    su última sesión (ver email_sender.remember_extensions), sin abrir ninguna
+    conexión: si alguno no anuncia 8BITMIME, o aún no hubo sesión con él, el
+    HTML va en quoted-printable o base64, porque cualquier mensaje puede salir
+    por cualquier cuenta.
+    """
+    mode = config.get('codificacion_8bit', 'auto')
+    if mode != 'auto':
+        return bool(mode)
+    for settings in accounts_settings:
+        if not all(settings.values()):
+            return False
+        extensions = known_extensions(settings['smtp_host'], settings['smtp_port'])
+        if extensions is None:
+            logging.info(f"Aún no hay sesiones registradas con {settings['smtp_host']}: el HTML irá en quoted-printable o base64 "
+                         "(desde el próximo envío se usará lo que anuncie el servidor).")
+            return False
+        if '8bitmime' not in extensions:
+            logging.info(f"{settings['smtp_host']} no anuncia 8BITMIME: el HTML irá en quoted-printable o base64.")
+            return False
+    return True
 
+def open_campaign(config_manager, config, balancer, limiter, deliver=False, metrics_path=METRICS_FILE):
+    """
+    Abre una campaña para enviarla: lista (o spool), journal y reintentos de su
+    contador, validación previa, supresión y métricas en vivo. Devuelve
+    (CampaignRun, filas) o None si no hay nada que enviar o hubo un error (ya
+    registrado). Los archivos abiertos se cierran con `campaign.close()`.
+    """
     excel_file = config['excel_file']
     body_file = config['body_file']
-    subject = config['subject']
-    delay = config.get('delay_segundos', 1)
+    subject_template = CompiledTemplate(config['subject'])
 
-    body_template = load_body_template(body_file)
-    if body_template is None: return
+    body_template, html_bytes_saved = load_body_template(body_file, minify=config.get('minificar_html', False))
+    if body_template is None: return None
 
-    if not os.path.exists(excel_file):
-        logging.error(f'Error: No se encontró el archivo Excel en la ruta: {excel_file}')
-        return
+    spool = None
+    if deliver:
+        spool = open_spool(config, subject_template, body_template)
+        if spool is None: return None
+        total_emails_in_file = spool.manifest['filas']
+    else:
+        if not os.path.exists(excel_file):
+            logging.error(f'Error: No se encontró el archivo Excel en la ruta: {excel_file}')
+            return None
+
+        try:
+            reader = RecipientReader(excel_file)
+            total_emails_in_file = reader.count()
+        except Exception as e:
+            logging.error(f'Error al leer el archivo Excel {excel_file}: {e}')
+            return None
+        if reader.cache:
+            logging.info(f"{excel_file}: leyendo de su caché columnar ({total_emails_in_file} filas).")
+
+        missing_columns = (subject_template.placeholders | body_template.placeholders) - set(reader.columns)
+        if missing_columns:
+            logging.warning(f"Placeholders sin columna en la lista (se usará su valor por defecto): {', '.join(sorted(missing_columns))}")
+
+    journal_settings = config.get('journal', {})
+    journal = config_manager.open_journal(
+        batch_size=journal_settings.get('lote', 100),
+        flush_interval=journal_settings.get('intervalo_segundos', 1.0),
+    )
+    retry_settings = config.get('reintentos', {})
+    retries = config_manager.open_retry_queue(
+        max_attempts=retry_settings.get('max_intentos', 5),
+        base_delay=retry_settings.get('espera_base_segundos', 60),
+        max_delay=retry_settings.get('espera_max_segundos', 3600),
+    )
+    tracker = ProgressTracker(journal)
+    start_index = tracker.next_index
+
+    if start_index >= total_emails_in_file and not retries.has_pending():
+        journal.close()
+        retries.close()
+        if spool: spool.close()
+        logging.info(f'No hay más correos por enviar en {excel_file}. Todos en la lista ya han sido procesados.')
+        return None
+
+    preflight = None
+    if not spool and config.get('validacion_previa', True) and start_index < total_emails_in_file:
+        try:
+            preflight = run_preflight(reader)
+        except Exception as e:
+            journal.close()
+            retries.close()
+            logging.error(f'Error en la validación previa de {excel_file}: {e}')
+            return None
 
+    scheduler = None
+    if config.get('intercalar_dominios', True):
+        scheduler = DomainScheduler(config.get('dominios'), lookahead=config.get('ventana_dominios', DEFAULT_LOOKAHEAD))
+
+    eight_bit = False if spool else negotiate_8bit(config, [account.settings for account in balancer.accounts])
+    builder = MessageBuilder(balancer.accounts[0].settings['email_from'], subject_template, body_template,
+                             boundary=spool.manifest['boundary'] if spool else None, eight_bit=eight_bit)
+    if not spool:
+        logging.info(f"Cuerpo HTML en {builder.encoding}.")
+    campaign = CampaignRun(tracker, builder, limiter, retries, total_emails_in_file,
+                           validate=preflight is None and spool is None, scheduler=scheduler, spool=spool)
+    campaign.html_bytes_saved = html_bytes_saved
+    if spool:
+        def skip_missing(index):
+            # Filas descartadas al preparar el spool
+            if not tracker.is_done(index):
+                campaign.skip(index)
+        source = spool.recipients(start_index, on_missing=skip_missing)
+    else:
+        source = reader.rows(start_index)
+    # Filas ya confirmadas por encima del contador (workers fuera de orden) no se reenvían.
+    rows = (recipient for recipient in source if not tracker.is_done(recipient.index))
+    if preflight:
+        rows = preflight.filter(rows, on_rejected=campaign.skip)
+
+    suppression = SuppressionList(use_bloom=config.get('supresion_bloom', True))
     try:
-        df = pd.read_excel(excel_file)
-        if 'email' not in df.columns:
-            logging.error("El archivo Excel debe contener una columna llamada 'email'.")
-            return
+        if suppression.load():
+            logging.info(f"Lista de supresión cargada: {suppression.total} direcciones.")
+            rows = suppression.filter(rows, on_suppressed=campaign.suppress)
     except Exception as e:
-        logging.error(f'Error al leer el archivo Excel {excel_file}: {e}')
-        return
+        journal.close()
+        retries.close()
+        if spool: spool.close()
+        logging.error(f'Error al cargar la lista de supresión: {e}')
+        return None
+    campaign.suppression = suppression
 
-    start_index = config_manager.read_counter()
-    total_emails_in_file = len(df)
+    if start_index < total_emails_in_file:
+        logging.info(f"{excel_file}: iniciando envío desde el correo {start_index + 1} de {total_emails_in_file}.")
+    else:
+        logging.info(f"{excel_file}: la lista ya fue procesada; enviando los reintentos pendientes.")
 
-    if start_index >= total_emails_in_file:
-        logging.info('No hay más correos por enviar. Todos en la lista ya han sido procesados.')
-        return
+    metrics = LiveMetrics(excel_file, campaign.counts, metrics_path)
+    metrics.track_progress(lambda: (tracker.processed(), total_emails_in_file))
+    metrics.track_queue("reintentos", retries.pending_count)
+    campaign.metrics = metrics
+    metrics.start()
+    return campaign, rows
 
-    if not email_sender.connect():
-        return
+def start_history(config_manager, config, name=None):
+    """Registra la campaña en el historial; un fallo del historial no detiene el envío."""
+    try:
+        history = config_manager.open_history()
+        name = name or config.get('nombre_campana') or config['subject']
+        return history, history.start(name, config['body_file'], config['excel_file'])
+    except sqlite3.Error as e:
+        logging.warning(f"No se pudo registrar la campaña en el historial: {e}")
+        return None, None
 
-    emails_sent_total = 0
-    emails_in_session = 0
-    logging.info(f"Iniciando envío desde el correo {start_index + 1} de {total_emails_in_file}.")
+def finish_history(history, history_id, campaign, seconds):
+    try:
+        history.finish(history_id, campaign.counts, seconds, stopped=campaign.stopped)
+    except sqlite3.Error as e:
+        logging.warning(f"No se pudo cerrar la campaña en el historial: {e}")
+
+def run_thread_pool(balancer, pool_size, items, campaign, processes=0):
+    """
+    Reparte los elementos entre `pool_size` workers smtplib, uno por hilo.
+    Con `processes` > 0 los mensajes se renderizan antes en un pool de procesos.
+    """
+    row_queue = queue.Queue(maxsize=pool_size * QUEUE_ROWS_PER_CONNECTION)
+    workers = [
+        threading.Thread(
+            target=send_worker,
+            name=f"smtp-{number}",
+            args=(RelayConnections(balancer, EmailSender, SESSION_LIMIT), row_queue, campaign),
+            daemon=True,
+        )
+        for number in range(1, pool_size + 1)
+    ]
+    for worker in workers:
+        worker.start()
+
+    def put_row(entry):
+        # Si todas las conexiones se cerraron no queda nadie que consuma la cola.
+        while any(worker.is_alive() for worker in workers):
+            try:
+                row_queue.put(entry, timeout=1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def deliver(entry):
+        if not put_row(entry):
+            owner, item, _payload = entry
+            owner.release(item)
+            campaign.stop("No quedan conexiones SMTP activas.")
+
+    stats = campaign.stats
+    stats.configure(READ_STAGE, 1)
+    stats.configure(RENDER_STAGE, processes or pool_size)
+    stats.configure(SEND_STAGE, pool_size)
+    # Los procesos de render usan el builder de una sola campaña
+    render = RenderStage(campaign.builder, processes, lambda entry: deliver((campaign, *entry)), stats) if processes else None
+    if campaign.metrics:
+        campaign.metrics.track_queue("envio", row_queue.qsize)
+        if render:
+            campaign.metrics.track_queue("render", render.pending.qsize)
+    queues = [("envio", row_queue)] + ([("render", render.pending)] if render else [])
 
     try:
-        for index, row in df.iloc[start_index:].iterrows():
-            if emails_in_session >= SESSION_LIMIT:
-                logging.info(f"Límite de sesión alcanzado ({SESSION_LIMIT} correos). Reiniciando conexión...")
-                email_sender.disconnect()
-                time.sleep(5)
-                if not email_sender.connect():
-                    logging.error("No se pudo reconectar al servidor. Abortando el proceso.")
-                    break
-                emails_in_session = 0
+        for item in stats.timed(items):
+            if isinstance(item, float):
+                if render:
+                    render.flush()
+                time.sleep(item)
+            elif render:
+                render.put(item)
+            else:
+                deliver((*campaign.entry(item), None))
+            stats.maybe_log(queues)
+    finally:
+        if render:
+            render.close()
+    for _ in workers:
+        put_row(None)
+    for worker in workers:
+        worker.join()
+    stats.log()
 
-            to_email = row['email']
+async def run_async_pool(balancer, pool_size, items, campaign, processes=0):
+    """Mantiene `pool_size` workers con sus sesiones SMTP en un solo event loop."""
+    row_queue = asyncio.Queue(maxsize=pool_size * QUEUE_ROWS_PER_CONNECTION)
+    workers = [
+        asyncio.create_task(async_send_worker(
+            AsyncRelayConnections(balancer, AsyncEmailSender, SESSION_LIMIT), row_queue, campaign))
+        for _ in range(pool_size)
+    ]
 
-            if not is_valid_email(to_email):
-                logging.warning(f"[{index + 1}/{total_emails_in_file}] Omitiendo correo inválido o nulo en la línea {index + 2}: {to_email}")
-                config_manager.save_counter(index + 1) #Avanzo el contador para no reintentar
+    async def put_row(entry):
+        # Si todas las sesiones se cerraron no queda nadie que consuma la cola.
+        while not all(worker.done() for worker in workers):
+            try:
+                await asyncio.wait_for(row_queue.put(entry), timeout=1)
+                return True
+            except asyncio.TimeoutError:
                 continue
+        return False
+
+    async def deliver(entry):
+        if not await put_row(entry):
+            owner, item, _payload = entry
+            owner.release(item)
+            campaign.stop("No quedan conexiones SMTP activas.")
+
+    stats = campaign.stats
+    stats.configure(READ_STAGE, 1)
+    stats.configure(RENDER_STAGE, processes or pool_size)
+    stats.configure(SEND_STAGE, pool_size)
+    render = AsyncRenderStage(campaign.builder, processes, lambda entry: deliver((campaign, *entry)), stats) if processes else None
+    if campaign.metrics:
+        campaign.metrics.track_queue("envio", row_queue.qsize)
+        if render:
+            campaign.metrics.track_queue("render", render.pending.qsize)
+    queues = [("envio", row_queue)] + ([("render", render.pending)] if render else [])
+
+    try:
+        for item in stats.timed(items):
+            if isinstance(item, float):
+                if render:
+                    await render.flush()
+                await asyncio.sleep(item)
+            elif render:
+                await render.put(item)
+            else:
+                await deliver((*campaign.entry(item), None))
+            stats.maybe_log(queues)
+    finally:
+        if render:
+            await render.close()
+    for _ in workers:
+        await put_row(None)
+    await asyncio.gather(*workers)
+    stats.log()
+
+def load_campaign_templates(config):
+    """Asunto y cuerpo compilados de la campaña configurada (None si falta la plantilla)."""
+    body_template, _saved = load_body_template(config['body_file'], minify=config.get('minificar_html', False))
+    if body_template is None:
+        return None, None
+    return CompiledTemplate(config['subject']), body_template
+
+def campaign_spool_dir(config):
+    return spool_dir_for(config['excel_file'], config.get('spool_dir', SPOOL_DIR))
+
+def open_spool(config, subject_template, body_template):
+    """
+    Abre el spool completo de la campaña, comprobando que se preparó con la
+    misma lista y las mismas plantillas. Devuelve None (y lo registra) si no.
+    """
+    directory = campaign_spool_dir(config)
+    try:
+        spool = Spool(directory)
+    except (FileNotFoundError, ValueError) as e:
+        logging.error(f"{e}. Ejecuta primero sender.py --prepare.")
+        return None
+
+    prepared = spool.manifest['campana']
+    stale = []
+    if os.path.exists(config['excel_file']):
+        current = campaign_fingerprint(config['excel_file'], subject_template.source, body_template.source)
+        stale = [key for key in current if current[key] != prepared.get(key)]
+    else:
+        logging.warning(f"No se encontró {config['excel_file']}; se envía el spool sin comprobar la lista.")
+    if stale:
+        spool.close()
+        logging.error(f"El spool de {directory} no corresponde a la campaña actual ({', '.join(stale)} cambió). Vuelve a ejecutar --prepare.")
+        return None
+    logging.info(f"Spool {directory}: {spool.count} mensajes, {spool.manifest['bytes']} bytes.")
+    return spool
+
+def prepare_spool():
+    """
+    Renderiza el mensaje final de cada destinatario válido en el spool de la
+    campaña (ver spool.py), para que --deliver solo tenga que enviarlos.
+    Se puede interrumpir y volver a ejecutar: continúa donde se quedó.
+    """
+    config_manager = ConfigManager()
+    try:
+        config = config_manager.load_config()
+    except FileNotFoundError as e:
+        logging.error(f"Error de configuración: {e}. Ejecuta el configurador para crear el archivo.")
+        return False
+
+    excel_file = config['excel_file']
+    subject_template, body_template = load_campaign_templates(config)
+    if body_template is None:
+        return False
+    try:
+        reader = RecipientReader(excel_file)
+        total_emails_in_file = reader.count()
+    except Exception as e:
+        logging.error(f'Error al leer el archivo Excel {excel_file}: {e}')
+        return False
 
-            names = row.get('names', 'Amigo(a)')
-            personalized_body = body_template.replace('{{names}}', str(names))
+    directory = campaign_spool_dir(config)
+    writer = SpoolWriter(directory, campaign_fingerprint(excel_file, subject_template.source, body_template.source))
+    if writer.next_row:
+        logging.info(f"Reanudando la preparación del spool desde la fila {writer.next_row + 1} ({writer.count} mensajes ya preparados).")
+    smtp_settings = [account['smtp'] for account in config_manager.get_smtp_accounts(config)]
+    builder = MessageBuilder("", subject_template, body_template, boundary=writer.boundary,
+                             eight_bit=negotiate_8bit(config, smtp_settings))
 
-            logging.info(f"[{index + 1}/{total_emails_in_file}] Enviando a: {to_email}")
+    rejected = 0
+    def count_rejected(_index):
+        nonlocal rejected
+        rejected += 1
 
-            if email_sender.send_email(to_email, subject, personalized_body):
-                config_manager.save_counter(index + 1)
-                emails_sent_total += 1
-                emails_in_session += 1
+    def valid_rows(rows):
+        for recipient in rows:
+            if is_valid_email(recipient.email):
+                yield recipient
             else:
-                logging.error(f"Fallo al enviar a {to_email} en la línea {index + 2}. Continuando con el siguiente.")
-                config_manager.save_counter(index + 1) #Avanzo el contador para no reintentar
+                count_rejected(recipient.index)
 
-            time.sleep(delay)
+    rows = reader.rows(writer.next_row)
+    if config.get('validacion_previa', True):
+        rows = run_preflight(reader).filter(rows, on_rejected=count_rejected)
+    else:
+        rows = valid_rows(rows)
 
+    def add(entry):
+        (recipient, _attempt), payload = entry
+        if payload is None:
+            payload = builder.render(recipient.email, recipient.fields)
+        writer.add(recipient.index, recipient.email, payload)
+
+    processes = max(0, int(config.get('procesos_render', 0)))
+    stats = PipelineStats()
+    stats.configure(READ_STAGE, 1)
+    render = RenderStage(builder, processes, add, stats) if processes else None
+    try:
+        for recipient in stats.timed(rows):
+            if render:
+                render.put((recipient, 1))
+            else:
+                add(((recipient, 1), None))
+            stats.maybe_log()
+    finally:
+        if render:
+            render.close()
+        writer.close()
+
+    writer.finish(filas=total_emails_in_file)
+    manifest = writer.manifest
+    logging.info(
+        f"✅ Spool preparado en {directory}: {manifest['mensajes']} mensajes de {total_emails_in_file} filas, "
+        f"{manifest['bytes']} bytes (mín. {manifest['tamano_min']}, máx. {manifest['tamano_max']}, "
+        f"medio {manifest['tamano_medio']}). Filas descartadas: {manifest['filas'] - manifest['mensajes']}."
+    )
+    return True
+
+def verify_spool():
+    """Comprueba la integridad del spool y que siga correspondiendo a la campaña."""
+    try:
+        config = ConfigManager().load_config()
+    except FileNotFoundError as e:
+        logging.error(f"Error de configuración: {e}. Ejecuta el configurador para crear el archivo.")
+        return False
+
+    directory = campaign_spool_dir(config)
+    try:
+        spool = Spool(directory, require_complete=False)
+    except FileNotFoundError as e:
+        logging.error(str(e))
+        return False
+    try:
+        problems = spool.verify()
+        subject_template, body_template = load_campaign_templates(config)
+        if body_template is not None and os.path.exists(config['excel_file']):
+            current = campaign_fingerprint(config['excel_file'], subject_template.source, body_template.source)
+            prepared = spool.manifest['campana']
+            problems += [f"{key} cambió desde la preparación." for key in current if current[key] != prepared.get(key)]
+        stats = spool.size_stats()
     finally:
-        email_sender.disconnect()
-        logging.info(f"✅ Proceso de envío finalizado. Correos enviados en esta sesión: {emails_sent_total}.")
+        spool.close()
+
+    for problem in problems:
+        logging.error(f"Spool {directory}: {problem}")
+    if problems:
+        return False
+    logging.info(
+        f"✅ Spool {directory} correcto: {stats['mensajes']} mensajes, {stats['bytes']} bytes "
+        f"(mín. {stats['tamano_min']}, máx. {stats['tamano_max']}, medio {stats['tamano_medio']})."
+    )
+    return True
 
 if __name__ == '__main__':
-    run_sender()
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Envío masivo de correos con la campaña de config.json.")
+    mode = parser.add_mutually_exclusive_group()
+    mode.add_argument("--prepare", action="store_true", help="Renderizar todos los mensajes en el spool de la campaña, sin enviar.")
+    mode.add_argument("--deliver", action="store_true", help="Enviar los mensajes del spool preparado con --prepare.")
+    mode.add_argument("--verify", action="store_true", help="Comprobar la integridad del spool de la campaña.")
+    args = parser.parse_args()
+
+    if args.prepare:
+        sys.exit(0 if prepare_spool() else 1)
+    elif args.verify:
+        sys.exit(0 if verify_spool() else 1)
+    else:
+        run_sender(deliver=args.deliver)
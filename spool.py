@@ -0,0 +1,259 @@
+import hashlib
+import json
+import mmap
+import os
+import shutil
+import struct
+from datetime import datetime
+
+from email_sender import new_boundary
+from file_utils import atomic_write, file_fingerprint, file_hash
+from recipient_reader import Recipient
+
+SPOOL_DIR = "spool"
+SEGMENT_FILE = "mensajes.seg"
+INDEX_FILE = "mensajes.idx"
+MANIFEST_FILE = "manifest.json"
+
+# Un registro por mensaje: fila de la lista, posición en el segmento,
+# bytes del correo y bytes del mensaje (el correo va justo antes del mensaje).
+INDEX_RECORD = struct.Struct("<QQHI")
+
+# Mensajes entre escrituras a disco del segmento y el índice
+FLUSH_EVERY = 1000
+
+
+def spool_dir_for(list_path, base=SPOOL_DIR):
+    """Directorio del spool de una lista: spool/<nombre de la lista>."""
+    return os.path.join(base, os.path.splitext(os.path.basename(list_path))[0])
+
+
+def text_hash(text):
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+def campaign_fingerprint(list_path, subject, body):
+    """Lo que identifica a una campaña preparada: versión de la lista y plantillas."""
+    return {
+        "lista": os.path.abspath(list_path),
+        "huella_lista": file_fingerprint(list_path),
+        "asunto": text_hash(subject),
+        "cuerpo": text_hash(body),
+    }
+
+
+def read_manifest(directory):
+    try:
+        with open(os.path.join(directory, MANIFEST_FILE), "r", encoding="utf-8") as file:
+            return json.load(file)
+    except FileNotFoundError:
+        return None
+
+
+def write_manifest(directory, manifest):
+    with atomic_write(os.path.join(directory, MANIFEST_FILE), sync=True) as file:
+        json.dump(manifest, file, indent=4, ensure_ascii=False)
+
+
+class SpoolWriter:
+    """
+    Escribe los mensajes ya renderizados de una campaña: un segmento con todos
+    los mensajes seguidos y un índice de registros fijos (INDEX_RECORD).
+
+    Es reanudable: si existe un spool a medias de la misma campaña (misma lista
+    y plantillas según el manifest) se recorta al último registro completo y se
+    sigue desde la fila siguiente, con el mismo boundary MIME; si no, se empieza
+    de cero.
+    """
+
+    def __init__(self, directory, campaign):
+        self.directory = directory
+        self.campaign = campaign
+        manifest = read_manifest(directory)
+        if not (manifest and not manifest.get("completo") and manifest.get("campana") == campaign):
+            shutil.rmtree(directory, ignore_errors=True)
+            os.makedirs(directory)
+            manifest = {"campana": campaign, "boundary": new_boundary(), "completo": False}
+            write_manifest(directory, manifest)
+        self.manifest = manifest
+        self.boundary = manifest["boundary"]
+
+        segment_path = os.path.join(directory, SEGMENT_FILE)
+        index_path = os.path.join(directory, INDEX_FILE)
+        self.count = 0
+        self.next_row = 0
+        self.end = 0
+        if os.path.exists(index_path):
+            self.count = os.path.getsize(index_path) // INDEX_RECORD.size
+            if self.count:
+                with open(index_path, "rb") as file:
+                    file.seek((self.count - 1) * INDEX_RECORD.size)
+                    row, offset, email_size, size = INDEX_RECORD.unpack(file.read(INDEX_RECORD.size))
+                self.next_row = row + 1
+                self.end = offset + email_size + size
+        self.segment = open(segment_path, "ab")
+        self.segment.truncate(self.end)
+        self.index = open(index_path, "ab")
+        self.index.truncate(self.count * INDEX_RECORD.size)
+        self._unflushed = 0
+
+    def add(self, row, email, payload):
+        email_bytes = email.encode("utf-8")
+        self.segment.write(email_bytes)
+        self.segment.write(payload)
+        self.index.write(INDEX_RECORD.pack(row, self.end, len(email_bytes), len(payload)))
+        self.end += len(email_bytes) + len(payload)
+        self.count += 1
+        self._unflushed += 1
+        if self._unflushed >= FLUSH_EVERY:
+            self.flush()
+
+    def flush(self):
+        # El segmento va antes que el índice: un registro nunca apunta a bytes sin escribir
+        self.segment.flush()
+        os.fsync(self.segment.fileno())
+        self.index.flush()
+        os.fsync(self.index.fileno())
+        self._unflushed = 0
+
+    def finish(self, **summary):
+        """Cierra el spool y lo marca como completo en el manifest."""
+        self.close()
+        sizes = Spool(self.directory, require_complete=False)
+        try:
+            stats = sizes.size_stats()
+        finally:
+            sizes.close()
+        self.manifest.update(summary)
+        self.manifest.update(stats)
+        self.manifest["sha256"] = file_hash(os.path.join(self.directory, SEGMENT_FILE))
+        self.manifest["preparado"] = datetime.now().isoformat(timespec="seconds")
+        self.manifest["completo"] = True
+        write_manifest(self.directory, self.manifest)
+
+    def close(self):
+        if not self.segment.closed:
+            self.flush()
+            self.segment.close()
+            self.index.close()
+
+
+class Spool:
+    """
+    Lee un spool preparado: el segmento se mapea en memoria (mmap) y cada mensaje
+    se entrega como memoryview, sin copiarlo ni volver a renderizarlo.
+    """
+
+    def __init__(self, directory, require_complete=True):
+        self.directory = directory
+        self.manifest = read_manifest(directory)
+        if self.manifest is None:
+            raise FileNotFoundError(f"No hay spool preparado en {directory}")
+        if require_complete and not self.manifest.get("completo"):
+            raise ValueError(f"El spool de {directory} está a medias; vuelve a ejecutar --prepare.")
+        with open(os.path.join(directory, INDEX_FILE), "rb") as file:
+            self.index = file.read()
+        self.count = len(self.index) // INDEX_RECORD.size
+        self._file = open(os.path.join(directory, SEGMENT_FILE), "rb")
+        size = os.fstat(self._file.fileno()).st_size
+        self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ) if size else None
+        self.data = memoryview(self._map) if self._map else memoryview(b"")
+
+    def record(self, position):
+        return INDEX_RECORD.unpack_from(self.index, position * INDEX_RECORD.size)
+
+    def _find(self, row):
+        """Posición en el índice de la primera fila >= `row` (búsqueda binaria)."""
+        low, high = 0, self.count
+        while low < high:
+            middle = (low + high) // 2
+            if self.record(middle)[0] < row:
+                low = middle + 1
+            else:
+                high = middle
+        return low
+
+    def recipients(self, start=0, on_missing=None):
+        """
+        Genera los destinatarios del spool desde la fila `start`. Las filas de la
+        lista que no llegaron al spool (descartadas al prepararlo) se notifican
+        con `on_missing(fila)`.
+        """
+        expected = start
+        for position in range(self._find(start), self.count):
+            row, offset, email_size, _size = self.record(position)
+            if on_missing:
+                for missing in range(expected, row):
+                    on_missing(missing)
+            expected = row + 1
+            email = bytes(self.data[offset:offset + email_size]).decode("utf-8")
+            yield Recipient(row, email, {})
+        if on_missing:
+            for missing in range(expected, self.manifest.get("filas", expected)):
+                on_missing(missing)
+
+    def payload(self, row):
+        """Mensaje preparado de una fila (memoryview sobre el mmap), o None."""
+        position = self._find(row)
+        if position >= self.count:
+            return None
+        found, offset, email_size, size = self.record(position)
+        if found != row:
+            return None
+        start = offset + email_size
+        return self.data[start:start + size]
+
+    def size_stats(self):
+        sizes = [self.record(position)[3] for position in range(self.count)]
+        return {
+            "mensajes": self.count,
+            "bytes": sum(sizes),
+            "tamano_min": min(sizes, default=0),
+            "tamano_max": max(sizes, default=0),
+            "tamano_medio": round(sum(sizes) / len(sizes)) if sizes else 0,
+        }
+
+    def verify(self):
+        """
+        Comprueba el spool contra su manifest: registros contiguos y dentro del
+        segmento, filas en orden, número de mensajes, tamaños y sha256 del
+        segmento. Devuelve la lista de problemas encontrados (vacía si está bien).
+        """
+        problems = []
+        if len(self.index) % INDEX_RECORD.size:
+            problems.append("El índice tiene un registro incompleto al final.")
+        expected_offset = 0
+        previous_row = -1
+        for position in range(self.count):
+            row, offset, email_size, size = self.record(position)
+            if row <= previous_row:
+                problems.append(f"Registro {position}: fila {row} fuera de orden.")
+            if offset != expected_offset:
+                problems.append(f"Registro {position}: posición {offset}, se esperaba {expected_offset}.")
+            expected_offset = offset + email_size + size
+            previous_row = row
+            if len(problems) > 20:
+                problems.append("Demasiados errores; se detiene la verificación.")
+                return problems
+        if expected_offset != len(self.data):
+            problems.append(f"El segmento mide {len(self.data)} bytes y el índice cubre {expected_offset}.")
+        if self.manifest.get("completo"):
+            stats = self.size_stats()
+            for key, value in stats.items():
+                if self.manifest.get(key) != value:
+                    problems.append(f"{key}: manifest {self.manifest.get(key)}, spool {value}.")
+            if file_hash(os.path.join(self.directory, SEGMENT_FILE)) != self.manifest.get("sha256"):
+                problems.append("El sha256 del segmento no coincide con el del manifest.")
+        else:
+            problems.append("El spool está a medias (falta terminar --prepare).")
+        return problems
+
+    def close(self):
+        self.data.release()
+        if self._map:
+            try:
+                self._map.close()
+            except BufferError:
+                # Aún hay mensajes en uso; el mapa se libera cuando se sueltan
+                pass
+        self._file.close()
@@ -0,0 +1,181 @@
+import array
+import hashlib
+import json
+import logging
+import mmap
+import os
+
+from file_utils import atomic_write
+
+SUPPRESSION_DIR = os.path.join("data", "supresion")
+SOURCE_EXTENSIONS = {".txt", ".csv"}
+INDEX_FILE = ".indice"
+BLOOM_FILE = ".bloom"
+META_FILE = ".indice.json"
+
+# Archivo donde el panel añade direcciones a mano
+PANEL_SOURCE = "panel.txt"
+
+# Bits del filtro de Bloom por dirección y número de funciones hash (~1% de falsos positivos)
+BLOOM_BITS_PER_ENTRY = 10
+BLOOM_HASHES = 7
+
+
+def normalize_email(email):
+    return email.strip().lower()
+
+
+def email_hashes(email):
+    """Dos hashes de 64 bits de la dirección normalizada (el primero nunca es 0)."""
+    digest = hashlib.blake2b(email.encode("utf-8"), digest_size=16).digest()
+    return int.from_bytes(digest[:8], "little") | 1, int.from_bytes(digest[8:], "little")
+
+
+def read_source(path):
+    """Direcciones de un archivo de supresión: una por línea (o primera columna de un CSV)."""
+    with open(path, "r", encoding="utf-8-sig") as file:
+        for line in file:
+            email = normalize_email(line.split(",", 1)[0].split(";", 1)[0])
+            if "@" in email:
+                yield email
+
+
+def add_addresses(emails, directory=SUPPRESSION_DIR):
+    """Añade direcciones al archivo del panel. Devuelve cuántas se añadieron."""
+    emails = [normalize_email(email) for email in emails if "@" in email]
+    if not emails:
+        return 0
+    os.makedirs(directory, exist_ok=True)
+    with open(os.path.join(directory, PANEL_SOURCE), "a", encoding="utf-8") as file:
+        file.write("".join(f"{email}\n" for email in emails))
+    return len(emails)
+
+
+class SuppressionList:
+    """
+    Lista de supresión (bajas, quejas, rebotes duros) con comprobación O(1).
+
+    Las direcciones se leen de los .txt/.csv de `data/supresion/` y se guardan como
+    hashes de 64 bits en una tabla hash de direccionamiento abierto en disco, que se
+    consulta con mmap sin cargarla en memoria. Delante va un filtro de Bloom en
+    memoria que descarta al instante la gran mayoría de direcciones no suprimidas.
+    El índice se reconstruye solo cuando cambian los archivos fuente.
+    """
+
+    def __init__(self, directory=SUPPRESSION_DIR, use_bloom=True):
+        self.directory = directory
+        self.use_bloom = use_bloom
+        self.total = 0
+        self._slots = None
+        self._bloom = None
+        self._mmap = None
+        self._file = None
+
+    def sources(self):
+        if not os.path.isdir(self.directory):
+            return []
+        sources = [
+            entry for entry in os.scandir(self.directory)
+            if entry.is_file() and os.path.splitext(entry.name)[1].lower() in SOURCE_EXTENSIONS
+        ]
+        return sorted(sources, key=lambda entry: entry.name)
+
+    def _signature(self, sources):
+        stats = [(entry.name, entry.stat().st_size, entry.stat().st_mtime_ns) for entry in sources]
+        return hashlib.sha256(json.dumps(stats).encode("utf-8")).hexdigest()
+
+    def _path(self, name):
+        return os.path.join(self.directory, name)
+
+    def read_meta(self):
+        try:
+            with open(self._path(META_FILE), "r", encoding="utf-8") as file:
+                return json.load(file)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return {}
+
+    def _build(self, sources, signature):
+        hashes = set()
+        for entry in sources:
+            hashes.update(email_hashes(email) for email in read_source(entry.path))
+
+        size = 1024
+        while size < len(hashes) * 2:
+            size *= 2
+        slots = array.array("Q", bytes(8 * size))
+        bloom_bits = max(64, len(hashes) * BLOOM_BITS_PER_ENTRY)
+        bloom = bytearray((bloom_bits + 7) // 8)
+        mask = size - 1
+        for key, second in hashes:
+            slot = key & mask
+            while slots[slot]:
+                slot = (slot + 1) & mask
+            slots[slot] = key
+            for i in range(BLOOM_HASHES):
+                bit = (key + i * second) % bloom_bits
+                bloom[bit >> 3] |= 1 << (bit & 7)
+
+        for name, data in ((INDEX_FILE, slots.tobytes()), (BLOOM_FILE, bytes(bloom))):
+            with atomic_write(self._path(name), "wb") as file:
+                file.write(data)
+        meta = {"firma": signature, "total": len(hashes), "slots": size, "bloom_bits": bloom_bits}
+        with open(self._path(META_FILE), "w", encoding="utf-8") as file:
+            json.dump(meta, file)
+        logging.info(f"Índice de supresión reconstruido: {len(hashes)} direcciones.")
+        return meta
+
+    def load(self):
+        """Abre el índice (reconstruyéndolo si cambiaron las fuentes). Devuelve False si no hay lista."""
+        sources = self.sources()
+        if not sources:
+            return False
+        signature = self._signature(sources)
+        meta = self.read_meta()
+        if meta.get("firma") != signature or not os.path.exists(self._path(INDEX_FILE)):
+            meta = self._build(sources, signature)
+
+        self.total = meta["total"]
+        self._file = open(self._path(INDEX_FILE), "rb")
+        self._mmap = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        self._slots = memoryview(self._mmap).cast("Q")
+        self._mask = meta["slots"] - 1
+        if self.use_bloom:
+            with open(self._path(BLOOM_FILE), "rb") as file:
+                self._bloom = file.read()
+            self._bloom_bits = meta["bloom_bits"]
+        return True
+
+    def __contains__(self, email):
+        if self._slots is None or not isinstance(email, str):
+            return False
+        key, second = email_hashes(normalize_email(email))
+        if self._bloom is not None:
+            bloom, bits = self._bloom, self._bloom_bits
+            for i in range(BLOOM_HASHES):
+                bit = (key + i * second) % bits
+                if not bloom[bit >> 3] & (1 << (bit & 7)):
+                    return False
+        slots, mask = self._slots, self._mask
+        slot = key & mask
+        while True:
+            value = slots[slot]
+            if value == key:
+                return True
+            if not value:
+                return False
+            slot = (slot + 1) & mask
+
+    def filter(self, rows, on_suppressed):
+        """Deja pasar los destinatarios no suprimidos; `on_suppressed(index)` por cada uno omitido."""
+        for recipient in rows:
+            if recipient.email in self:
+                on_suppressed(recipient.index)
+            else:
+                yield recipient
+
+    def close(self):
+        if self._slots is not None:
+            self._slots.release()
+            self._mmap.close()
+            self._file.close()
+            self._slots = None
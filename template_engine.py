@@ -0,0 +1,62 @@
+import re
+
+# {{columna}} o {{columna|valor por defecto}}
+PLACEHOLDER_PATTERN = re.compile(r"\{\{\s*([^{}|]+?)\s*(?:\|([^{}]*))?\}\}")
+
+# Valores por defecto cuando la fila no trae la columna y el placeholder no define uno
+DEFAULT_VALUES = {
+    "names": "Amigo(a)",
+}
+
+
+def format_value(value):
+    """Convierte un valor de la lista a texto (12.0 -> '12')."""
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return str(value)
+
+
+class CompiledTemplate:
+    """
+    Plantilla analizada una sola vez: una lista de segmentos fijos con huecos para
+    los placeholders. Cualquier columna de la lista puede usarse como `{{columna}}`;
+    renderizar una fila es rellenar los huecos y hacer un único join.
+    """
+
+    def __init__(self, text, defaults=None):
+        self.source = text
+        defaults = {**DEFAULT_VALUES, **(defaults or {})}
+        self._pieces = []
+        self._slots = []
+
+        position = 0
+        for match in PLACEHOLDER_PATTERN.finditer(text):
+            if match.start() > position:
+                self._pieces.append(text[position:match.start()])
+            name, default = match.group(1), match.group(2)
+            if default is None:
+                default = defaults.get(name, "")
+            self._slots.append((len(self._pieces), name, default.strip()))
+            self._pieces.append(None)
+            position = match.end()
+        if position < len(text):
+            self._pieces.append(text[position:])
+
+    @property
+    def placeholders(self):
+        """Nombres de columna usados en la plantilla."""
+        return {name for _position, name, _default in self._slots}
+
+    @property
+    def is_static(self):
+        return not self._slots
+
+    def render(self, fields):
+        """Devuelve la plantilla con los valores de `fields` (dict columna -> valor)."""
+        if not self._slots:
+            return self.source
+        pieces = self._pieces.copy()
+        for position, name, default in self._slots:
+            value = fields.get(name)
+            pieces[position] = default if value is None or value == "" else format_value(value)
+        return "".join(pieces)
@@ -0,0 +1,69 @@
+import os
+import sys
+import unittest
+from html.parser import HTMLParser
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_DIR)
+
+from html_minifier import minify_html  # noqa: E402
+from template_engine import CompiledTemplate  # noqa: E402
+
+
+class VisibleText(HTMLParser):
+    """Texto que ve un cliente que no es Outlook: lo de los comentarios no cuenta."""
+
+    def __init__(self):
+        super().__init__()
+        self.words = []
+        self._skip = 0
+
+    def handle_starttag(self, tag, attrs):
+        if tag in ("style", "title"):
+            self._skip += 1
+
+    def handle_endtag(self, tag):
+        if tag in ("style", "title"):
+            self._skip -= 1
+
+    def handle_data(self, data):
+        if not self._skip:
+            self.words.extend(data.split())
+
+
+def visible_words(html):
+    parser = VisibleText()
+    parser.feed(html)
+    parser.close()
+    return parser.words
+
+
+class MinifyHtmlTest(unittest.TestCase):
+    def setUp(self):
+        with open(os.path.join(REPO_DIR, "templates", "agustin2.html"), "r", encoding="utf-8") as file:
+            self.template = file.read()
+        self.minified = minify_html(self.template)
+
+    def test_keeps_visible_text(self):
+        self.assertEqual(visible_words(self.minified), visible_words(self.template))
+        self.assertIn("WhatsApp", " ".join(visible_words(self.minified)))
+
+    def test_keeps_downlevel_revealed_conditional(self):
+        self.assertIn("<!--[if !mso]><!-- -->", self.minified)
+        self.assertIn("<!--<![endif]-->", self.minified)
+        self.assertEqual(self.minified.count("<!--[if mso]>"), self.template.count("<!--[if mso]>"))
+
+    def test_removes_plain_comments(self):
+        self.assertNotIn("<!-- Preheader (oculto) -->", self.minified)
+        self.assertLess(len(self.minified), len(self.template))
+
+    def test_keeps_placeholders(self):
+        self.assertEqual(CompiledTemplate(self.minified).placeholders, CompiledTemplate(self.template).placeholders)
+
+    def test_other_conditional_forms(self):
+        html = "<p>a</p>\n  <!-- nota --> <!--[if !mso]><!--> <b>x</b> <!--<![endif]--> <!-->"
+        self.assertEqual(minify_html(html), "<p>a</p>\n<!--[if !mso]><!--> <b>x</b> <!--<![endif]--> <!-->")
+
+
+if __name__ == "__main__":
+    unittest.main()